@@ -0,0 +1,958 @@
+import argparse
+import glob
+import heapq
+import itertools
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tkinter as tk
+from datetime import date, timedelta
+from itertools import islice
+from statistics import mean, median
+
+# results of the current run, name -> {'value', 'unit', 'better', ...}, written out by --json
+results = {}
+
+# the app's own files (photos, main.py), found from here whatever the working directory
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(func, repeat, setup=None):
+    """
+    Runs a function several times, returning the duration of each run
+    :param func: function to be measured
+    :param repeat: number of runs
+    :param setup: (optional) untimed function called before each run
+    :return: list of durations in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(name, times):
+    """
+    Prints the durations of a benchmark and keeps their median for the JSON results
+    :param name: benchmark name, unique across the suite (it is the key compared against a baseline)
+    :param times: durations in seconds
+    """
+    print(f'{name:<40} mean {mean(times) * 1000:9.3f} ms   median {median(times) * 1000:9.3f} ms   '
+          f'max {max(times) * 1000:9.3f} ms')
+    results[name] = {'value': median(times) * 1000, 'unit': 'ms', 'better': 'lower',
+                     'mean': mean(times) * 1000, 'max': max(times) * 1000, 'runs': len(times)}
+
+
+def report_value(name, value, unit, better='lower'):
+    """
+    Prints a measurement that isn't a duration (ex. a rate or a size) and keeps it for the JSON results
+    :param name: benchmark name, unique across the suite
+    :param unit: unit of the value
+    :param better: 'lower' or 'higher', the direction in which the value improves
+    """
+    print(f'{name:<40} {value:15,.3f} {unit}')
+    results[name] = {'value': value, 'unit': unit, 'better': better}
+
+
+def app_files(tmp):
+    """
+    Returns MainApp arguments pointing it at the repository's photos, and at a checkpoint and histories of its own
+    :param tmp: temporary directory for the app's files
+    """
+    from main import PHOTO_DIR
+    return {'checkpoint_file': os.path.join(tmp, 'checkpoint.json'), 'photo_dir': os.path.join(APP_DIR, PHOTO_DIR),
+            'history_dir': tmp}
+
+
+def close_app(app):
+    """
+    Tears a MainApp down without its closing dialog, before its temporary directory is removed
+    :param app: the app to close
+    """
+    if app.preload_id is not None:
+        app.root.after_cancel(app.preload_id)
+    for history in (app.stopwatch_history, app.pomodoro_history):
+        if history is not None:
+            history.close_storage()
+    # drops the pending checkpoint write with the checkpoint
+    app.checkpoint.remove()
+    app.photo_loader.shutdown()
+    app.root.destroy()
+
+
+def bench_timer_start(repeat=20):
+    """
+    Measures Timer.start with a cold photo cache (photo decoded in the background) and a warm one
+    """
+    from main import MainApp
+
+    # the app checkpoints the timers it starts: not over the real checkpoint
+    tmp = tempfile.TemporaryDirectory()
+    root = tk.Tk()
+    root.withdraw()
+    app = MainApp(root, **app_files(tmp.name))
+    watch = app.stopwatch
+
+    def cold_setup():
+        watch.pause()
+        app.photo_cache.clear()
+        watch.next_photos.clear()
+
+    def warm_setup():
+        watch.pause()
+        for cat in app.photo_categories:
+            for path in app.photos[cat]:
+                app.photo_loader.request(path)
+        # let the main loop drain the decoded photos
+        while app.photo_loader.pending:
+            root.update()
+
+    report('Timer.start (cold photo cache)', measure(watch.start, repeat, cold_setup))
+    report('Timer.start (warm photo cache)', measure(watch.start, repeat, warm_setup))
+    watch.pause()
+    close_app(app)
+    tmp.cleanup()
+
+
+class VirtualLoop:
+    def __init__(self, lateness=None):
+        """
+        Stands in for a Tk event loop: after() callbacks run in simulated time, back to back
+        :param lateness: (optional) function returning how late each callback runs, in seconds (as on a busy loop)
+        """
+        self.lateness = lateness
+        self.now = 0.0
+        self.queue = []
+        self.ids = itertools.count()
+        self.cancelled = set()
+
+    def clock(self):
+        return self.now
+
+    def after(self, ms, func):
+        after_id = next(self.ids)
+        due = self.now + ms / 1000
+        if self.lateness is not None:
+            due += self.lateness()
+        heapq.heappush(self.queue, (due, after_id, func))
+        return after_id
+
+    def after_cancel(self, after_id):
+        self.cancelled.add(after_id)
+
+    def run(self, seconds):
+        """
+        Runs the callbacks due within the given simulated time
+        :return: number of callbacks run
+        """
+        end = self.now + seconds
+        calls = 0
+        while self.queue and self.queue[0][0] <= end:
+            self.now, after_id, func = heapq.heappop(self.queue)
+            if after_id in self.cancelled:
+                self.cancelled.discard(after_id)
+                continue
+            func()
+            calls += 1
+        self.now = end
+        return calls
+
+
+def bench_hidden_timers(seconds=3600):
+    """
+    Measures the CPU time spent by the stopwatch and the pomodoro both running for an hour,
+    shown (the cost of the old behaviour, which redrew both every second) and hidden (window minimized)
+    The scheduler runs on a simulated clock, so the hour takes as long as its callbacks
+    """
+    from main import MainApp
+
+    tmp = tempfile.TemporaryDirectory()
+    root = tk.Tk()
+    root.withdraw()
+    app = MainApp(root, **app_files(tmp.name))
+    timers = [app.stopwatch, app.get_pomodoro()]
+
+    for visible in (True, False):
+        loop = VirtualLoop()
+        app.scheduler.root = loop
+        for timer in timers:
+            timer.pause()
+            timer.core.clock = loop.clock
+            # long enough for the countdown not to run out (and open its dialog) during the run
+            timer.core.focus_seconds = 2 * seconds
+            timer.core.reset()
+            timer.visible = visible
+            timer.start()
+
+        started = time.process_time()
+        wakeups = loop.run(seconds)
+        elapsed = time.process_time() - started
+        kind = 'shown' if visible else 'hidden'
+        report_value(f'{kind} timers: wakeups ({seconds} s)', wakeups, 'wakeups')
+        report_value(f'{kind} timers: CPU ({seconds} s)', elapsed * 1000, 'ms')
+
+    for timer in timers:
+        timer.pause()
+    close_app(app)
+    tmp.cleanup()
+
+
+class HeadlessTimer:
+    def __init__(self, core, visible=True):
+        """
+        Stands in for the Tk view of a timer: ticks its core and formats its label like Timer does, without widgets
+        :param core: TimerCore to be driven
+        :param visible: whether the timer is shown (hidden timers only wake for deadlines)
+        """
+        self.core = core
+        self.visible = visible
+        self.shown_label = None
+
+    def tick_delay(self):
+        if self.visible:
+            return self.core.tick_delay()
+        return self.core.idle_delay()
+
+    def tick(self):
+        if self.core.running:
+            self.core.tick()
+            if self.visible:
+                self.shown_label = self.core.get_label()
+
+
+def bench_tick_loop(counts=(2, 100), seconds=3600, repeat=3):
+    """
+    Measures the overhead of the tick loop (TickScheduler wakeups, core ticks and label formatting)
+    with headless timers on a simulated clock, so it runs without Tk or a display
+    """
+    from scheduler import TickScheduler
+    from timer_core import PomodoroCore, StopWatchCore
+
+    for count in counts:
+        loop = VirtualLoop()
+        scheduler = TickScheduler(loop)
+        # countdowns long enough not to run out during the runs
+        cores = [StopWatchCore(loop.clock) if i % 2 == 0
+                 else PomodoroCore(focus_seconds=2 * repeat * seconds, clock=loop.clock) for i in range(count)]
+        for core in cores:
+            core.start()
+            scheduler.register(HeadlessTimer(core))
+
+        wakeups = []
+        times = measure(lambda: wakeups.append(loop.run(seconds)), repeat)
+        report(f'tick loop: {count} timers x {seconds} s', times)
+        report_value(f'tick loop: {count} timers, per wakeup', min(times) / wakeups[0] * 10 ** 6, 'us')
+
+
+def bench_app_construction(repeat=10):
+    """
+    Measures building the main window (MainApp), up to its first layout pass
+    """
+    from main import MainApp
+
+    # every app reads and writes its files in a directory of the run, not in the repository
+    tmp = tempfile.TemporaryDirectory()
+    roots = []
+    apps = []
+
+    def setup():
+        root = tk.Tk()
+        root.withdraw()
+        roots.append(root)
+
+    def build():
+        apps.append(MainApp(roots[-1], **app_files(tmp.name)))
+        roots[-1].update_idletasks()
+
+    report('MainApp construction', measure(build, repeat, setup))
+    for app in apps:
+        close_app(app)
+    tmp.cleanup()
+
+
+def bench_photos(repeat=5):
+    """
+    Measures decoding and resizing each photo in super_secret_pictures, as the photo loader's workers do
+    (turning the result into a Tk image is part of the Timer.start benchmark, which needs a display)
+    """
+    from photo_cache import PHOTO_SIZE, PhotoCache, PhotoLoader
+
+    loader = PhotoLoader(VirtualLoop(), PhotoCache(), max_workers=1)
+
+    for path in sorted(glob.glob(os.path.join(APP_DIR, 'super_secret_pictures', '*.*'))):
+        def decode():
+            loader._decode((path, PHOTO_SIZE))
+            loader.results.get_nowait()
+
+        report(f'photo: {os.path.basename(path)}', measure(decode, repeat))
+
+    loader.shutdown()
+
+
+def write_stopwatch_file(filename, count):
+    """
+    Writes a history file in the stopwatch format, with unique generated records
+    :param filename: file to be written
+    :param count: number of records
+    """
+    categories = ['Work', 'Study', 'Exercise', 'Other']
+    first_day = date(2012, 1, 1)
+
+    with open(filename, 'w') as f:
+        for i in range(count):
+            day = (first_day + timedelta(days=i // 1000)).strftime("%d/%m/%Y")
+            seconds = 60 + i % 1000
+            length = f'{seconds // 3600:02}:{seconds // 60 % 60:02}:{seconds % 60:02}'
+            f.write(f'{day} | {length} | task{i % 7}\t{categories[i % 4]}\n')
+
+
+def bench_history_ops(sizes=(10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6), lookups=1000):
+    """
+    Measures the history tab's load_records, save_records, is_duplicate and delete_record
+    on generated stopwatch files of increasing size
+    """
+    from history import StopWatchHistory
+
+    root = tk.Tk()
+    root.withdraw()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in sizes:
+            filename = os.path.join(tmp, f'import_{count}.txt')
+            write_stopwatch_file(filename, count)
+
+            frame = tk.Frame(root)
+            hist = StopWatchHistory(frame, {}, init_file=os.path.join(tmp, f'history_{count}.txt'))
+
+            def load():
+                hist.load_records(filename)
+                # the import runs in steps on the event loop
+                while hist.importer is not None:
+                    root.update()
+
+            def save():
+                hist.save_records(show_error=False, filename=os.path.join(tmp, 'saved.txt'))
+
+            report(f'load_records ({count} records)', measure(load, 1))
+            report(f'save_records ({count} records)', measure(save, 3))
+
+            sample = list(islice(hist.model.storage.records(), lookups))
+            present = [record for _, record in sample]
+            absent = [record.replace_label('absent') for record in present]
+            # each run checks the whole sample
+            report(f'is_duplicate, found ({count} records)',
+                   measure(lambda: [hist.model.is_duplicate(record) for record in present], 5))
+            report(f'is_duplicate, missing ({count} records)',
+                   measure(lambda: [hist.model.is_duplicate(record) for record in absent], 5))
+
+            # one run per deleted record, each redrawing the tree node it was shown in
+            ids = iter([rid for rid, _ in sample])
+            report(f'delete_record ({count} records)', measure(lambda: hist.delete_record(next(ids)), len(sample)))
+
+            hist.close_storage()
+            frame.destroy()
+
+    root.destroy()
+
+
+def bench_parse_rate(count=10 ** 6):
+    """
+    Measures how many stopwatch history lines per second the streaming parser turns into records
+    """
+    from record_formats import STOPWATCH_FORMAT, parse_lines
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'history.txt')
+        write_stopwatch_file(filename, count)
+
+        def parse():
+            with open(filename) as f:
+                for _ in parse_lines(f, STOPWATCH_FORMAT):
+                    pass
+
+        times = measure(parse, 3)
+        report(f'parse_lines ({count} lines)', times)
+        report_value('parse rate', count / min(times), 'lines/s', 'higher')
+
+
+def bench_scan(count=10 ** 6):
+    """
+    Compares the memory-mapped byte scanner with the line-by-line text parser, for records and for totals
+    """
+    from collections import Counter
+    from record_formats import STOPWATCH_FORMAT, LineScanner, map_file, parse_lines, scan_file
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'history.txt')
+        write_stopwatch_file(filename, count)
+
+        def parse():
+            with open(filename) as f:
+                for _ in parse_lines(f, STOPWATCH_FORMAT):
+                    pass
+
+        def scan():
+            for _ in scan_file(filename, STOPWATCH_FORMAT):
+                pass
+
+        def parse_totals():
+            totals = Counter()
+            with open(filename) as f:
+                for record in parse_lines(f, STOPWATCH_FORMAT):
+                    totals[record.category] += record.seconds
+            return totals
+
+        def scan_totals():
+            # fields only, no record objects
+            totals = Counter()
+            with open(filename, 'rb') as f:
+                buf = map_file(f)
+                for _, seconds, _, category, _ in LineScanner(buf, STOPWATCH_FORMAT).fields():
+                    totals[category] += seconds
+                buf.close()
+            return totals
+
+        assert parse_totals() == scan_totals()
+        report(f'records: for line in f ({count} lines)', measure(parse, 3))
+        report(f'records: mmap scanner ({count} lines)', measure(scan, 3))
+        report(f'totals: for line in f ({count} lines)', measure(parse_totals, 3))
+        report(f'totals: mmap scanner ({count} lines)', measure(scan_totals, 3))
+
+
+def bench_sync(count=10 ** 5, appended=100, repeat=20):
+    """
+    Measures how another instance of the app takes in records appended to a shared history:
+    a check finding nothing new, a sync reading the appended entries, and a full reload for comparison
+    """
+    from record_formats import STOPWATCH_FORMAT
+    from records import Record
+    from storage import TextStorage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'history.txt')
+        write_stopwatch_file(filename, count)
+        writer = TextStorage(filename, STOPWATCH_FORMAT)
+        writer.load()
+        reader = TextStorage(filename, STOPWATCH_FORMAT)
+        reader.load()
+        labels = itertools.count()
+
+        def append():
+            for _ in range(appended):
+                writer.add(Record(date(2030, 1, 1).toordinal(), 60, f'sync{next(labels)}', 'Work'))
+            writer.flush()
+
+        report('sync (nothing new)', measure(reader.sync, repeat))
+        report(f'sync ({appended} appended records)', measure(reader.sync, repeat, append))
+        reloaded = []
+
+        def reload():
+            reloaded.append(TextStorage(filename, STOPWATCH_FORMAT))
+            reloaded[-1].load()
+
+        report(f'full reload ({count} records)', measure(reload, 3))
+        for storage in [writer, reader] + reloaded:
+            storage.journal.wait()
+
+
+def bench_storage_backends(count=10 ** 5, lookups=10 ** 4):
+    """
+    Runs the same load, duplicate-check and delete workload against the text and SQLite storage backends
+    """
+    from record_formats import STOPWATCH_FORMAT
+    from storage import SqliteStorage, TextStorage, migrate
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'history.txt')
+        db_file = os.path.join(tmp, 'history.sqlite3')
+        write_stopwatch_file(filename, count)
+        migrate(filename, db_file, STOPWATCH_FORMAT)
+
+        backends = {
+            'text': lambda: TextStorage(filename, STOPWATCH_FORMAT),
+            'sqlite': lambda: SqliteStorage(db_file, STOPWATCH_FORMAT),
+        }
+
+        for name, open_backend in backends.items():
+            storage = open_backend()
+            report(f'{name}: load ({count} records)', measure(storage.load, 1))
+
+            sample = [item for _, item in zip(range(lookups), storage.records())]
+
+            def check_duplicates():
+                for _, record in sample:
+                    storage.contains(record)
+
+            def delete_records():
+                for rid, _ in sample:
+                    storage.delete(rid)
+                storage.flush()
+
+            report(f'{name}: is_duplicate x{lookups}', measure(check_duplicates, 1))
+            report(f'{name}: delete x{lookups}', measure(delete_records, 1))
+            storage.close()
+
+
+def bench_segments(years=(1, 3, 10), per_day=100):
+    """
+    Measures opening a history (records, then stats) as years pile up, from one text file and from monthly segments
+    """
+    from history_core import HistoryModel
+    from record_formats import STOPWATCH_FORMAT
+    from records import Record
+
+    categories = ['Work', 'Study', 'Exercise', 'Other']
+    today = date.today().toordinal()
+    backend = os.environ.get('STOPWATCH_STORAGE')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in years:
+            filename = os.path.join(tmp, f'history_{count}.txt')
+            with open(filename, 'w') as f:
+                for i in range(count * 365 * per_day):
+                    day = today - count * 365 + i // per_day
+                    f.write(STOPWATCH_FORMAT.format_line(Record(day, 60 + i % 1000, f'task{i % 7}', categories[i % 4])))
+
+            for kind in ('text', 'segments'):
+                os.environ['STOPWATCH_STORAGE'] = kind
+                # the first segmented open splits the file, only later opens are measured
+                HistoryModel(STOPWATCH_FORMAT, filename).load()
+                times = measure(lambda: HistoryModel(STOPWATCH_FORMAT, filename).load(), 3)
+                report(f'open {kind} ({count} years, {count * 365 * per_day} records)', times)
+
+    if backend is None:
+        del os.environ['STOPWATCH_STORAGE']
+    else:
+        os.environ['STOPWATCH_STORAGE'] = backend
+
+
+def bench_import_stall(count=10 ** 6, heartbeat_ms=10):
+    """
+    Imports a large file through the Load path, measuring the worst UI stall while it runs
+    A heartbeat callback stands in for the timers: its lateness is how long the event loop was blocked
+    """
+    from history import StopWatchHistory
+
+    root = tk.Tk()
+    root.withdraw()
+    lateness = []
+
+    def heartbeat(expected):
+        now = time.perf_counter()
+        lateness.append(now - expected)
+        root.after(heartbeat_ms, heartbeat, now + heartbeat_ms / 1000)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'import.txt')
+        write_stopwatch_file(filename, count)
+
+        hist = StopWatchHistory(tk.Frame(root), {}, init_file=os.path.join(tmp, 'history.txt'))
+        hist.load_records(filename)
+        root.after(heartbeat_ms, heartbeat, time.perf_counter() + heartbeat_ms / 1000)
+        while hist.importer is not None:
+            root.update()
+
+        hist.close_storage()
+
+    report_value(f'import {count} records', hist.last_import['seconds'], 's')
+    report_value(f'import {count} records: longest step', hist.last_import['worst_stall'] * 1000, 'ms')
+    report_value(f'import {count} records: worst lateness', max(lateness) * 1000, 'ms')
+    root.destroy()
+
+
+def bench_history_open(count=5 * 10 ** 5, heartbeat_ms=10):
+    """
+    Opens a large history tab, measuring how long its construction blocks, when the first page is shown
+    and when the stats are ready, and the worst UI stall while its file is read in steps
+    """
+    from history import StopWatchHistory
+
+    root = tk.Tk()
+    root.withdraw()
+    lateness = []
+
+    def heartbeat(expected):
+        now = time.perf_counter()
+        lateness.append(now - expected)
+        root.after(heartbeat_ms, heartbeat, now + heartbeat_ms / 1000)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'history.txt')
+        write_stopwatch_file(filename, count)
+
+        started = time.perf_counter()
+        hist = StopWatchHistory(tk.Frame(root), {}, init_file=filename)
+        built = time.perf_counter()
+        root.after(heartbeat_ms, heartbeat, built + heartbeat_ms / 1000)
+        while not hist.hist_gui.get_children(''):
+            root.update()
+        first_page = time.perf_counter()
+        while hist.loading:
+            root.update()
+        loaded = time.perf_counter()
+
+        hist.close_storage()
+
+    report_value(f'open {count} records: construction', (built - started) * 1000, 'ms')
+    report_value(f'open {count} records: first page', first_page - started, 's')
+    report_value(f'open {count} records: stats ready', loaded - started, 's')
+    report_value(f'open {count} records: worst lateness', max(lateness, default=0) * 1000, 'ms')
+    root.destroy()
+
+
+def bench_search(count=10 ** 6):
+    """
+    Measures building the filter indexes, then filtering with broad and selective conditions
+    """
+    from record_formats import STOPWATCH_FORMAT
+    from search_index import SearchFilter, SearchIndex
+    from storage import TextStorage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'history.txt')
+        write_stopwatch_file(filename, count)
+        storage = TextStorage(filename, STOPWATCH_FORMAT)
+        storage.load()
+
+        index = None
+
+        def build():
+            nonlocal index
+            index = SearchIndex(storage.records())
+
+        report(f'search: index {count} records', measure(build, 1))
+
+        first_day = date(2012, 6, 1).toordinal()
+        filters = {
+            'label "task"': SearchFilter('task'),
+            'label "task3", category': SearchFilter('task3', 'Work'),
+            'date range (3 days)': SearchFilter(first_day=first_day, last_day=first_day + 2),
+            'label "task3", date range (1 day)': SearchFilter('task3', first_day=first_day, last_day=first_day),
+        }
+        for name, search_filter in filters.items():
+            # the first page, as the history tab shows it
+            report(f'search: {name}', measure(lambda: list(islice(index.matches(search_filter), 101)), 5))
+
+
+def bench_laps(laps=10 ** 4, records=10 ** 4, laps_per_record=1000):
+    """
+    Measures lap capture, the size of the lap buffer and of its encoded form,
+    and scanning a history whose records each hold many laps against one without laps
+    """
+    from record_formats import STOPWATCH_FORMAT, LineScanner
+    from records import Record, encode_laps
+    from timer_core import StopWatchCore
+
+    now = [0.0]
+    core = StopWatchCore(clock=lambda: now[0])
+    core.start()
+
+    def capture():
+        for _ in range(laps):
+            now[0] += 1.5
+            core.lap()
+
+    report(f'lap x{laps}', measure(capture, 1))
+    report_value(f'{laps} laps: in memory', core.laps.splits.buffer_info()[1] * core.laps.splits.itemsize, 'bytes')
+    report_value(f'{laps} laps: encoded', len(encode_laps(core.laps.splits)), 'bytes')
+
+    splits = encode_laps([i * 1.5 for i in range(1, laps_per_record + 1)])
+    day = date(2020, 1, 1).toordinal()
+    plain = ''.join(STOPWATCH_FORMAT.format_line(Record(day + i % 1000, 60, f'l{i}', 'Work'))
+                    for i in range(records)).encode()
+    with_laps = ''.join(STOPWATCH_FORMAT.format_line(Record(day + i % 1000, 60, f'l{i}', 'Work', splits))
+                        for i in range(records)).encode()
+
+    report(f'scan ({records} records, no laps)',
+           measure(lambda: list(LineScanner(plain, STOPWATCH_FORMAT).records()), 5))
+    report(f'scan ({records} records, {laps_per_record} laps each)',
+           measure(lambda: list(LineScanner(with_laps, STOPWATCH_FORMAT).records()), 5))
+
+
+def bench_checkpoint(repeat=20, laps=1000):
+    """
+    Measures writing the timer checkpoint (once per state change, never per tick) and restoring from it
+    """
+    from checkpoint import Checkpoint
+    from timer_core import StopWatchCore, PomodoroCore
+
+    stopwatch = StopWatchCore()
+    stopwatch.start()
+    for _ in range(laps):
+        stopwatch.lap()
+    pomodoro = PomodoroCore()
+    pomodoro.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = Checkpoint(VirtualLoop(), os.path.join(tmp, 'checkpoint.json'))
+        checkpoint.add('stopwatch', stopwatch.snapshot)
+        checkpoint.add('pomodoro', pomodoro.snapshot)
+
+        def restore():
+            states = checkpoint.read()
+            StopWatchCore().restore(states['stopwatch'])
+            PomodoroCore().restore(states['pomodoro'])
+
+        report(f'checkpoint write ({laps} laps)', measure(checkpoint.write, repeat))
+        report(f'checkpoint restore ({laps} laps)', measure(restore, repeat))
+
+
+def bench_headless_core(timers=1000, seconds=3600, records=10 ** 5):
+    """
+    Drives simulated timers and history operations through the cores alone, without Tk or a display
+    """
+    from history_core import HistoryModel
+    from record_formats import STOPWATCH_FORMAT
+    from records import Record
+    from timer_core import PomodoroCore, StopWatchCore
+
+    now = 0.0
+
+    def clock():
+        return now
+
+    cores = [StopWatchCore(clock) if i % 2 else PomodoroCore(clock=clock) for i in range(timers)]
+
+    def run_timers():
+        nonlocal now
+        for core in cores:
+            core.reset()
+            core.start()
+
+        for _ in range(seconds):
+            # one shared wakeup per second, like TickScheduler
+            now += cores[0].tick_delay()
+            for core in cores:
+                if core.tick():
+                    core.finish_period()
+                    core.start()
+
+    times = measure(run_timers, 1)
+    report(f'core: {timers} timers x {seconds} ticks', times)
+    report_value('core: tick rate', timers * seconds / min(times), 'ticks/s', 'higher')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = HistoryModel(STOPWATCH_FORMAT, os.path.join(tmp, 'history.txt'), ['Work', 'Study'])
+        model.load()
+        first_day = date(2012, 1, 1).toordinal()
+        batch = [Record(first_day + i // 100, i % 3600, f'task{i % 7}', 'Work' if i % 2 else 'Study')
+                 for i in range(records)]
+        ids = []
+
+        def add_records():
+            ids.extend(model.add(record) for record in batch if not model.is_duplicate(record))
+
+        def delete_records():
+            for rid in ids:
+                model.delete(rid)
+
+        report(f'core: add {records} records', measure(add_records, 1))
+        report(f'core: delete {records} records', measure(delete_records, 1))
+        model.close()
+
+
+def python_report(days, seconds, codes, category_names, window=7, percentiles=(50, 90, 99)):
+    """
+    Pure-Python version of reports.build_report, as a baseline
+    """
+    first_day, last_day = min(days), max(days)
+    daily = [0] * (last_day - first_day + 1)
+    per_category = {}
+    for day, length, code in zip(days, seconds, codes):
+        daily[day - first_day] += length
+        per_category.setdefault(code, []).append(length)
+
+    rolling = []
+    for i in range(len(daily)):
+        part = daily[max(0, i - window + 1):i + 1]
+        rolling.append(sum(part) / len(part))
+
+    lead = (first_day - 1) % 7
+    cells = [0] * lead + daily
+    heatmap = [cells[i:i + 7] + [0] * (7 - len(cells[i:i + 7])) for i in range(0, len(cells), 7)]
+
+    longest = run = 0
+    for total in daily:
+        run = run + 1 if total > 0 else 0
+        longest = max(longest, run)
+
+    result = {}
+    for code, lengths in per_category.items():
+        lengths.sort()
+        values = []
+        for p in percentiles:
+            # linear interpolation, as numpy.percentile does by default
+            k = (len(lengths) - 1) * p / 100
+            low = int(k)
+            high = min(low + 1, len(lengths) - 1)
+            values.append(lengths[low] + (lengths[high] - lengths[low]) * (k - low))
+        result[category_names[code]] = values
+
+    return daily, rolling, heatmap, (longest, run), result
+
+
+def bench_reports(years=10):
+    """
+    Builds every report over per-minute records spanning several years, with NumPy and with plain Python
+    """
+    import numpy as np
+    from reports import HistoryArrays, build_report
+
+    first_day = date(2012, 1, 1).toordinal()
+    n_days = years * 365
+    rng = np.random.default_rng(0)
+    # one record per minute, with a few empty days so that streaks break
+    days = np.repeat(np.arange(first_day, first_day + n_days), 24 * 60)
+    seconds = rng.integers(0, 3600, len(days)) * (rng.random(len(days)) < 0.999)
+    codes = rng.integers(0, 4, len(days))
+    arrays = HistoryArrays(days, seconds, codes, ['Work', 'Study', 'Exercise', 'Other'])
+
+    def numpy_report():
+        for _, rows in build_report(arrays).values():
+            list(rows)
+
+    lists = days.tolist(), seconds.tolist(), codes.tolist(), arrays.category_names
+
+    report(f'reports: numpy ({len(arrays)} records)', measure(numpy_report, 3))
+    report(f'reports: pure Python ({len(arrays)} records)', measure(lambda: python_report(*lists), 1))
+
+
+def bench_startup(repeat=5):
+    """
+    Measures time to first paint of the app, from source and frozen (if dist/ holds a PyInstaller build)
+    Each run is a new process, timed from spawn until the app reports that its window was drawn
+    """
+    from main import STARTUP_PROBE
+
+    commands = {'source': [sys.executable, os.path.join(APP_DIR, 'main.py')]}
+    for name in ('main', 'main.exe'):
+        frozen = os.path.join(APP_DIR, 'dist', name)
+        if os.path.isfile(frozen):
+            commands['frozen'] = [frozen]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        probe_file = os.path.join(tmp_dir, 'first_paint')
+        env = dict(os.environ, **{STARTUP_PROBE: probe_file})
+
+        for kind, command in commands.items():
+            times = []
+            for _ in range(repeat):
+                # the probe holds wall-clock time, the only clock comparable across processes
+                start = time.time()
+                subprocess.run(command, cwd=APP_DIR, env=env, check=True)
+                with open(probe_file) as f:
+                    times.append(float(f.read()) - start)
+                os.remove(probe_file)
+            report(f'startup: first paint ({kind})', times)
+
+
+def has_display():
+    try:
+        tk.Tk().destroy()
+    except tk.TclError:
+        return False
+    return True
+
+
+def compare(baseline, current, threshold):
+    """
+    Prints how each result changed since a baseline run, flagging the ones that got worse by more than a threshold
+    :param baseline: results of the baseline run, name -> result
+    :param current: results of this run
+    :param threshold: tolerated relative change (ex. 0.2 for 20 %)
+    :return: names of the regressed benchmarks
+    """
+    regressions = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f'{name:<40} new')
+            continue
+
+        old, new = base['value'], result['value']
+        if old:
+            change = (new - old) / old
+        else:
+            change = math.inf if new > old else 0.0
+        worse = change if result['better'] == 'lower' else -change
+
+        flag = ''
+        if worse > threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        print(f'{name:<40} {old:15,.3f} -> {new:15,.3f} {result["unit"]:<8} {change:+8.1%}  {flag}')
+
+    return regressions
+
+
+BENCHMARKS = {
+    'timer_start': bench_timer_start,
+    'hidden_timers': bench_hidden_timers,
+    'tick_loop': bench_tick_loop,
+    'app_construction': bench_app_construction,
+    'photos': bench_photos,
+    'history_ops': bench_history_ops,
+    'parse_rate': bench_parse_rate,
+    'scan': bench_scan,
+    'storage_backends': bench_storage_backends,
+    'sync': bench_sync,
+    'segments': bench_segments,
+    'import_stall': bench_import_stall,
+    'history_open': bench_history_open,
+    'search': bench_search,
+    'checkpoint': bench_checkpoint,
+    'headless_core': bench_headless_core,
+    'laps': bench_laps,
+    'reports': bench_reports,
+    'startup': bench_startup,
+}
+
+# benchmarks that build Tk windows: without a display they are skipped (run the suite under xvfb-run instead)
+NEEDS_DISPLAY = {'timer_start', 'hidden_timers', 'app_construction', 'history_ops', 'import_stall', 'history_open',
+                 'startup'}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the benchmarks of the app')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, metavar='NAME',
+                        help=f'benchmarks to run, among: {", ".join(BENCHMARKS)} (all by default)')
+    parser.add_argument('--json', metavar='FILE', help='writes the results to a JSON file')
+    parser.add_argument('--compare', metavar='BASELINE', help='compares the results with a JSON file written by --json')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative change beyond which a result is a regression (default: 0.2)')
+    args = parser.parse_args()
+
+    display = has_display()
+
+    for name in args.only or BENCHMARKS:
+        if name in NEEDS_DISPLAY and not display:
+            print(f'{name}: skipped, no display')
+            continue
+        try:
+            BENCHMARKS[name]()
+        except ModuleNotFoundError as e:
+            # optional dependencies (Pillow, NumPy)
+            print(f'{name}: skipped, {e.name} is not installed')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': platform.python_version(), 'platform': platform.platform(),
+                       'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        print()
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) beyond {args.threshold:.0%}')
+            sys.exit(1)
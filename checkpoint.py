@@ -0,0 +1,78 @@
+import json
+import os
+
+# state of the timers, so that a session in progress survives a crash (removed when the app is closed)
+CHECKPOINT_FILE = 'timers_checkpoint.json'
+
+
+class Checkpoint:
+    # delay during which state changes are gathered into a single write
+    delay_ms = 500
+
+    def __init__(self, cp_root, filename=CHECKPOINT_FILE):
+        """
+        Small file holding the state of every timer, rewritten when a timer changes state (never per tick)
+        Each write goes to a temporary file which then replaces the checkpoint, so a crash leaves either
+        the previous checkpoint or the new one, never half of it
+        :param cp_root: tk widget whose event loop runs the writes
+        :param filename: checkpoint file
+        """
+        self.root = cp_root
+        self.filename = filename
+        # name -> function returning the state to be saved (or None)
+        self.sources = {}
+        self.write_id = None
+
+    def read(self):
+        """
+        Reads the last checkpoint
+        :return: name -> saved state, empty if there is no (readable) checkpoint
+        """
+        try:
+            with open(self.filename, 'r') as f:
+                states = json.load(f)['timers']
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return {}
+        return states if isinstance(states, dict) else {}
+
+    def add(self, name, get_state):
+        """
+        Adds a state to the checkpoint
+        :param name: key of the state in the file
+        :param get_state: function returning the state, as a JSON-compatible value (None to leave it out)
+        """
+        self.sources[name] = get_state
+
+    def request(self):
+        """
+        Called when a state changed: schedules a write, unless one is already pending
+        """
+        if self.write_id is None:
+            self.write_id = self.root.after(self.delay_ms, self.write)
+
+    def write(self):
+        self._cancel()
+        states = {name: get_state() for name, get_state in self.sources.items()}
+        data = json.dumps({'timers': {name: state for name, state in states.items() if state is not None}})
+
+        tmp_file = self.filename + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.filename)
+
+    def remove(self):
+        """
+        Drops the checkpoint, once the timers were closed normally
+        """
+        self._cancel()
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+
+    def _cancel(self):
+        if self.write_id is not None:
+            self.root.after_cancel(self.write_id)
+            self.write_id = None
@@ -0,0 +1,336 @@
+import argparse
+import contextlib
+import csv
+import heapq
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import repeat
+from journal import Journal
+from record_formats import STOPWATCH_FORMAT, POMODORO_FORMAT, ParseReport, scan_file
+from records import format_date, format_seconds
+from stats import HistoryStats
+
+FORMATS = {record_format.name: record_format for record_format in (STOPWATCH_FORMAT, POMODORO_FORMAT)}
+HISTORY_FILES = {'stopwatch': 'stopwatch_history.txt', 'pomodoro': 'pomodoro_history.txt'}
+
+# records sorted in memory at once by the external sort, the rest waits on disk
+RUN_SIZE = 200000
+# width of the date ordinal prefixing the lines of sorted runs
+DAY_WIDTH = 7
+# separates a record's key from its laps in the lines of sorted runs (it never appears in a history line)
+LAPS_SEPARATOR = '\x1f'
+
+
+def fold_journal(filename):
+    """
+    Applies the changes the app journaled for a history file, so that the file can be read on its own
+    :param filename: history file
+    """
+    Journal(filename).fold()
+
+
+@contextlib.contextmanager
+def locked_history(filename):
+    """
+    Folds the journal of a history file, then keeps running instances of the app from writing the file
+    until the block ends, so that a rewrite doesn't race their journal or its compaction
+    :param filename: history file
+    """
+    journal = Journal(filename)
+    with journal.compaction_lock, journal.lock:
+        journal.fold()
+        yield
+
+
+def read_records(filename, record_format, report=None):
+    """
+    Streams the records of a history file, through a read-only memory map shared with other processes
+    :return: iterator of records
+    """
+    return scan_file(filename, record_format, report)
+
+
+def sort_runs(filename, format_name, run_dir, run_size=RUN_SIZE):
+    """
+    First pass of the external sort, run in a worker process: splits a history file into sorted run files
+    Each run line is the record's canonical line without its laps, prefixed with its zero-padded date ordinal
+    and followed by the laps, so that plain string order is chronological and equal records (which may differ
+    by their laps, like in the app) are next to each other
+    :param filename: history file
+    :param format_name: name of the file's format
+    :param run_dir: directory in which to write the runs
+    :param run_size: number of records per run
+    :return: (list of run files, parse report)
+    """
+    record_format = FORMATS[format_name]
+    format_line = record_format.format_line
+    report = ParseReport()
+    runs = []
+    lines = []
+
+    def write_run():
+        lines.sort()
+        fd, run = tempfile.mkstemp(suffix='.run', dir=run_dir)
+        with os.fdopen(fd, 'w') as f:
+            f.writelines(lines)
+        runs.append(run)
+        lines.clear()
+
+    for record in read_records(filename, record_format, report):
+        line = format_line(record)
+        # drop the laps field (tab, laps and line break) from the key
+        key = line[:-len(record.laps) - 2] if record.laps else line[:-1]
+        lines.append(f'{record.day:0{DAY_WIDTH}}{key}{LAPS_SEPARATOR}{record.laps or ""}\n')
+        if len(lines) >= run_size:
+            write_run()
+    if lines:
+        write_run()
+
+    return runs, report
+
+
+def _history_line(key, laps):
+    return f'{key}\t{laps}\n' if laps else key + '\n'
+
+
+def merge_runs(runs, output, unique):
+    """
+    Second pass of the external sort: streams sorted runs into one file, replaced atomically
+    :param runs: sorted run files
+    :param output: file to be written
+    :param unique: drop records equal to the previous one (keeping a copy with laps, if any)
+    :return: (records written, duplicates dropped)
+    """
+    written = dropped = 0
+    fd, tmp_file = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(output)))
+    files = [open(run, 'r') for run in runs]
+    try:
+        with os.fdopen(fd, 'w') as out:
+            # a record is written once the next one has a different key, as a later copy may hold laps
+            previous = None
+            for line in heapq.merge(*files):
+                key, _, laps = line[DAY_WIDTH:-1].partition(LAPS_SEPARATOR)
+                if unique and previous is not None and key == previous[0]:
+                    dropped += 1
+                    if laps:
+                        previous = key, laps
+                    continue
+
+                if previous is not None:
+                    out.write(_history_line(*previous))
+                    written += 1
+                previous = key, laps
+
+            if previous is not None:
+                out.write(_history_line(*previous))
+                written += 1
+
+            out.flush()
+            os.fsync(out.fileno())
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+    finally:
+        for f in files:
+            f.close()
+
+    os.replace(tmp_file, output)
+    return written, dropped
+
+
+def merge_files(inputs, output, record_format, jobs=None, tmp_dir=None):
+    """
+    Merges history files into one sorted file, without holding them in memory
+    Inputs are split into sorted runs in parallel (one worker process per file), then merged in one stream
+    :param inputs: history files (the output may be one of them)
+    :param output: file to be written
+    :param record_format: format of the files
+    :param jobs: (optional) number of worker processes, all cores by default
+    :param tmp_dir: (optional) directory for the runs
+    :return: (records written, duplicates dropped, parse report of each input)
+    """
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as run_dir:
+        args = (inputs, repeat(record_format.name), repeat(run_dir))
+        if len(inputs) > 1 and jobs != 1:
+            with ProcessPoolExecutor(jobs) as pool:
+                results = list(pool.map(sort_runs, *args))
+        else:
+            results = list(map(sort_runs, *args))
+
+        runs = [run for file_runs, _ in results for run in file_runs]
+        written, dropped = merge_runs(runs, output, record_format.unique)
+
+    return written, dropped, [report for _, report in results]
+
+
+def print_reports(inputs, reports):
+    for filename, report in zip(inputs, reports):
+        if report.malformed:
+            print(f'{filename}: {report.summary()}', file=sys.stderr)
+
+
+def history_file(args):
+    return args.file or HISTORY_FILES[args.history]
+
+
+def cmd_import(args):
+    target = history_file(args)
+    record_format = FORMATS[args.history]
+
+    with locked_history(target):
+        inputs = ([target] if os.path.exists(target) else []) + args.inputs
+        written, dropped, reports = merge_files(inputs, target, record_format, args.jobs, args.tmp_dir)
+    print_reports(inputs, reports)
+    print(f'{target}: {written} records, {dropped} duplicates skipped')
+
+
+def cmd_merge(args):
+    record_format = FORMATS[args.history]
+    for filename in args.inputs:
+        fold_journal(filename)
+
+    # the output may be an app's history file (ex. one of the inputs)
+    with locked_history(args.output):
+        written, dropped, reports = merge_files(args.inputs, args.output, record_format, args.jobs, args.tmp_dir)
+    print_reports(args.inputs, reports)
+    print(f'{args.output}: {written} records, {dropped} duplicates skipped')
+
+
+def cmd_dedupe(args):
+    filename = history_file(args)
+    record_format = FORMATS[args.history]
+    if not record_format.unique:
+        # ex. several focus periods on the same day are different records
+        print(f'{args.history} records can legitimately repeat, nothing to dedupe', file=sys.stderr)
+        return 1
+
+    with locked_history(filename):
+        written, dropped, reports = merge_files([filename], filename, record_format, args.jobs, args.tmp_dir)
+    print_reports([filename], reports)
+    print(f'{filename}: {written} records, {dropped} duplicates removed')
+
+
+def cmd_export(args):
+    filename = history_file(args)
+    record_format = FORMATS[args.history]
+    fold_journal(filename)
+
+    fields = ['date', 'seconds', 'label', 'category'] if record_format.uses_categories else ['date', 'label']
+    report = ParseReport()
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        writer = csv.writer(out) if args.to == 'csv' else None
+        if writer:
+            writer.writerow(fields)
+
+        for record in read_records(filename, record_format, report):
+            row = {'date': date.fromordinal(record.day).isoformat(), 'seconds': record.seconds,
+                   'label': record.label, 'category': record.category}
+            if writer:
+                writer.writerow([row[field] for field in fields])
+            else:
+                out.write(json.dumps({field: row[field] for field in fields}) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print_reports([filename], [report])
+
+
+def cmd_stats(args):
+    filename = history_file(args)
+    record_format = FORMATS[args.history]
+    fold_journal(filename)
+
+    # aggregates grow with distinct days and labels, not with records
+    stats = HistoryStats()
+    report = ParseReport()
+    for record in read_records(filename, record_format, report):
+        stats.add(record)
+    print_reports([filename], [report])
+
+    records = sum(stats.label_counts.values())
+    print(f'{filename}: {records} records')
+    if not records:
+        return
+
+    first_day, last_day = min(stats.day_seconds), max(stats.day_seconds)
+    print(f'from {format_date(first_day)} to {format_date(last_day)}')
+
+    if record_format.uses_categories:
+        print('time per category:')
+        for category, seconds in stats.category_seconds(first_day, last_day).most_common():
+            print(f'  {category}: {format_seconds(seconds)}')
+        print('top labels:')
+        for label, seconds in stats.top_labels(args.top):
+            print(f'  {label}: {format_seconds(seconds)} ({stats.label_counts[label]} records)')
+    else:
+        for label, count in stats.label_counts.most_common():
+            print(f'  {label}: {count}')
+
+
+def cmd_compact(args):
+    for filename in args.files or HISTORY_FILES.values():
+        fold_journal(filename)
+        print(f'{filename}: compacted')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='stopwatch', description='Batch operations on history files (no GUI)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_command(name, func, help_text, file_arg=True):
+        command = commands.add_parser(name, help=help_text)
+        command.set_defaults(func=func)
+        command.add_argument('--history', choices=sorted(FORMATS), default='stopwatch',
+                             help='kind of history (default: stopwatch)')
+        if file_arg:
+            command.add_argument('--file', help='history file (default: the app\'s history file)')
+        return command
+
+    import_command = add_command('import', cmd_import, 'add the records of other files to a history file')
+    import_command.add_argument('inputs', nargs='+')
+
+    merge_command = add_command('merge', cmd_merge, 'merge history files into a new one', file_arg=False)
+    merge_command.add_argument('output')
+    merge_command.add_argument('inputs', nargs='+')
+
+    add_command('dedupe', cmd_dedupe, 'remove duplicate records from a history file')
+
+    export_command = add_command('export', cmd_export, 'export a history file as CSV or JSON Lines')
+    export_command.add_argument('--to', choices=['csv', 'jsonl'], default='csv')
+    export_command.add_argument('-o', '--output', help='output file (default: standard output)')
+
+    stats_command = add_command('stats', cmd_stats, 'print totals of a history file')
+    stats_command.add_argument('--top', type=int, default=10, help='number of labels listed')
+
+    compact_command = commands.add_parser('compact', help='fold the app\'s journals into the history files')
+    compact_command.set_defaults(func=cmd_compact)
+    compact_command.add_argument('files', nargs='*')
+
+    dedupe_command = commands.choices['dedupe']
+    for command in (import_command, merge_command, dedupe_command):
+        command.add_argument('--tmp-dir', help='directory for the sorted runs (default: system temp directory)')
+    for command in (import_command, merge_command):
+        command.add_argument('-j', '--jobs', type=int, help='worker processes (default: one per core)')
+    dedupe_command.set_defaults(jobs=1)
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs one command line operation
+    :param argv: (optional) arguments, the process' by default
+    :return: exit status
+    """
+    args = build_parser().parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    def __init__(self, filename):
+        """
+        Advisory lock shared by every instance of the app working on the same files
+        It is taken on a file of its own, as the files it protects get replaced by rewrites;
+        it is reentrant, and also excludes the other threads of this instance (ex. a journal compaction)
+        :param filename: lock file, created if needed
+        """
+        self.filename = filename
+        self.thread_lock = threading.RLock()
+        self.file = None
+        self.depth = 0
+
+    def acquire(self, blocking=True):
+        """
+        Takes the lock
+        :param blocking: (optional) False to give up at once if it is held elsewhere
+        :return: True if the lock is held, False if it was busy
+        """
+        if not self.thread_lock.acquire(blocking):
+            return False
+
+        if self.depth == 0:
+            f = open(self.filename, 'a+b')
+            try:
+                locked = _lock_file(f, blocking)
+            except BaseException:
+                f.close()
+                self.thread_lock.release()
+                raise
+            if not locked:
+                f.close()
+                self.thread_lock.release()
+                return False
+            self.file = f
+
+        self.depth += 1
+        return True
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            _unlock_file(self.file)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+
+def _lock_file(f, blocking):
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    # msvcrt locks the first byte; its blocking mode gives up after 10 seconds, so poll instead
+    while True:
+        f.seek(0)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.05)
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
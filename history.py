@@ -1,39 +1,70 @@
+import queue
+import time
 import tkinter as tk
+from collections import deque
+from datetime import datetime
 from tkinter import ttk
 from tkinter import simpledialog
 from tkinter import messagebox
 from tkinter import filedialog
-import re
+from history_core import HistoryModel
+from importer import ImportWorker
+from instrumentation import timed
+from record_formats import STOPWATCH_FORMAT, POMODORO_FORMAT
+from search_index import SearchFilter
 
 
 class History:
-    def __init__(self, hist_root, columns, labels, uses_categories, photos, init_file):
+    # delay after which stored changes are written, unless a full batch is written before
+    flush_ms = 2000
+    # rows materialized per tree level at once, the rest is reached through previous/next rows
+    page_size = 100
+    # records stored per import step (and time budget of a step, in seconds),
+    # between which the event loop runs so that timers keep ticking
+    import_batch = 500
+    import_budget = 0.01
+    # delay after the last keystroke before the filter is applied
+    filter_ms = 150
+    # delay between checks for records written by other instances of the app
+    sync_ms = 5000
+
+    def __init__(self, hist_root, columns, labels, record_format, photos, init_file):
         self.root = hist_root
 
         self.photos = photos
         self.init_file = init_file
-        self.uses_categories = uses_categories
+        self.record_format = record_format
+        self.uses_categories = record_format.uses_categories
 
-        if self.uses_categories:
-            self.history_categories = {col: [] for col in ['Work', 'Study', 'Exercise', 'Other']}
-        else:
-            self.history_categories = {}
+        # records, stats and filter indexes live in the model, this class only shows them
+        categories = ['Work', 'Study', 'Exercise', 'Other'] if self.uses_categories else []
+        self.model = HistoryModel(record_format, init_file, categories)
+        self.flush_id = None
+
+        # offset of the page shown under each loaded tree node ('' is the top level)
+        self.pages = {}
 
-        self.index = 0
+        # active filter (its matches replace the tree, listed flat), applied once the model's indexes are built
+        self.filter = None
+        self.search_id = None
+        self.filter_id = None
+        self._init_filter_bar()
 
         # treeview for history records
         self.hist_gui = ttk.Treeview(hist_root)
         self.tree_width = 300
         self.columns = columns
         self.hist_gui['columns'] = columns
-        self.hist_gui.grid(row=0, column=0, columnspan=2)
+        self.hist_gui.grid(row=1, column=0, columnspan=2)
 
-        # respond to click on the treeview
+        # respond to click on the treeview, fill category nodes only while they are expanded
         self.hist_gui.bind("<ButtonRelease-1>", self.onselect)
+        self.hist_gui.bind("<<TreeviewOpen>>", self.on_open)
+        self.hist_gui.bind("<<TreeviewClose>>", self.on_close)
 
         # frame for buttons (delete, load, save)
         self.button_frame = tk.Frame(hist_root, pady=5)
-        self.button_frame.grid(row=1, column=0, columnspan=3)
+        self.button_frame.grid(row=2, column=0, columnspan=3)
         self.delete_button = tk.Button(self.button_frame, text='Delete')
         self.delete_button.pack(side=tk.LEFT)
         self.delete_button.configure(state=tk.DISABLED)
@@ -43,26 +74,39 @@ class History:
         self.save_button = tk.Button(self.button_frame, text='Save', command=self.save_records)
         self.save_button.pack(side=tk.LEFT)
 
+        # progress of a running import, shown instead of the buttons
+        self.import_frame = tk.Frame(hist_root, pady=5)
+        self.import_progress = ttk.Progressbar(self.import_frame, length=200, maximum=100)
+        self.import_progress.pack(side=tk.LEFT)
+        self.cancel_button = tk.Button(self.import_frame, text='Cancel', command=self.cancel_import)
+        self.cancel_button.pack(side=tk.LEFT)
+
+        self.importer = None
+        self.import_id = None
+        self.import_pending = deque()
+        self.import_categories = []
+        self.import_show_error = False
+        # stats of the last import: records added, duration and longest single step (UI stall)
+        self.last_import = None
+
+        # the history file is read in steps like an import, the records added meanwhile wait for the end
+        self.loading = False
+        self.load_id = None
+        self.deferred_records = []
+
         # detail frame
         self.f = tk.Frame(hist_root, height=350)
-        self.f.grid(row=2, column=0, columnspan=2, padx=10, pady=20)
+        self.f.grid(row=3, column=0, columnspan=2, padx=10, pady=20)
         self.labels = labels or columns
         self.label_widgets = self._init_labels()
 
-        # fetch records from init file, initialize tree
-        self._init_tree()
+        # fetch records from storage, initialize tree
         self._initialize_cols_headings()
+        self.sync_id = None
         self._init_fetch()
 
     def record_count(self):
-        total_records = 0
-        if self.uses_categories:
-            for category in self.history_categories.keys():
-                total_records += len(self.history_categories.get(category, []))
-        else:
-            total_records += len(self.hist_gui.get_children())
-
-        return total_records
+        return len(self.model)
 
     def _init_labels(self):
         widgets = [tk.Label(self.f, text=f'{label}: ', font=('Arial', 12)) for label in self.labels]
@@ -76,17 +120,260 @@ class History:
         for label, widget in zip(self.labels, self.label_widgets):
             widget.configure(text=f'{label}: ')
 
+    def _init_filter_bar(self):
+        """
+        Filter bar above the tree: label substring, category and date range, applied as you type
+        """
+        self.filter_frame = tk.Frame(self.root, pady=3)
+        self.filter_frame.grid(row=0, column=0, columnspan=2)
+
+        self.filter_label = tk.StringVar()
+        self.filter_category = tk.StringVar(value='All')
+        self.filter_from = tk.StringVar()
+        self.filter_to = tk.StringVar()
+
+        tk.Label(self.filter_frame, text='Label').grid(row=0, column=0, sticky='e')
+        tk.Entry(self.filter_frame, textvariable=self.filter_label, width=12).grid(row=0, column=1)
+        if self.uses_categories:
+            self.category_box = ttk.Combobox(self.filter_frame, textvariable=self.filter_category, width=9,
+                                             state='readonly', values=['All'],
+                                             postcommand=self._update_category_box)
+            self.category_box.grid(row=0, column=2, columnspan=2)
+
+        # dates as dd/mm/yyyy, like in the history files
+        tk.Label(self.filter_frame, text='From').grid(row=1, column=0, sticky='e')
+        self.from_entry = tk.Entry(self.filter_frame, textvariable=self.filter_from, width=10)
+        self.from_entry.grid(row=1, column=1)
+        tk.Label(self.filter_frame, text='To').grid(row=1, column=2)
+        self.to_entry = tk.Entry(self.filter_frame, textvariable=self.filter_to, width=10)
+        self.to_entry.grid(row=1, column=3)
+
+        for var in (self.filter_label, self.filter_category, self.filter_from, self.filter_to):
+            var.trace_add('write', self.schedule_filter)
+
+    def _update_category_box(self):
+        self.category_box.configure(values=['All'] + self.model.category_names())
+
+    @staticmethod
+    def _filter_day(var, entry):
+        """
+        Reads a date bound of the filter, ignoring it (and showing it in red) until it's a valid date
+        :return: date ordinal, or None
+        """
+        text = var.get().strip()
+        day = None
+        if text:
+            try:
+                day = datetime.strptime(text, "%d/%m/%Y").toordinal()
+            except ValueError:
+                pass
+
+        entry.configure(foreground='red' if text and day is None else 'black')
+        return day
+
+    def read_filter(self):
+        category = self.filter_category.get()
+        return SearchFilter(self.filter_label.get().strip(),
+                            None if category == 'All' else category,
+                            self._filter_day(self.filter_from, self.from_entry),
+                            self._filter_day(self.filter_to, self.to_entry))
+
+    def schedule_filter(self, *_):
+        # wait for a pause in typing, so that a burst of keystrokes applies the filter once
+        if self.filter_id is not None:
+            self.root.after_cancel(self.filter_id)
+        self.filter_id = self.root.after(self.filter_ms, self.apply_filter)
+
+    @timed
+    def apply_filter(self):
+        """
+        Lists the records meeting the filter bar's conditions instead of the tree (or restores the tree)
+        """
+        self.filter_id = None
+        search_filter = self.read_filter()
+        if search_filter.is_empty():
+            search_filter = None
+            if self.filter is None:
+                return
+
+        if self.loading:
+            # applied once the history is loaded
+            return
+
+        if search_filter is not None and self.model.search is None:
+            # the filter is applied again once the indexes are ready
+            if self.model.search_build is None:
+                self.start_search_build()
+            return
+
+        self.filter = search_filter
+        self.hist_gui.delete(*self.hist_gui.get_children(''))
+        self.pages.clear()
+        self.reset_labels()
+        self.delete_button.configure(state=tk.DISABLED)
+
+        if search_filter is None:
+            self._init_tree()
+        else:
+            self.render_page('')
+
+    def start_search_build(self):
+        self.model.start_search_build()
+        if self.search_id is None:
+            self.search_id = self.root.after_idle(self._search_step)
+
+    @timed
+    def _search_step(self):
+        """
+        Indexes records for one time slice, then yields to the event loop (like imports)
+        """
+        self.search_id = None
+        if self.model.search_step(self.import_budget):
+            self.apply_filter()
+        else:
+            self.search_id = self.root.after_idle(self._search_step)
+
     def _init_fetch(self):
-        try:
-            self.load_records(self.init_file)
-        except FileNotFoundError:
-            pass
+        """
+        Starts reading the history file, in steps between which the event loop runs (as imports do)
+        """
+        self.loading = True
+        self.model.start_load()
+        self.button_frame.grid_remove()
+        self.cancel_button.configure(state=tk.DISABLED)
+        self.import_frame.grid(row=2, column=0, columnspan=3)
+        self.load_id = self.root.after_idle(self._load_step)
+
+    @timed
+    def _load_step(self):
+        """
+        Stores one time slice of the records parsed so far, then yields to the event loop
+        """
+        self.load_id = None
+        if self.model.load_step(self.import_budget):
+            self._show_loaded()
+            # the first page is drawn before the stats are built
+            self.load_id = self.root.after_idle(self._finish_load)
+            return
+
+        self.import_progress.configure(value=self.model.load_progress() * 100)
+        if self.model.load_waiting():
+            self.load_id = self.root.after_idle(self._load_step)
+        else:
+            # wait for the parser without spinning
+            self.load_id = self.root.after(20, self._load_step)
+
+    def _show_loaded(self):
+        report = self.model.finish_load()
+        self._init_tree()
+        if report.malformed:
+            messagebox.showwarning(title="Malformed records", message=report.summary())
+
+    @timed
+    def _finish_load(self):
+        self.load_id = None
+        self.model.fill_stats()
+        self.loading = False
+
+        self.import_frame.grid_remove()
+        self.cancel_button.configure(state=tk.NORMAL)
+        self.button_frame.grid()
+
+        # follow the changes other instances make to the same history
+        self.sync_id = self.root.after(self.sync_ms, self.sync_records)
+
+        deferred, self.deferred_records = self.deferred_records, []
+        for record in deferred:
+            self.add_record(record)
+        if not self.read_filter().is_empty():
+            self.apply_filter()
+        # views built on the history's stats (ex. the stats tab) can now read them
+        self.root.event_generate('<<HistoryLoaded>>')
+
+    def complete_load(self):
+        """
+        Ends the history's load right away (ex. before it's written)
+        """
+        if not self.loading:
+            return
+
+        if self.load_id is not None:
+            self.root.after_cancel(self.load_id)
+            self.load_id = None
+        if self.model.loader is not None:
+            self.model.load_step()
+            self._show_loaded()
+        self._finish_load()
+
+    def schedule_flush(self):
+        if self.flush_id is None:
+            self.flush_id = self.root.after(self.flush_ms, self.flush_storage)
+
+    def flush_storage(self):
+        """
+        Writes the buffered changes to storage (called on a timer, and when closing)
+        """
+        if self.flush_id is not None:
+            self.root.after_cancel(self.flush_id)
+            self.flush_id = None
+
+        self.model.flush()
+
+    def close_storage(self):
+        if self.sync_id is not None:
+            self.root.after_cancel(self.sync_id)
+            self.sync_id = None
+        if self.loading:
+            # no need to wait for the load: records added meanwhile are only appended to the journal
+            if self.load_id is not None:
+                self.root.after_cancel(self.load_id)
+                self.load_id = None
+            self.model.cancel_load()
+            for record in self.deferred_records:
+                self.model.add(record)
+            self.deferred_records.clear()
+        self.flush_storage()
+        self.model.close()
+
+    @timed
+    def sync_records(self):
+        """
+        Shows the records other instances of the app added or deleted since the last check (called on a timer)
+        """
+        self.sync_id = self.root.after(self.sync_ms, self.sync_records)
+        self.show_changes(self.model.sync())
+
+    def show_changes(self, changes):
+        """
+        Redraws the tree nodes whose records were changed by another instance
+        :param changes: changes returned by the model's sync
+        """
+        if changes is None:
+            # the whole history was read again, with new ids
+            self.hist_gui.delete(*self.hist_gui.get_children(''))
+            self.pages.clear()
+            self.reset_labels()
+            self.delete_button.configure(state=tk.DISABLED)
+            if self.filter is None:
+                self._init_tree()
+            if self.filter is not None or self.search_id is not None:
+                # the indexes are built again, then the filter applied
+                self.start_search_build()
+            return
+
+        for parent in dict.fromkeys(record.category or '' for _, _, record in changes):
+            self.refresh_node(parent)
+
+        # the selected record may have been deleted
+        if changes and self.model.get(self.hist_gui.focus()) is None:
+            self.reset_labels()
+            self.delete_button.configure(state=tk.DISABLED)
 
     def _initialize_cols_headings(self):
         col_width = self.tree_width // len(self.columns)
         first_col_title, first_col_width = "", 5
 
-        if len(self.history_categories.keys()) > 0:
+        if self.uses_categories:
             col_width = self.tree_width // (len(self.columns) + 1)
             first_col_title, first_col_width = "Category", col_width
 
@@ -110,41 +397,122 @@ class History:
             return
 
         try:
-            with open(filename, 'r') as f:
-                # invalid file = no usable records / all duplicates
-                invalid_file = True
-                for record in f:
-                    record = record.strip('\n')
+            f = open(filename, 'rb')
+        except FileNotFoundError:
+            messagebox.showerror(title="Error", message="File not found.")
+            # call function again
+            self.load_records()
+            return
+
+        self.start_import(f, show_error)
+
+    @timed
+    def start_import(self, f, show_error=False):
+        """
+        Starts importing an open history file (timed apart from the dialogs of load_records)
+        :param f: history file open in binary mode
+        """
+        # duplicates are checked against the whole history
+        self.complete_load()
+
+        # parse in a worker thread, store the records in small steps on the Tk thread
+        self.importer = ImportWorker(f, self.record_format)
+        self.import_pending.clear()
+        self.import_categories = self.model.category_names()
+        self.import_show_error = show_error
+        self.last_import = {'records': 0, 'seconds': 0.0, 'worst_stall': 0.0, 'started': time.perf_counter()}
 
-                    if not record:
+        self.button_frame.grid_remove()
+        self.import_progress.configure(value=0)
+        self.import_frame.grid(row=2, column=0, columnspan=3)
+
+        self.importer.start()
+        self.import_id = self.root.after_idle(self._import_step)
+
+    @timed
+    def _import_step(self):
+        """
+        Stores one bounded batch of imported records, then yields to the event loop
+        """
+        importer = self.importer
+        self.import_id = None
+        started = time.perf_counter()
+        stored = 0
+        finished = False
+
+        # the step's records are journaled together, not fsynced every few dozens
+        with self.model.batched():
+            while stored < self.import_batch and time.perf_counter() - started < self.import_budget:
+                if not self.import_pending:
+                    try:
+                        chunk = importer.chunks.get_nowait()
+                    except queue.Empty:
+                        break
+                    if chunk is None:
+                        finished = True
                         break
+                    self.import_pending.extend(chunk)
 
-                    if self.uses_categories:
-                        # label and category, split by tab '\t'
-                        label, category = record.split('\t')
-                    else:
-                        label, category = record, None
+                record = self.import_pending.popleft()
+                stored += 1
 
-                    # if record respects format, isn't duplicate and category is valid
-                    if self.is_valid(label) and not self.is_duplicate(label, category) \
-                            and (not self.uses_categories or category in self.history_categories.keys()):
-                        # file isn't invalid, as a record was found
-                        invalid_file = False
-                        self.add_record(label, category)
+                # if record isn't duplicate and category is valid
+                if self.model.accepts(record, self.import_categories):
+                    self.model.add(record)
+                    self.last_import['records'] += 1
 
-                # no valid records found in file
-                if show_error and invalid_file:
-                    messagebox.showerror(title="Error", message="No useful records found on file.")
+        self.import_progress.configure(value=importer.progress() * 100)
+        self.last_import['worst_stall'] = max(self.last_import['worst_stall'], time.perf_counter() - started)
 
-        except FileNotFoundError:
-            messagebox.showerror(title="Error", message="File not found.")
-            # call function again
-            self.load_records()
+        if finished:
+            self._finish_import()
+        elif self.import_pending or not importer.chunks.empty():
+            self.import_id = self.root.after_idle(self._import_step)
+        else:
+            # wait for the parser without spinning
+            self.import_id = self.root.after(20, self._import_step)
+
+    def _finish_import(self, canceled=False):
+        importer = self.importer
+        self.importer = None
+        self.import_pending.clear()
+
+        if self.import_id is not None:
+            self.root.after_cancel(self.import_id)
+            self.import_id = None
+
+        self.last_import['seconds'] = time.perf_counter() - self.last_import.pop('started')
+
+        self.import_frame.grid_remove()
+        self.button_frame.grid()
+
+        # tree pages are redrawn once, after the whole file
+        self.refresh_tree()
+        self.schedule_flush()
+
+        if canceled:
+            messagebox.showinfo(title="Import canceled",
+                                message=f"Import canceled, {self.last_import['records']} record(s) were added.")
+            return
+
+        if importer.report.malformed:
+            messagebox.showwarning(title="Malformed records", message=importer.report.summary())
+
+        # no valid records found in file
+        if self.import_show_error and self.last_import['records'] == 0:
+            messagebox.showerror(title="Error", message="No useful records found on file.")
+
+    def cancel_import(self):
+        if self.importer is not None:
+            self.importer.cancel()
+            self._finish_import(canceled=True)
 
     def save_records(self, show_error=True, filename=None):
         """
         Save records to a given filename
         """
+        # never write a history that is partly read
+        self.complete_load()
 
         total_len = self.record_count()
 
@@ -165,19 +533,12 @@ class History:
         if not filename:
             return
 
-        with open(filename, 'w') as f:
-            if self.uses_categories:
-                # iterate through records in list box, writing them to file
-                for category in self.history_categories:
-                    records = self.history_categories[category]
-                    for line in records:
-                        write_line = line + "\t" + category + "\n"
-                        f.write(write_line)
-            else:
-                for record in self.hist_gui.get_children():
-                    item = self.hist_gui.item(record)['values']
-                    write_line = " | ".join(item) + "\n"
-                    f.write(write_line)
+        # iterate through records in storage, writing them to file
+        self.export_records(filename)
+
+    @timed
+    def export_records(self, filename):
+        self.show_changes(self.model.export(filename))
 
     def onselect(self, _):
         """
@@ -190,76 +551,154 @@ class History:
         if not selection:
             return
 
-        # take selected item's parent (category)
-        category = self.hist_gui.parent(selection)
-        # take selected item's values (date, length, label)
-        vals = self.hist_gui.item(selection, 'values')
+        # previous/next rows page through the records of their parent
+        parent, _, row_kind = selection.rpartition('|')
+        if row_kind == 'prev':
+            self.render_page(parent, self.pages[parent] - self.page_size)
+            return
+        if row_kind == 'next':
+            self.render_page(parent, self.pages[parent] + self.page_size)
+            return
 
-        # no record is selected => return
-        if not vals or len(vals) != len(self.labels):
+        # no record is selected (ex. a category node) => return
+        record = self.model.get(selection)
+        if record is None:
             return
 
+        # take selected record's values (date, length, label)
+        vals = self.model.record_values(record)
+
         # update labels with record data
         for label, widget, val in zip(self.labels, self.label_widgets, vals):
             widget.configure(text=label + ": " + (val or 'null'))
 
         # activate delete button
-        self.delete_button.configure(state=tk.ACTIVE,
-                                     command=lambda: self.delete_record(selection, ' | '.join(vals), category))
+        self.delete_button.configure(state=tk.ACTIVE, command=lambda: self.delete_record(selection))
+
+    def node_text(self, parent):
+        return f'{parent} ({self.model.count(parent)})'
+
+    @timed
+    def render_page(self, parent, offset=0):
+        """
+        Replaces a node's children with one page of its records, plus previous/next rows if there are more
+        :param parent: tree node ('' for the top level, else a category)
+        :param offset: index of the page's first record
+        """
+        # one extra record tells whether there is a next page
+        records = list(self.model.page(parent or None, offset, self.page_size + 1, self.filter))
+        if not records and offset > 0:
+            # keep the offset on an existing page (ex. after deleting the last record of the last page)
+            self.render_page(parent, max(0, offset - self.page_size))
+            return
+        self.pages[parent] = offset
+
+        self.hist_gui.delete(*self.hist_gui.get_children(parent))
+
+        if offset > 0:
+            self.hist_gui.insert(parent=parent, index=tk.END, iid=parent + '|prev', text="",
+                                 values=('▲ previous',))
+
+        for rid, record in records[:self.page_size]:
+            self.hist_gui.insert(parent=parent, index=tk.END, iid=rid, text="",
+                                 values=self.model.record_values(record))
+
+        if len(records) > self.page_size:
+            self.hist_gui.insert(parent=parent, index=tk.END, iid=parent + '|next', text="",
+                                 values=('▼ next',))
+
+    def unload_node(self, parent):
+        """
+        Drops a collapsed node's rows, leaving a placeholder so that it can still be expanded
+        :param parent: category node
+        """
+        self.pages.pop(parent, None)
+        self.hist_gui.delete(*self.hist_gui.get_children(parent))
 
-    def add_record(self, record, category):
-        cols = record.split(' | ')
+        if self.model.count(parent) > 0:
+            self.hist_gui.insert(parent=parent, index=tk.END, iid=parent + '|placeholder', text="", values=())
 
-        if len(cols) != len(self.columns):
+    def refresh_node(self, parent):
+        """
+        Redraws a node after its records changed
+        :param parent: tree node ('' for the top level, else a category)
+        """
+        if self.filter is not None:
+            # the filter's matches are listed instead of the tree
+            self.render_page('', self.pages.get('', 0))
             return
 
-        if not self.is_duplicate(record, category):
+        if parent and not self.hist_gui.exists(parent):
+            # categories typed in the label dialog get their node on first use
+            self.hist_gui.insert(parent='', index=tk.END, iid=parent, text=parent, values=())
+
+        if parent in self.pages:
+            self.render_page(parent, self.pages[parent])
+        elif parent:
+            self.unload_node(parent)
+
+        if parent:
+            self.hist_gui.item(parent, text=self.node_text(parent))
+
+    def refresh_tree(self):
+        if self.filter is not None:
+            self.refresh_node('')
+            return
+
+        for parent in self.tree_nodes():
+            self.refresh_node(parent)
+
+    def on_open(self, _):
+        parent = self.hist_gui.focus()
+        if parent not in self.pages:
+            self.render_page(parent)
 
-            # add record to category dict
-            if category:
-                self.history_categories[category] = self.history_categories.get(category, []) + [record]
+    def on_close(self, _):
+        parent = self.hist_gui.focus()
+        if parent:
+            self.unload_node(parent)
 
-            # add record to treeview
-            self.hist_gui.insert(parent=category or '', index=self.index, text="", values=tuple(cols))
-            self.index += 1
+    def add_record(self, record):
+        if self.loading:
+            # checked for duplicates and added once every record is read
+            self.deferred_records.append(record)
+            return
+
+        if not self.model.is_duplicate(record):
+            # add record to storage, then redraw the tree node that shows it
+            self.model.add(record)
+            self.refresh_node(record.category or '')
+            self.schedule_flush()
         else:
             messagebox.showerror(title="Duplicate label", message="Duplicate label, please try again.")
             new_record, new_label = None, ''
             # if label is empty, duplicate or too long
             while (not new_record or not new_label
-                   or self.is_duplicate(new_record, category) or len(new_label) > 10):
+                   or self.model.is_duplicate(new_record) or len(new_label) > 10):
                 new_label = simpledialog.askstring("New label", prompt="Please enter new label:")
-                new_record = ' | '.join(cols[:-1].append(new_label or 'default'))
+                new_record = record.replace_label(new_label or 'default')
 
-            self.add_record(new_record, category)
+            self.add_record(new_record)
 
-    def delete_record(self, ind, record, category):
+    def delete_record(self, ind):
         """
         Delete record from treeview
-        :param category: record's category
-        :param ind: record's index
-        :param record: record to be deleted
+        :param ind: record's id (in both the storage and the treeview)
         """
-        # delete record from treeview (with index)
-        self.hist_gui.delete(ind)
-
-        if category:
-            # delete record from category dict
-            self.history_categories[category].remove(record)
+        # delete record from storage (with index), then redraw the tree node that showed it
+        record = self.model.delete(ind)
+        self.refresh_node(record.category or '')
+        self.schedule_flush()
 
+        # the deleted row was the selection, so there is nothing left to delete
         self.reset_labels()
-
-        if self.hist_gui.size() == 0:
-            self.delete_button.configure(state=tk.DISABLED)
+        self.delete_button.configure(state=tk.DISABLED)
 
     # FUNCTIONS TO BE IMPLEMENTED BY EACH HISTORY INSTANCE
     def _init_tree(self):
         raise NotImplementedError
 
-    def is_valid(self, label):
-        raise NotImplementedError
-
-    def is_duplicate(self, label, category):
+    def tree_nodes(self):
         raise NotImplementedError
 
 
@@ -270,93 +709,31 @@ class StopWatchHistory(History):
         When application is started, it will search for file 'history.txt'
         :param hist_root: the root in which to show the history
         """
-        super().__init__(hist_root, ['Date', 'Length', 'Label'], ['Date', 'Length', 'Label'], True, photos, init_file)
+        super().__init__(hist_root, ['Date', 'Length', 'Label'], ['Date', 'Length', 'Label'], STOPWATCH_FORMAT, photos,
+                         init_file)
 
     def _init_tree(self):
         """
-        Takes categories from the 'history_categories' dict and inserts them in treeview
+        Takes categories from the model and inserts them in treeview
+        Their records are only inserted when the category is expanded
         """
-        for ind, cat in enumerate(self.history_categories.keys()):
-            self.hist_gui.insert(parent='', index=ind, iid=cat, text=cat, values=())
+        for ind, cat in enumerate(self.model.category_names()):
+            self.hist_gui.insert(parent='', index=ind, iid=cat, text=self.node_text(cat), values=())
+            self.unload_node(cat)
 
-    def is_valid(self, line):
-        """
-        Check if record line is valid (date, timer and label)
-        :param line: line to be checked
-        :return: True if record is valid, False otherwise
-        """
-        elements = line.split(' | ')
-        if len(elements) == 3:
-            # record contains a date of format dd/mm/yyyy
-            valid_date = re.match(r"^\d{2}/\d{2}/\d{4}$", elements[0])
-            # record contains a timer of format hh:mm:ss
-            valid_time = re.match(r"^\d{2}:\d{2}:\d{2}$", elements[1])
-            # record contains a label (between 1 and 10 characters)
-            valid_label = re.match(r"^.{1,10}$", elements[2])
-
-            if valid_date and valid_time and valid_label:
-                return True
-
-        return False
-
-    def is_duplicate(self, record, category):
-        """
-        Given a certain record, iterates through existing list to see if it's a duplicate
-        :param record: the record to be checked for duplicates
-        :param category: the record's category
-        :return: True if record is a duplicate, False otherwise
-        """
-        records = self.history_categories[category]
-        if record in records:
-            return True
-
-        return False
+    def tree_nodes(self):
+        return self.model.category_names()
 
 
 class PomodoroHistory(History):
     def __init__(self, hist_root, photos, init_file="pomodoro_history.txt"):
-        super().__init__(hist_root, ["Date", "Label"], ["Date", "Label"], False, photos, init_file)
+        super().__init__(hist_root, ["Date", "Label"], ["Date", "Label"], POMODORO_FORMAT, photos, init_file)
 
     def _init_tree(self):
-        pass
-
-    def is_valid(self, line):
         """
-        Check if record line is valid (date and label)
-        :param line: line to be checked
-        :return: True if record is valid, False otherwise
+        Shows the first page of records (the list is flat, so it is paged instead of expanded)
         """
-        elements = line.split(' | ')
-        if len(elements) == 2:
-            print(elements)
-            # record contains a date of format dd/mm/yyyy
-            valid_date = re.match(r"^\d{2}/\d{2}/\d{4}$", elements[0])
-            print(valid_date)
-            # record contains a label (break or focus)
-            valid_label = re.match(r"^(Break|Focus)$", elements[1])
-            print(valid_label)
-
-            if valid_date and valid_label:
-                return True
-
-        return False
-
-    def add_record(self, record, category=None):
-        print(record)
-        date, label = record.split(' | ')
-
-        # add record to treeview
-        self.hist_gui.insert(parent='', index=self.index, text="", values=(date, label))
-        self.index += 1
-
-    def delete_record(self, ind, label, _):
-        # delete record from treeview (with index)
-        self.hist_gui.delete(ind)
-
-        self.reset_labels()
-
-        if self.hist_gui.size() == 0:
-            self.delete_button.configure(state=tk.DISABLED)
+        self.render_page('')
 
-    def is_duplicate(self, label, category=None):
-        return False
+    def tree_nodes(self):
+        return ['']
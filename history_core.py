@@ -0,0 +1,251 @@
+import gc
+import itertools
+import queue
+import time
+from importer import ImportWorker
+from journal import Journal
+from records import RecordColumns
+from search_index import SearchIndex
+from stats import HistoryStats
+from storage import open_storage
+
+
+class HistoryModel:
+    def __init__(self, record_format, init_file, categories=()):
+        """
+        Records of a history and everything derived from them (stats, filter indexes), without any widget
+        Records are addressed by the storage's string ids, which the Tk view also uses as treeview item ids
+        :param record_format: format of the history's records
+        :param init_file: history file
+        :param categories: categories that exist even before they hold any record
+        """
+        self.record_format = record_format
+        self.init_file = init_file
+
+        # records are kept in a storage backend indexed by id
+        self.storage = open_storage(init_file, record_format, categories)
+        # running totals (per day, category and label), kept in step with the storage
+        self.stats = HistoryStats()
+
+        # filter indexes, built in steps (index and remaining records) the first time they're needed
+        self.search = None
+        self.search_build = None
+        # worker parsing the history file for a load in steps (see start_load)
+        self.loader = None
+
+    def __len__(self):
+        return len(self.storage)
+
+    def load(self):
+        """
+        Reads the stored records
+        :return: parse report of the history file
+        """
+        report = self.storage.load()
+        self.fill_stats()
+        return report
+
+    def start_load(self):
+        """
+        Starts reading the stored records in steps: the history file is parsed on a worker thread,
+        load_step stores its records, then finish_load and fill_stats end the load
+        """
+        f = self.storage.start_load()
+        if f is not None:
+            self.loader = ImportWorker(f, self.record_format, columns=RecordColumns())
+            self.loader.start()
+
+    def load_step(self, budget=None):
+        """
+        Stores the records parsed so far, for a while
+        :param budget: (optional) time to spend, in seconds; None to wait for the whole file
+        :return: True once every record was stored
+        """
+        loader = self.loader
+        if loader is None:
+            return True
+
+        try:
+            started = time.perf_counter()
+            while budget is None or time.perf_counter() - started < budget:
+                try:
+                    chunk = loader.chunks.get(block=budget is None)
+                except queue.Empty:
+                    return False
+                if chunk is None:
+                    return True
+                self.storage.add_loaded(chunk)
+            return False
+        finally:
+            # the records live as long as the app: out of the full collections, whose pauses grow with the history
+            gc.freeze()
+
+    def load_waiting(self):
+        """
+        Tells whether parsed records wait to be stored (else load_step would only wait for the worker)
+        """
+        return self.loader is not None and not self.loader.chunks.empty()
+
+    def load_progress(self):
+        return self.loader.progress() if self.loader is not None else 1.0
+
+    def finish_load(self):
+        """
+        Ends a load in steps, once load_step returned True; the stats are left to fill_stats,
+        so that the first page can be shown before
+        :return: parse report of the history file
+        """
+        loader, self.loader = self.loader, None
+        if loader is None:
+            return self.storage.finish_load()
+        return self.storage.finish_load(loader.report, loader.columns)
+
+    def cancel_load(self):
+        """
+        Stops a load in steps (ex. when closing): the storage keeps the records stored so far
+        """
+        if self.loader is not None:
+            self.loader.cancel()
+            self.loader = None
+
+    def fill_stats(self):
+        self.storage.fill_stats(self.stats)
+
+    def get(self, rid):
+        return self.storage.get(rid)
+
+    def count(self, category):
+        return self.storage.count(category)
+
+    def category_names(self):
+        return self.storage.category_names()
+
+    def format_line(self, record):
+        return self.record_format.format_line(record)
+
+    def record_values(self, record):
+        return self.record_format.values(record)
+
+    def is_duplicate(self, record):
+        """
+        Looks a record up in the storage's index, for formats that reject duplicates
+        :param record: the record to be checked for duplicates
+        :return: True if record is a rejected duplicate, False otherwise
+        """
+        return self.record_format.unique and self.storage.contains(record)
+
+    def accepts(self, record, categories):
+        """
+        Tells whether an imported record can be added (not a duplicate, and in a known category)
+        :param categories: known categories
+        """
+        return (not self.is_duplicate(record)
+                and (not self.record_format.uses_categories or record.category in categories))
+
+    def add(self, record):
+        """
+        Stores a record, keeping stats and indexes up to date
+        :return: the record's id
+        """
+        rid = self.storage.add(record)
+        self._added(rid, record)
+        return rid
+
+    def _added(self, rid, record):
+        self.stats.add(record)
+        if self.search is not None:
+            self.search.add(rid, record)
+        elif self.search_build is not None:
+            # the storage changed under the records being indexed
+            self.start_search_build()
+
+    def delete(self, rid):
+        """
+        Deletes a record, keeping stats and indexes up to date
+        :return: the deleted record
+        """
+        record = self.storage.delete(rid)
+        self._removed(rid, record)
+        return record
+
+    def _removed(self, rid, record):
+        self.stats.remove(record)
+        if self.search is not None:
+            self.search.remove(rid, record)
+        elif self.search_build is not None:
+            self.start_search_build()
+
+    def sync(self):
+        """
+        Takes in the records other instances of the app added or deleted, keeping stats and indexes up to date
+        :return: list of (op, id, record) changes, or None if the history was read again whole
+            (the indexes are then dropped, to be built again)
+        """
+        changes = self.storage.sync()
+        if changes is None:
+            self.fill_stats()
+            self.search = None
+            self.search_build = None
+            return None
+
+        for op, rid, record in changes:
+            if op == Journal.ADD:
+                self._added(rid, record)
+            else:
+                self._removed(rid, record)
+        return changes
+
+    def page(self, category, offset, limit, search_filter=None):
+        """
+        Fetches a slice of a category's records, or of the records meeting a filter
+        :param category: category (None for histories without categories), ignored with a filter
+        :param search_filter: (optional) SearchFilter, only once the indexes are built
+        :return: iterator of (id, record)
+        """
+        if search_filter is not None:
+            return itertools.islice(self.search.matches(search_filter), offset, offset + limit)
+        return self.storage.query(category, offset, limit)
+
+    def start_search_build(self):
+        """
+        (Re)starts indexing every record for filtering, continued by search_step
+        """
+        self.search_build = SearchIndex(), iter(self.storage.records())
+
+    def search_step(self, budget):
+        """
+        Indexes records for a while
+        :param budget: time to spend, in seconds
+        :return: True once the indexes are built
+        """
+        index, records = self.search_build
+        started = time.perf_counter()
+
+        for i, (rid, record) in enumerate(records):
+            index.add(rid, record)
+            if i % 256 == 255 and time.perf_counter() - started >= budget:
+                return False
+
+        self.search = index
+        self.search_build = None
+        return True
+
+    def export(self, filename):
+        """
+        Writes every record to a text file, after taking in the changes of other instances,
+        so that rewriting a shared history file doesn't drop them
+        :return: changes taken in, as returned by sync
+        """
+        with self.storage.locked():
+            changes = self.sync()
+            self.storage.export(filename)
+        return changes
+
+    def batched(self):
+        return self.storage.batched()
+
+    def flush(self):
+        self.storage.flush()
+
+    def close(self):
+        self.storage.close()
@@ -0,0 +1,85 @@
+import os
+import queue
+import threading
+from record_formats import LineScanner, ParseReport, map_file
+
+
+class ImportWorker:
+    # bytes matched per regex call: each call holds the GIL throughout, which the UI thread then waits for
+    block_size = 1 << 16
+
+    def __init__(self, f, record_format, chunk_size=1000, max_chunks=8, columns=None):
+        """
+        Parses a history file on a background thread, handing records over in chunks
+        The chunk queue is bounded, so a fast parser waits for the UI instead of filling memory
+        :param f: history file open in binary mode (closed by the worker when it's done)
+        :param record_format: format of the file's lines
+        :param chunk_size: number of records per chunk
+        :param max_chunks: number of parsed chunks that may wait in the queue
+        :param columns: (optional) RecordColumns the worker also appends every record to (read them once it's done)
+        """
+        self.file = f
+        self.record_format = record_format
+        self.chunk_size = chunk_size
+        self.columns = columns
+        self.size = os.fstat(f.fileno()).st_size
+
+        # chunks of records, then None once the whole file was parsed
+        self.chunks = queue.Queue(maxsize=max_chunks)
+        self.report = ParseReport()
+        # memory map scanned by the worker, set once it started
+        self.scanner = None
+        self.canceled = threading.Event()
+
+        self.thread = threading.Thread(target=self._run, name='history-import', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.canceled.set()
+
+    def progress(self):
+        """
+        Returns how much of the file was parsed
+        :return: fraction between 0 and 1
+        """
+        if not self.size:
+            return 1.0
+        scanner = self.scanner
+        return min(1.0, scanner.pos / self.size) if scanner else 0.0
+
+    def _put(self, item):
+        # wait for room in the queue, unless the import gets canceled meanwhile
+        while not self.canceled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _run(self):
+        buf = b''
+        try:
+            buf = map_file(self.file)
+            self.scanner = LineScanner(buf, self.record_format, self.report)
+            self.scanner.block_size = self.block_size
+            chunk = []
+            records = self.scanner.records()
+            if self.columns is not None:
+                records = self.columns.collect(records)
+            for record in records:
+                chunk.append(record)
+                if len(chunk) >= self.chunk_size:
+                    self._put(chunk)
+                    chunk = []
+                    if self.canceled.is_set():
+                        return
+
+            if chunk:
+                self._put(chunk)
+        finally:
+            if buf:
+                buf.close()
+            self.file.close()
+            self._put(None)
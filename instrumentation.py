@@ -0,0 +1,174 @@
+import bisect
+import functools
+import json
+import os
+import time
+
+# instrumentation stays off unless one of these is set; when it's off the hooks below are never installed,
+# so the instrumented code runs exactly as if they didn't exist
+# STOPWATCH_INSTRUMENT: JSON Lines file to which the histograms are appended periodically
+DUMP_FILE = os.environ.get('STOPWATCH_INSTRUMENT')
+# STOPWATCH_INSTRUMENT_OVERLAY=1: show live numbers over the window
+OVERLAY = os.environ.get('STOPWATCH_INSTRUMENT_OVERLAY') == '1'
+ENABLED = bool(DUMP_FILE or OVERLAY)
+
+# time covered by each line of the dump
+DUMP_INTERVAL_MS = 60000
+
+
+class Histogram:
+    # upper bounds of the buckets in milliseconds, the last bucket takes everything above
+    bounds = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+    def __init__(self):
+        """
+        Distribution of durations in fixed buckets, so that adding a sample is O(1) and memory stays constant
+        """
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p):
+        """
+        Returns the upper bound of the bucket holding a percentile (the maximum for the last bucket)
+        :param p: percentile, between 0 and 100
+        :return: milliseconds
+        """
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return self.max
+
+    def to_json(self):
+        return {'count': self.count, 'mean_ms': round(self.total / self.count, 3) if self.count else 0,
+                'p50_ms': round(self.percentile(50), 3), 'p99_ms': round(self.percentile(99), 3),
+                'max_ms': round(self.max, 3),
+                'buckets': [[bound, count] for bound, count in zip(self.bounds + (None,), self.counts) if count]}
+
+
+class Instruments:
+    def __init__(self):
+        """
+        Histograms of callback lateness (how long after its due time a callback ran)
+        and of handler duration (how long a handler blocked the Tk thread), by name
+        """
+        self.lateness = {}
+        self.duration = {}
+        self.started = time.time()
+
+    def record_lateness(self, name, seconds):
+        histogram = self.lateness.get(name)
+        if histogram is None:
+            histogram = self.lateness[name] = Histogram()
+        histogram.add(max(0.0, seconds) * 1000)
+
+    def record_duration(self, name, seconds):
+        histogram = self.duration.get(name)
+        if histogram is None:
+            histogram = self.duration[name] = Histogram()
+        histogram.add(seconds * 1000)
+
+    def snapshot(self):
+        """
+        Returns every histogram since the last reset, as one JSON-compatible entry
+        """
+        return {'start': self.started, 'end': time.time(),
+                'lateness': {name: histogram.to_json() for name, histogram in self.lateness.items()},
+                'duration': {name: histogram.to_json() for name, histogram in self.duration.items()}}
+
+    def reset(self):
+        self.lateness.clear()
+        self.duration.clear()
+        self.started = time.time()
+
+
+instruments = Instruments()
+
+
+def timed(func):
+    """
+    Decorator measuring how long a handler runs, named after the function (ex. 'Timer.update_photo')
+    Returns the function itself when instrumentation is off
+    """
+    if not ENABLED:
+        return func
+
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            instruments.record_duration(name, time.perf_counter() - started)
+
+    return wrapper
+
+
+def dump():
+    """
+    Appends the histograms of the current interval to the dump file, then starts a new interval
+    """
+    if DUMP_FILE:
+        with open(DUMP_FILE, 'a') as f:
+            f.write(json.dumps(instruments.snapshot()) + '\n')
+    instruments.reset()
+
+
+class Overlay:
+    def __init__(self, overlay_root, refresh_ms=1000):
+        """
+        Small label in a corner of the window showing tick lateness and the slowest handler
+        :param overlay_root: window on which to draw
+        :param refresh_ms: delay between updates
+        """
+        import tkinter as tk
+
+        self.root = overlay_root
+        self.refresh_ms = refresh_ms
+        self.label = tk.Label(overlay_root, font=('Courier', 8), bg='#ffd', justify=tk.LEFT)
+        self.label.place(relx=1.0, rely=1.0, anchor='se')
+        self.refresh()
+
+    def refresh(self):
+        lines = []
+        for name, histogram in instruments.lateness.items():
+            lines.append(f'{name} late p99 {histogram.percentile(99):.1f} max {histogram.max:.1f} ms')
+        if instruments.duration:
+            name, histogram = max(instruments.duration.items(), key=lambda item: item[1].max)
+            lines.append(f'slowest {name} {histogram.max:.1f} ms')
+
+        self.label.configure(text='\n'.join(lines) or 'no samples yet')
+        self.label.lift()
+        self.root.after(self.refresh_ms, self.refresh)
+
+
+def install(inst_root):
+    """
+    Starts the periodic dump and the overlay, if instrumentation is on
+    :param inst_root: tk root of the app
+    """
+    if not ENABLED:
+        return
+
+    if OVERLAY:
+        Overlay(inst_root)
+
+    if DUMP_FILE:
+        def periodic_dump():
+            dump()
+            inst_root.after(DUMP_INTERVAL_MS, periodic_dump)
+
+        inst_root.after(DUMP_INTERVAL_MS, periodic_dump)
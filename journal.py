@@ -0,0 +1,303 @@
+import contextlib
+import os
+import threading
+from collections import Counter
+from file_lock import FileLock
+
+
+def file_stamp(filename):
+    """
+    Returns what tells a file's versions apart (identity, size and modification time)
+    :return: tuple, or None if the file doesn't exist
+    """
+    try:
+        st = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class Journal:
+    # entry prefixes: a line added to the history, or a tombstone deleting one
+    ADD = '+'
+    DELETE = '-'
+
+    def __init__(self, filename, batch_size=64):
+        """
+        Append-only journal of the changes made to a history file
+        Changes are buffered and written (then fsynced) in batches; the history file itself is only
+        rewritten by compaction, which folds the journal into it on a background thread
+        Several instances of the app may share the files: every write holds a lock file, and each instance
+        remembers how far it read them, so that it only reads the entries appended by the others
+        :param filename: history file the journal belongs to
+        :param batch_size: number of buffered entries that triggers a write
+        """
+        self.filename = filename
+        self.journal_file = filename + '.journal'
+        # journal set aside for compaction, while new entries go to a fresh journal
+        self.compacting_file = filename + '.journal.old'
+        self.batch_size = batch_size
+
+        self.pending = []
+        self.compaction = None
+
+        self.lock = FileLock(filename + '.lock')
+        # held for a whole compaction, so only one runs at a time; the main lock is only held to set
+        # the journal aside and to swap the files, so writers don't wait for the fold
+        self.compaction_lock = FileLock(filename + '.compact.lock')
+        # what this instance read of the shared files: the history file's stamp,
+        # and the journal's identity and size (None and 0 while there is no journal)
+        self.stamp = None
+        self.journal_id = None
+        self.offset = 0
+        # byte ranges this instance appended after entries of other instances it didn't read yet
+        self.own = []
+        # depth of nested batch() blocks, which hold the buffered entries until they end
+        self.batching = 0
+
+    def add(self, line):
+        self._append(self.ADD, line)
+
+    def delete(self, line):
+        self._append(self.DELETE, line)
+
+    def _append(self, op, line):
+        self.pending.append(op + line)
+        if len(self.pending) >= self.batch_size and not self.batching:
+            self.flush()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Holds the entries appended meanwhile, so that they're written in at most one append and fsync when it ends
+        Less than batch_size entries are left buffered, as usual
+        """
+        self.batching += 1
+        try:
+            yield
+        finally:
+            self.batching -= 1
+            if len(self.pending) >= self.batch_size and not self.batching:
+                self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered entries in one append and one fsync
+        """
+        if not self.pending:
+            return
+
+        with self.lock:
+            with open(self.journal_file, 'ab') as f:
+                start = f.seek(0, os.SEEK_END)
+                f.write(''.join(self.pending).encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+                end = f.tell()
+                journal_id = os.fstat(f.fileno()).st_ino
+
+            if self.journal_id is None and self.offset == 0:
+                self.journal_id = journal_id
+            if journal_id == self.journal_id:
+                # entries this instance wrote itself are not read back
+                if start == self.offset:
+                    self.offset = end
+                else:
+                    self.own.append((start, end))
+
+        self.pending.clear()
+
+    def mark_read(self):
+        """
+        Records that this instance read the history file and the journal as they are now (under the lock)
+        """
+        self.stamp = file_stamp(self.filename)
+        journal = file_stamp(self.journal_file)
+        self.journal_id = journal[0] if journal else None
+        self.offset = journal[1] if journal else 0
+        self.own.clear()
+
+    def is_current(self):
+        """
+        Tells whether nobody else changed the files since this instance last read them (under the lock)
+        """
+        if file_stamp(self.filename) != self.stamp or self.own:
+            return False
+
+        journal = file_stamp(self.journal_file)
+        if journal is None:
+            return self.journal_id is None
+        return journal[:2] == (self.journal_id, self.offset)
+
+    def read_appended(self):
+        """
+        Reads the entries other instances appended to the journal since this instance last read it (under the lock)
+        :return: list of (op, line) pairs, or None if the files were rewritten meanwhile (they must be read whole)
+        """
+        if file_stamp(self.filename) != self.stamp:
+            return None
+
+        journal = file_stamp(self.journal_file)
+        if journal is None:
+            return [] if self.journal_id is None else None
+        journal_id, size = journal[:2]
+        if self.journal_id not in (None, journal_id) or size < self.offset:
+            return None
+        if size == self.offset:
+            return []
+
+        with open(self.journal_file, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+
+        # skip the ranges written by this instance
+        chunks = []
+        position = self.offset
+        for start, end in self.own:
+            chunks.append(data[position - self.offset:start - self.offset])
+            position = end
+        chunks.append(data[position - self.offset:])
+
+        self.journal_id = journal_id
+        self.offset = size
+        self.own.clear()
+
+        entries = []
+        for entry in b''.join(chunks).decode('utf-8').splitlines(keepends=True):
+            if entry[:1] in (self.ADD, self.DELETE):
+                entries.append((entry[0], entry[1:]))
+        return entries
+
+    def entries(self):
+        """
+        Reads the journaled entries, oldest first (including a journal left over by an interrupted compaction)
+        :return: iterator of (op, line) pairs, where line keeps its line break
+        """
+        for filename in (self.compacting_file, self.journal_file):
+            try:
+                with open(filename, 'r') as f:
+                    for entry in f:
+                        if entry[:1] in (self.ADD, self.DELETE):
+                            yield entry[0], entry[1:]
+            except FileNotFoundError:
+                pass
+
+    def has_entries(self):
+        return any(os.path.exists(filename) for filename in (self.compacting_file, self.journal_file))
+
+    def compact(self):
+        """
+        Folds the journal into the history file on a background thread
+        The current journal is set aside first, so changes made meanwhile go to a fresh journal
+        """
+        if self.compaction is not None and self.compaction.is_alive():
+            return
+
+        self.flush()
+
+        self.compaction = threading.Thread(target=self._compact, name='journal-compaction', daemon=True)
+        self.compaction.start()
+
+    def _compact(self):
+        # another compaction is running (here or in another instance): leave it the work
+        if not self.compaction_lock.acquire(blocking=False):
+            return
+
+        try:
+            with self.lock:
+                # entries of other instances not read yet would be folded out of reach: leave them for later
+                if not self.is_current():
+                    return
+
+                if not os.path.exists(self.compacting_file):
+                    if not os.path.exists(self.journal_file):
+                        return
+                    os.replace(self.journal_file, self.compacting_file)
+                    # what was read of the journal set aside is in the fold, new entries go to a fresh journal
+                    self.journal_id = None
+                    self.offset = 0
+                stamp = self.stamp
+
+            tmp_file = self._fold()
+
+            with self.lock:
+                # another instance rewrote the history file meanwhile, with the journaled changes
+                if file_stamp(self.filename) != stamp or not os.path.exists(self.compacting_file):
+                    os.remove(tmp_file)
+                    return
+
+                os.replace(tmp_file, self.filename)
+                os.remove(self.compacting_file)
+                self.stamp = file_stamp(self.filename)
+        finally:
+            self.compaction_lock.release()
+
+    def _fold(self):
+        """
+        Writes the history file with the journal set aside folded in, to a temporary file
+        :return: temporary file
+        """
+        # net effect of the journal on each line (several records may share the same line)
+        net = Counter()
+        with open(self.compacting_file, 'r') as f:
+            for entry in f:
+                if entry[:1] == self.ADD:
+                    net[entry[1:]] += 1
+                elif entry[:1] == self.DELETE:
+                    net[entry[1:]] -= 1
+
+        # stream the history file into a new one, skipping deleted lines and appending added ones
+        tmp_file = self.filename + '.tmp'
+        with open(tmp_file, 'w') as out:
+            try:
+                with open(self.filename, 'r') as f:
+                    for line in f:
+                        if not line.endswith('\n'):
+                            line += '\n'
+                        if net[line] < 0:
+                            net[line] += 1
+                            continue
+                        out.write(line)
+            except FileNotFoundError:
+                pass
+
+            for line, count in net.items():
+                if count > 0:
+                    out.write(line * count)
+
+            out.flush()
+            os.fsync(out.fileno())
+
+        return tmp_file
+
+    def fold(self):
+        """
+        Folds every journaled change into the history file right away, on the calling thread
+        Unlike compact, it doesn't depend on what this instance read of the files, as it's meant for tools
+        working on them without loading them (ex. the command-line mode)
+        """
+        self.flush()
+        with self.compaction_lock, self.lock:
+            # an interrupted compaction may have left two journals, each pass folds one
+            while self.has_entries():
+                self.mark_read()
+                self._compact()
+
+    def wait(self):
+        if self.compaction is not None:
+            self.compaction.join()
+
+    def reset(self):
+        """
+        Drops every journaled change, once the history file was fully rewritten with them
+        """
+        self.wait()
+        self.pending.clear()
+
+        with self.lock:
+            for filename in (self.compacting_file, self.journal_file):
+                try:
+                    os.remove(filename)
+                except FileNotFoundError:
+                    pass
+            self.mark_read()
@@ -0,0 +1,88 @@
+import tkinter as tk
+
+
+def format_lap(seconds):
+    """
+    Formats a lap or split time to the hundredth of a second
+    :param seconds: time in seconds
+    :return: mm:ss.cc (h:mm:ss.cc from an hour on)
+    """
+    centis = round(seconds * 100)
+    minutes, centis = divmod(centis, 6000)
+    hours, minutes = divmod(minutes, 60)
+    text = f'{minutes:02}:{centis // 100:02}.{centis % 100:02}'
+    return f'{hours}:{text}' if hours else text
+
+
+class LapList:
+    # rows drawn at once: the listbox only ever holds these, whatever the number of laps
+    rows = 5
+
+    def __init__(self, list_root, laps):
+        """
+        Scrollable list of laps (newest first) with the shortest, longest and mean lap
+        Only the visible rows are inserted in the listbox, scrolling redraws them from the lap buffer
+        :param list_root: tk widget in which to put the list
+        :param laps: LapBuffer to be shown
+        """
+        self.laps = laps
+        # index of the first row shown, counted from the newest lap
+        self.offset = 0
+
+        self.stats_label = tk.Label(list_root, font=('Courier', 9))
+        self.stats_label.grid(row=0, column=0, columnspan=2)
+        self.listbox = tk.Listbox(list_root, height=self.rows, width=32, font=('Courier', 10), activestyle='none')
+        self.listbox.grid(row=1, column=0)
+        self.scrollbar = tk.Scrollbar(list_root, orient=tk.VERTICAL, command=self.scroll)
+        self.scrollbar.grid(row=1, column=1, sticky='ns')
+
+        # the listbox holds a single screen of rows, so it can't scroll by itself
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.listbox.bind(sequence, self.wheel)
+
+        self.refresh()
+
+    def scroll(self, action, amount, unit=None):
+        """
+        Scrollbar command
+        :param action: 'moveto' (amount is a fraction of the list) or 'scroll' (amount is a count of units or pages)
+        """
+        if action == 'moveto':
+            self.show(round(float(amount) * len(self.laps)))
+        else:
+            self.show(self.offset + int(amount) * (self.rows if unit == 'pages' else 1))
+
+    def wheel(self, e):
+        # X11 sends buttons 4 and 5, other platforms a delta
+        self.show(self.offset + (-1 if e.num == 4 or e.delta > 0 else 1))
+        return 'break'
+
+    def show(self, offset):
+        """
+        Scrolls the list
+        :param offset: index of the first row to be shown (0 for the newest lap)
+        """
+        self.offset = offset
+        self.refresh()
+
+    def refresh(self):
+        """
+        Redraws the visible rows and the stats (ex. after a lap was taken)
+        """
+        laps = self.laps
+        count = len(laps)
+        self.offset = max(0, min(self.offset, count - self.rows))
+
+        self.listbox.delete(0, tk.END)
+        newest = count - 1 - self.offset
+        for index in range(newest, max(-1, newest - self.rows), -1):
+            self.listbox.insert(tk.END, f'{index + 1:>5} {format_lap(laps.lap(index)):>12} '
+                                        f'{format_lap(laps.splits[index]):>12}')
+
+        if count:
+            self.scrollbar.set(self.offset / count, min(1.0, (self.offset + self.rows) / count))
+            self.stats_label.configure(text=f'min {format_lap(laps.shortest)}  max {format_lap(laps.longest)}  '
+                                            f'mean {format_lap(laps.mean())}')
+        else:
+            self.scrollbar.set(0.0, 1.0)
+            self.stats_label.configure(text='no laps')
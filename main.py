@@ -1,72 +1,242 @@
 import glob
+import instrumentation
+import multiprocessing
+import os
+import sys
+import time
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk
-from history import StopWatchHistory, PomodoroHistory
+from checkpoint import CHECKPOINT_FILE, Checkpoint
 from main_timers import StopWatch, PomodoroTimer
+from photo_cache import PhotoCache, PhotoLoader
+from scheduler import TickScheduler
+
+# when set, the app writes the time of its first paint to this file and exits (used by benchmarks.py)
+STARTUP_PROBE = 'STOPWATCH_STARTUP_PROBE'
+# photos shown by the timers, named <category>_*
+PHOTO_DIR = 'super_secret_pictures'
 
 
 class MainApp:
-    def __init__(self, main_root):
+    # delay after startup before the history files start loading in the background (in ms)
+    history_preload_ms = 500
+
+    def __init__(self, main_root, checkpoint_file=CHECKPOINT_FILE, photo_dir=PHOTO_DIR, history_dir=''):
         """
         Initializes main stopwatch app
         :param main_root: the root in which to display the app
+        :param checkpoint_file: (optional) file the timer states are checkpointed to
+        :param photo_dir: (optional) directory of the photos
+        :param history_dir: (optional) directory of the history files (the working directory by default)
         """
         self.root = main_root
+        self.history_dir = history_dir
         self.photos = {}
         self.photo_categories = ['work', 'break']
         for cat in self.photo_categories:
-            self.photos[cat] = glob.glob(f'super_secret_pictures/{cat}_*.*')
+            self.photos[cat] = glob.glob(os.path.join(photo_dir, f'{cat}_*.*'))
 
-        # two tabs - stopwatch and history
+        # timer and history tabs, plus a summary of both histories
         self.tab_control = ttk.Notebook(main_root)
         self.tab1 = ttk.Frame(self.tab_control)
         self.tab2 = ttk.Frame(self.tab_control)
         self.tab3 = ttk.Frame(self.tab_control)
         self.tab4 = ttk.Frame(self.tab_control)
+        self.tab5 = ttk.Frame(self.tab_control)
 
         self.tab_control.add(self.tab1, text='Stopwatch')
         self.tab_control.add(self.tab2, text='S. History')
         self.tab_control.add(self.tab3, text='Pomodoro')
         self.tab_control.add(self.tab4, text='P. History')
+        self.tab_control.add(self.tab5, text='Stats')
         self.tab_control.pack()
 
-        self.stopwatch_history = StopWatchHistory(self.tab2, self.photos)
-        self.stopwatch = StopWatch(self.tab1, self.stopwatch_history, self.photos)
-        self.pomodoro_history = PomodoroHistory(self.tab4, self.photos)
-        self.pomodoro = PomodoroTimer(self.tab3, self.pomodoro_history, self.photos)
+        # one scheduler drives every timer, so running timers share a single wakeup per second
+        self.scheduler = TickScheduler(main_root)
+        # photos are decoded in the background and shared by both timers
+        self.photo_cache = PhotoCache()
+        self.photo_loader = PhotoLoader(main_root, self.photo_cache)
+
+        # timer states are checkpointed when they change, so that a session in progress survives a crash
+        self.checkpoint = Checkpoint(main_root, checkpoint_file)
+        restored = self.checkpoint.read()
+
+        # only the stopwatch is shown at startup, the other tabs are built when first needed;
+        # the history files load in steps soon after the first paint, so opening a history or saving never waits
+        self.stopwatch = StopWatch(self.tab1, self.get_stopwatch_history, self.photos, self.photo_loader,
+                                   self.scheduler, self.checkpoint.request)
+        self.stopwatch_history = None
+        self.pomodoro = None
+        self.pomodoro_history = None
+        self.stats_tab = None
+        self.tab_builders = {str(self.tab2): self.get_stopwatch_history, str(self.tab3): self.get_pomodoro,
+                             str(self.tab4): self.get_pomodoro_history, str(self.tab5): self.get_stats_tab}
+        self.tab_control.bind('<<NotebookTabChanged>>', self.tab_changed)
+        for tab in (self.tab2, self.tab4):
+            tab.bind('<<HistoryLoaded>>', self.history_loaded)
+        self.preload_id = main_root.after(self.history_preload_ms, self.preload_histories)
+        # timers are only redrawn while their tab is selected and the window isn't minimized
+        self.window_shown = True
+        main_root.bind('<Map>', self.window_mapped)
+        main_root.bind('<Unmap>', self.window_unmapped)
+
+        # resume the timers of the last session (before the first paint), including the time it was down;
+        # a pomodoro is only built now if it was running, else its state waits for its tab
+        self.restored_pomodoro = restored.get('pomodoro')
+        if 'stopwatch' in restored:
+            self.stopwatch.restore(restored['stopwatch'])
+        if self.restored_pomodoro is not None and self.restored_pomodoro['running']:
+            self.get_pomodoro()
+            self.update_visibility()
+        self.checkpoint.add('stopwatch', self.stopwatch.core.snapshot)
+        self.checkpoint.add('pomodoro', self.pomodoro_state)
+
+        # histograms of tick lateness and handler durations, when turned on by environment variables
+        instrumentation.install(main_root)
 
         main_root.protocol("WM_DELETE_WINDOW", self.close_app)
 
+    def get_stopwatch_history(self):
+        """
+        Returns the stopwatch history, loading its file the first time
+        """
+        if self.stopwatch_history is None:
+            from history import StopWatchHistory
+            self.stopwatch_history = StopWatchHistory(self.tab2, self.photos,
+                                                      os.path.join(self.history_dir, 'stopwatch_history.txt'))
+        return self.stopwatch_history
+
+    def get_pomodoro_history(self):
+        """
+        Returns the pomodoro history, loading its file the first time
+        """
+        if self.pomodoro_history is None:
+            from history import PomodoroHistory
+            self.pomodoro_history = PomodoroHistory(self.tab4, self.photos,
+                                                    os.path.join(self.history_dir, 'pomodoro_history.txt'))
+        return self.pomodoro_history
+
+    def preload_histories(self):
+        """
+        Starts loading both history files, each in steps between the app's events
+        """
+        self.preload_id = None
+        self.get_stopwatch_history()
+        self.get_pomodoro_history()
+
+    def history_loaded(self, _):
+        # the stats shown may have been read while the histories were still loading
+        if self.stats_tab is not None and self.tab_control.select() == str(self.tab5):
+            self.stats_tab.refresh()
+
+    def get_pomodoro(self):
+        if self.pomodoro is None:
+            self.pomodoro = PomodoroTimer(self.tab3, self.get_pomodoro_history, self.photos, self.photo_loader,
+                                          self.scheduler, self.checkpoint.request)
+            if self.restored_pomodoro is not None:
+                self.pomodoro.restore(self.restored_pomodoro)
+                self.restored_pomodoro = None
+        return self.pomodoro
+
+    def pomodoro_state(self):
+        # a pomodoro not built yet keeps the state it was restored with
+        if self.pomodoro is None:
+            return self.restored_pomodoro
+        return self.pomodoro.core.snapshot()
+
+    def get_stats_tab(self):
+        """
+        Returns the stats tab, which needs both histories
+        """
+        if self.stats_tab is None:
+            from stats_tab import StatsTab
+            self.stats_tab = StatsTab(self.tab5, self.get_stopwatch_history(), self.get_pomodoro_history())
+        return self.stats_tab
+
+    def tab_changed(self, _):
+        selected = self.tab_control.select()
+        if selected in self.tab_builders:
+            self.tab_builders[selected]()
+        self.update_visibility()
+        # keys go to the focused widget: the timer shown takes the focus, for its shortcuts (ex. laps)
+        if selected in (str(self.tab1), str(self.tab3)):
+            self.tab_control.nametowidget(selected).focus_set()
+        # stats are only read when their tab is shown
+        if selected == str(self.tab5):
+            self.stats_tab.refresh()
+
+    def window_mapped(self, e):
+        # the binding also receives the events of every widget in the window
+        if e.widget is self.root:
+            self.window_shown = True
+            self.update_visibility()
+
+    def window_unmapped(self, e):
+        if e.widget is self.root:
+            self.window_shown = False
+            self.update_visibility()
+
+    def update_visibility(self):
+        """
+        Tells each timer whether it can be seen
+        """
+        selected = self.tab_control.select()
+        self.stopwatch.set_visible(self.window_shown and selected == str(self.tab1))
+        if self.pomodoro is not None:
+            self.pomodoro.set_visible(self.window_shown and selected == str(self.tab3))
+
     def close_app(self):
         """
         Called when the user presses the 'X' button
-        Pauses stopwatch and pomodoro, asks confirmation for closing and saving records
+        Pauses stopwatch and pomodoro, asks confirmation for closing and writes the last stored records
         """
         self.stopwatch.pause()
-        self.pomodoro.pause()
+        if self.pomodoro is not None:
+            self.pomodoro.pause()
         sure_close = messagebox.askyesno(title="Close", message="Are you sure you want to close this application?")
         if sure_close:
-            if self.stopwatch_history.record_count() > 0:
-                save_stopwatch = messagebox.askyesno(title="Save", message="Would you like to save "
-                                                                           "your stopwatch records?")
-                if save_stopwatch:
-                    self.stopwatch_history.save_records(show_error=False, filename=self.stopwatch_history.init_file)
-
-            if self.pomodoro_history.record_count() > 0:
-                save_pomodoro = messagebox.askyesno(title="Save Pomodoro", message="Would you like to save "
-                                                                                   "your pomodoro records?")
-                if save_pomodoro:
-                    self.pomodoro_history.save_records(show_error=False, filename=self.pomodoro_history.init_file)
+            if self.preload_id is not None:
+                self.root.after_cancel(self.preload_id)
+            # records are stored as they are added or deleted, only the last batch is still buffered
+            for history in (self.stopwatch_history, self.pomodoro_history):
+                if history is not None:
+                    history.close_storage()
+
+            # the timers were closed normally, the next session starts afresh
+            self.checkpoint.remove()
 
+            if instrumentation.ENABLED:
+                instrumentation.dump()
+            self.photo_loader.shutdown()
             self.root.destroy()
 
 
 if __name__ == '__main__':
+    # in the frozen app, the worker processes of the command-line mode start here too and must not run it
+    multiprocessing.freeze_support()
+
+    if len(sys.argv) > 1:
+        # batch operations on history files, without opening a window
+        from cli import main
+        sys.exit(main(sys.argv[1:]))
+
     root = tk.Tk()
-    root.geometry('310x480')
+    root.geometry('310x620')
     root.title('Stopwatch')
     root.resizable(False, False)
 
     app = MainApp(root)
+
+    probe_file = os.environ.get(STARTUP_PROBE)
+    if probe_file:
+        # time to first paint: the window is mapped and its pending redraws are done
+        root.wait_visibility()
+        root.update_idletasks()
+        with open(probe_file, 'w') as f:
+            f.write(repr(time.time()))
+        app.photo_loader.shutdown()
+        root.destroy()
+        sys.exit()
+
     root.mainloop()
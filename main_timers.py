@@ -1,27 +1,45 @@
 import random
 import tkinter as tk
-from datetime import date
 from tkinter import messagebox
-from PIL import ImageTk, Image
 from dialog_boxes import LabelDialog
+from instrumentation import timed
+from lap_list import LapList
+from photo_cache import PHOTO_SIZE
+from timer_core import StopWatchCore, PomodoroCore
 
 
 class Timer:
-    def __init__(self, timer_root, history, photos, init_seconds):
+    def __init__(self, timer_root, get_history, photos, photo_loader, scheduler, core, on_change=None):
+        """
+        Tk view of a timer: widgets, photos and scheduling around a TimerCore, which holds the timer's state
+        :param get_history: function returning the history in which to store records (built on first use)
+        :param core: timer state machine
+        :param on_change: (optional) called when the timer changes state (ex. to checkpoint it)
+        """
         self.timer_root = timer_root
-        self.history = history
+        self.core = core
+        self.on_change = on_change
+        self.get_history = get_history
         self.photos = photos
-        self.init_photo = self.get_photo('break')
+        self.photo_loader = photo_loader
+        self.scheduler = scheduler
+
+        # photo picked ahead of time for each category, decoded in the background before it's needed
+        self.next_photos = {}
+        self.shown_photo = None
 
+        # the label is only drawn while the timer is shown (its tab selected, the window not minimized),
+        # and only when its text changed; time keeps being read from the clock either way
+        self.visible = True
+        self.shown_label = self.get_label()
+
+        # blank placeholder keeps the layout stable until the first photo is decoded
+        self.init_photo = tk.PhotoImage(width=PHOTO_SIZE[0], height=PHOTO_SIZE[1])
         self.photo_frame = tk.Label(timer_root, image=self.init_photo)
         self.photo_frame.grid(row=0, column=0, columnspan=2, pady=5)
+        self.update_photo('break')
 
-        # id for recursive tick function
-        self.after_id = None
-
-        self.running = False
-        self.seconds = init_seconds
-        self.stopwatch_label = tk.Label(timer_root, text=self.get_label(), font=('Helvetica', 48))
+        self.stopwatch_label = tk.Label(timer_root, text=self.shown_label, font=('Helvetica', 48))
         self.stopwatch_label.grid(row=1, column=0, columnspan=2)
 
         # main stopwatch buttons - start, pause, reset, quit
@@ -41,88 +59,142 @@ class Timer:
                                      font=('Arial', 20), command=self.save)
         self.save_button.grid(row=4, column=1)
 
+        # keyboard shortcuts, by lowercase key symbol
+        self.keys = {}
         self.timer_root.bind("<Key>", self.key_pressed)
 
     def key_pressed(self, e):
-        print(e)
+        action = self.keys.get(e.keysym.lower())
+        if action is not None:
+            action()
 
-    def get_photo(self, cat):
+    def pick_photo(self, cat):
         """
-        Returns a random photo, given a category
+        Returns the path of the next photo of a category, the prefetched one if there is any
         :param cat: (no pun intended) category from which to pick photo
-        :return: photo
+        :return: photo path
         """
+        return self.next_photos.pop(cat, None) or random.choice(self.photos[cat])
 
-        random_img = Image.open(random.choice(self.photos[cat]))
-        return ImageTk.PhotoImage(random_img.resize((225, 175)))
+    def prefetch_photo(self, cat):
+        """
+        Picks the next photo of a category and has it decoded in the background
+        :param cat: category from which to pick photo
+        """
+        if cat not in self.next_photos:
+            self.next_photos[cat] = random.choice(self.photos[cat])
+            self.photo_loader.request(self.next_photos[cat])
 
+    @timed
     def update_photo(self, cat):
-        new_img = self.get_photo(cat)
-        self.photo_frame.configure(image=new_img)
-        self.photo_frame.image = new_img
+        """
+        Shows a photo of a category (right away if it was prefetched) and prefetches the next photo
+        of the other category, which is the one the following switch will need
+        :param cat: category from which to pick photo
+        """
+        self.shown_photo = self.pick_photo(cat)
+        self.photo_loader.request(self.shown_photo, self.show_photo)
+
+        for other_cat in self.photos:
+            if other_cat != cat:
+                self.prefetch_photo(other_cat)
+
+    @timed
+    def show_photo(self, path, photo):
+        # a later switch may have asked for another photo while this one was being decoded
+        if path == self.shown_photo:
+            self.photo_frame.configure(image=photo)
+            self.photo_frame.image = photo
 
     def get_label(self):
+        return self.core.get_label()
+
+    def update_label(self):
+        if not self.visible:
+            # set_visible repaints the timer once it's shown again
+            return
+
+        label = self.get_label()
+        if label != self.shown_label:
+            self.shown_label = label
+            self.stopwatch_label.configure(text=label)
+
+    def set_visible(self, visible):
         """
-        Returns a string representation of the current number of seconds
-        :return: stopwatch label
+        Called when the timer's tab or the window is shown or hidden
+        A hidden timer isn't redrawn, and is only woken for deadlines; it is repainted once shown again
+        :param visible: whether the timer can be seen
         """
-        s = self.seconds
-        # get number of hours (1h = 3600 seconds), subtract from counter
-        h = s // 3600
-        s -= (h * 3600)
-        # get number of minutes (1m = 60 seconds), subtract from counter
-        m = s // 60
-        s -= (m * 60)
+        if visible == self.visible:
+            return
 
-        # format as hh:mm:ss
-        return f'{round(h):02}:{round(m):02}:{round(s):02}'
+        self.visible = visible
+        self.scheduler.reschedule()
+        if visible:
+            self.tick()
+            self.update_label()
 
-    def update_label(self):
-        self.stopwatch_label.configure(text=self.get_label())
+    def state_changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def restore(self, state):
+        """
+        Restores a checkpointed state (before the first paint), resuming the timer if it was running
+        :param state: state returned by the core's snapshot
+        """
+        self.core.restore(state)
+        if self.core.running:
+            self.start_button.configure(state=tk.DISABLED)
+            self.update_photo('work')
+            self.scheduler.register(self)
+        self.update_label()
+
+    def tick_delay(self):
+        if self.visible:
+            return self.core.tick_delay()
+        return self.core.idle_delay()
 
     def start(self):
         """
         Starts the stopwatch. Works only if stopwatch is not running
         """
-        if not self.running:
+        if self.core.start():
             self.start_button.configure(state=tk.DISABLED)
-            self.running = True
 
-            # set timer label to current time, make it call tick function after a second
+            # set timer label to current time, let the scheduler tick it on the next second
             self.update_label()
             self.update_photo('work')
 
-            if self.after_id:
-                self.stopwatch_label.after_cancel(self.after_id)
-                self.after_id = None
-
-            self.after_id = self.stopwatch_label.after(1000, self.tick)
+            self.scheduler.register(self)
+            self.state_changed()
 
     def pause(self):
         """
         Pauses the stopwatch. Works only if stopwatch is running
         """
-        if self.running:
-            self.running = False
+        if self.core.pause():
+            self.scheduler.unregister(self)
+            self.update_label()
             self.update_photo('break')
             self.start_button.configure(state=tk.ACTIVE)
+            self.state_changed()
 
     def reset(self, init_value=0):
         """
         Resets the stopwatch's second counter to 0, starts over if stopwatch is running
         :param init_value (optional) - the number of seconds to reset to
         """
-        if self.running:
-            self.running = False
-            self.seconds = init_value
+        running = self.core.running
+        self.core.reset(init_value)
 
-            # cancels call to tick function
-            self.stopwatch_label.after_cancel(self.after_id)
-            self.after_id = None
+        if running:
+            # stops ticking until start registers the timer again
+            self.scheduler.unregister(self)
             self.start()
         else:
-            self.seconds = init_value
             self.update_label()
+            self.state_changed()
 
     # FUNCTIONS TO BE IMPLEMENTED BY INSTANCE
     def tick(self):
@@ -133,42 +205,70 @@ class Timer:
 
 
 class StopWatch(Timer):
-    def __init__(self, watch_root, hist, photos):
+    def __init__(self, watch_root, get_history, photos, photo_loader, scheduler, on_change=None):
         """
         Initializes stopwatch
         :param watch_root: tk root in which to put the elements
-        :param hist: stopwatch history in which to store records
+        :param get_history: function returning the stopwatch history in which to store records
         :param photos: dict with pictures separated by categories
+        :param photo_loader: shared background photo loader
+        :param scheduler: shared tick scheduler driving the timer
+        :param on_change: (optional) called when the stopwatch changes state
+        """
+        super().__init__(watch_root, get_history, photos, photo_loader, scheduler, StopWatchCore(), on_change)
+
+        # laps of the current run, taken with the button or the 'l' key
+        self.lap_button = tk.Button(watch_root, text='lap', width=9, bg='#567', fg='White', font=('Arial', 12),
+                                    command=self.lap)
+        self.lap_button.grid(row=2, column=0, columnspan=2, pady=3)
+        self.lap_frame = tk.Frame(watch_root)
+        self.lap_frame.grid(row=5, column=0, columnspan=2, pady=5)
+        self.lap_list = LapList(self.lap_frame, self.core.laps)
+        self.keys['l'] = self.lap
+
+    def lap(self):
+        """
+        Ends the current lap, then scrolls the lap list back to the newest one. Works only if stopwatch is running
         """
-        super().__init__(watch_root, hist, photos, 0)
+        if self.core.lap():
+            self.lap_list.show(0)
+            self.state_changed()
 
+    def reset(self, init_value=0):
+        super().reset(init_value)
+        self.lap_list.refresh()
+
+    def restore(self, state):
+        super().restore(state)
+        self.lap_list.refresh()
+
+    @timed
     def tick(self):
         """
-        Recursively ticks stopwatch every second (increments second counter, updates label)
-        Should not be called directly, as it is only called by the start function
+        Ticks stopwatch every second (recomputes second counter from the clock, updates label)
+        Should not be called directly, as it is only called by the scheduler
         """
-        if self.running:
-            self.seconds += 1
+        if self.core.running:
+            self.core.tick()
             self.update_label()
 
-            # calls function again after one second
-            self.after_id = self.stopwatch_label.after(1000, self.tick)
-
     def save(self):
         """
         Saves current timer (prompts for category) and resets
         """
         # no seconds elapsed
-        if self.seconds == 0:
+        if self.core.seconds == 0:
             messagebox.showerror(title="Empty Save", message="Cannot save record of 0 seconds!")
             return
 
         # stop if running
-        if self.running:
-            self.running = False
+        if self.core.pause():
+            self.scheduler.unregister(self)
+            self.state_changed()
 
         # prompt user for label and category
-        category_values = self.history.history_categories.keys()
+        history = self.get_history()
+        category_values = history.model.category_names()
         res = LabelDialog(self.timer_root, tuple(category_values))
         self.timer_root.wait_window(res.top)  # wait for prompt to be answered
 
@@ -185,30 +285,30 @@ class StopWatch(Timer):
         final_label = res.final_label
         final_category = res.final_category
 
-        # adds record with today's date, current timer and provided category
-        formatted_label = " | ".join([date.today().strftime("%d/%m/%Y"), self.get_label(), final_label])
-        self.history.add_record(formatted_label, final_category)
+        # adds record with today's date, current timer and provided category (resetting the stopwatch)
+        history.add_record(self.core.take_record(final_label, final_category))
         self.start_button.configure(state=tk.ACTIVE)
-        self.reset()
+        self.update_label()
+        self.lap_list.refresh()
+        self.state_changed()
 
 
 class PomodoroTimer(Timer):
-    def __init__(self, timer_root, pomodoro_hist, photos):
+    def __init__(self, timer_root, get_history, photos, photo_loader, scheduler, on_change=None):
         """
         Initializes pomodoro timer
         :param timer_root: tk root in which to put the elements
+        :param get_history: function returning the pomodoro history in which to store records
+        :param photo_loader: shared background photo loader
+        :param scheduler: shared tick scheduler driving the timer
+        :param on_change: (optional) called when the pomodoro changes state
         """
-        self.focus_seconds = 60 * 25
-        self.break_seconds = 60 * 5
-        super().__init__(timer_root, pomodoro_hist, photos, self.focus_seconds)
-        self.is_focused = True
-        self.focus_count = 0
-        self.break_count = 0
+        super().__init__(timer_root, get_history, photos, photo_loader, scheduler, PomodoroCore(), on_change)
 
         self.focus_label = tk.Label(timer_root,
-                                    text="Focus count: " + str(self.focus_count))
+                                    text="Focus count: " + str(self.core.focus_count))
         self.break_label = tk.Label(timer_root,
-                                    text="Break count: " + str(self.break_count))
+                                    text="Break count: " + str(self.core.break_count))
         self.focus_label.grid(row=2, column=0)
         self.break_label.grid(row=2, column=1)
 
@@ -216,36 +316,30 @@ class PomodoroTimer(Timer):
 
         self.save_button.configure(state=tk.DISABLED)
 
+    @timed
     def tick(self):
         """
-        Recursively ticks stopwatch every second (decrements second counter, updates label)
-        Should not be called directly, as it is only called by the start function
+        Ticks stopwatch every second (recomputes remaining seconds from the clock, updates label)
+        Should not be called directly, as it is only called by the scheduler
         """
-        if self.running:
-            self.seconds -= 1
+        if self.core.running:
+            ran_out = self.core.tick()
             self.update_label()
 
-            if self.seconds <= 0:
+            if ran_out:
                 self.timer_done()
-                return
-
-            # calls function again after one second
-            self.after_id = self.stopwatch_label.after(1000, self.tick)
 
     def timer_done(self):
         """
         When second counter hits 0, this function is called to switch from focus to break or vice-versa.
         """
-        record_label = "Break"
-        if self.is_focused:
-            record_label = "Focus"
-            self.is_focused = False
+        self.pause()
+        record = self.core.finish_period()
+        self.update_label()
 
+        if not self.core.is_focused:
+            # a focus period just ended
             self.photo_frame.configure(bg="green")
-            self.focus_count += 1
-
-            self.reset(self.break_seconds)
-            self.pause()
             start_break = messagebox.askyesno(title="Focus done",
                                               message="Great work! Would you like to start the break now?")
             if start_break:
@@ -253,29 +347,24 @@ class PomodoroTimer(Timer):
                 self.update_photo('break')
 
         else:
-            self.is_focused = True
             self.photo_frame.configure(bg="red")
-            self.break_count += 1
-            self.reset(self.focus_seconds)
-            self.pause()
             start_focus = messagebox.askyesno(title="Break done",
                                               message="Break over! Would you like to start working now?")
             if start_focus:
                 self.start()
 
         self.update_pomodoro_labels()
-        record_line = date.today().strftime("%d/%m/%Y") + " | " + record_label
-        self.history.add_record(record_line, None)
+        self.state_changed()
+        self.get_history().add_record(record)
 
-    def reset(self, init_value=0):
-        if self.is_focused:
-            super().reset(self.focus_seconds)
-        else:
-            super().reset(self.break_seconds)
+    def restore(self, state):
+        super().restore(state)
+        self.photo_frame.configure(bg="red" if self.core.is_focused else "green")
+        self.update_pomodoro_labels()
 
     def update_pomodoro_labels(self):
-        self.focus_label.configure(text="Focus count: " + str(self.focus_count))
-        self.break_label.configure(text="Break count: " + str(self.break_count))
+        self.focus_label.configure(text="Focus count: " + str(self.core.focus_count))
+        self.break_label.configure(text="Break count: " + str(self.core.break_count))
 
     def save(self):
         pass
@@ -0,0 +1,166 @@
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import timed
+
+# size at which the timers display their photos
+PHOTO_SIZE = (225, 175)
+
+
+class PhotoCache:
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        """
+        LRU cache of decoded and resized photos, keyed by path and target size
+        :param max_bytes: memory limit for the cached pixel data (4 bytes per pixel)
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, path, size=PHOTO_SIZE):
+        """
+        Returns the cached photo for a path at a given size
+        :param path: image file path
+        :param size: (width, height) the photo was resized to
+        :return: photo, or None if it hasn't been decoded yet
+        """
+        key = (path, size)
+        photo = self.entries.get(key)
+
+        if photo is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return photo
+
+    @staticmethod
+    def photo_bytes(key):
+        width, height = key[1]
+        return width * height * 4
+
+    def put(self, key, photo):
+        """
+        Stores a photo, evicting the least recently used ones until the memory limit is respected
+        :param key: (path, size) pair
+        :param photo: decoded photo
+        """
+        if key in self.entries:
+            self.total_bytes -= self.photo_bytes(key)
+            del self.entries[key]
+
+        cost = self.photo_bytes(key)
+        while self.entries and self.total_bytes + cost > self.max_bytes:
+            old_key, _ = self.entries.popitem(last=False)
+            self.total_bytes -= self.photo_bytes(old_key)
+
+        self.entries[key] = photo
+        self.total_bytes += cost
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+
+class PhotoLoader:
+    def __init__(self, loader_root, cache, max_workers=2, poll_ms=25):
+        """
+        Decodes and resizes photos in a worker pool, off the Tk thread
+        Workers only produce resized Pillow images; the main loop drains them from a queue
+        and turns them into photos, so the Tk thread never waits on image I/O
+        :param loader_root: tk widget whose event loop drains the finished photos
+        :param cache: photo cache in which to store the decoded photos
+        :param max_workers: number of decoding threads
+        :param poll_ms: interval at which the queue is drained while decodes are pending
+        """
+        self.root = loader_root
+        self.cache = cache
+        self.poll_ms = poll_ms
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='photo-loader')
+        self.results = queue.Queue()
+
+        # callbacks waiting for each (path, size) being decoded
+        self.pending = {}
+        self.after_id = None
+
+    def request(self, path, callback=None, size=PHOTO_SIZE):
+        """
+        Asks for a photo, calling back right away if it is cached and once it's decoded otherwise
+        :param path: image file path
+        :param callback: (optional) function called with (path, photo) on the Tk thread
+        :param size: (width, height) to resize to
+        """
+        key = (path, size)
+        photo = self.cache.get(path, size)
+
+        if photo is not None:
+            if callback:
+                callback(path, photo)
+            return
+
+        if key in self.pending:
+            if callback:
+                self.pending[key].append(callback)
+            return
+
+        self.pending[key] = [callback] if callback else []
+        self.executor.submit(self._decode, key)
+
+        if self.after_id is None:
+            self.after_id = self.root.after(self.poll_ms, self._drain)
+
+    def _decode(self, key):
+        """
+        Runs on a worker thread: decodes and resizes an image, handing it to the results queue
+        """
+        # Pillow is imported on first use, by a worker, so that it doesn't delay the window
+        from PIL import Image
+
+        path, size = key
+        try:
+            with Image.open(path) as img:
+                self.results.put((key, img.resize(size)))
+        except OSError:
+            self.results.put((key, None))
+
+    @timed
+    def _drain(self):
+        """
+        Runs on the Tk thread: moves finished images into the cache and notifies their callbacks
+        """
+        from PIL import ImageTk
+
+        self.after_id = None
+
+        while True:
+            try:
+                key, img = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            callbacks = self.pending.pop(key, [])
+            if img is None:
+                continue
+
+            photo = ImageTk.PhotoImage(img)
+            self.cache.put(key, photo)
+            for callback in callbacks:
+                callback(key[0], photo)
+
+        if self.pending:
+            self.after_id = self.root.after(self.poll_ms, self._drain)
+
+    def shutdown(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,358 @@
+import mmap
+import os
+import re
+import sys
+from datetime import date
+from records import Record, format_date, format_seconds
+
+
+class RecordFormat:
+    # precompiled pattern matching a whole line, set by each format
+    pattern = None
+    # same as bytes, matching the lines of a whole buffer at once (multiline mode)
+    byte_pattern = None
+    uses_categories = False
+    # name used for storage (ex. the SQLite table), and whether equal records are rejected as duplicates
+    name = None
+    unique = False
+
+    def __init__(self):
+        # dd/mm/yyyy -> date ordinal; a history only spans a few thousand distinct days
+        # (dates scanned by LineScanner are cached as bytes, next to the text ones)
+        self.day_cache = {}
+
+    def day_ordinal(self, text):
+        """
+        Converts a dd/mm/yyyy date to its ordinal, caching the result
+        :param text: date string (or bytes)
+        :return: date ordinal (raises ValueError if the date doesn't exist)
+        """
+        day = self.day_cache.get(text)
+        if day is None:
+            day = self.day_cache[text] = date(int(text[6:10]), int(text[3:5]), int(text[0:2])).toordinal()
+        return day
+
+    def parse(self, line):
+        """
+        Parses a line in a single regex match
+        :param line: line without its line break
+        :return: record, or None if the line doesn't respect the format
+        """
+        match = self.pattern.fullmatch(line)
+        if match is None:
+            return None
+
+        try:
+            return self.make_record(match)
+        except ValueError:
+            # dates like 31/02/2022 match the pattern but don't exist
+            return None
+
+    def format_line(self, record):
+        """
+        Formats a record as a history file line
+        :param record: record to be formatted
+        :return: line (with category after a tab, if the format uses categories, and laps after another)
+        """
+        line = ' | '.join(self.values(record))
+        if self.uses_categories:
+            line += '\t' + record.category
+            if record.laps:
+                line += '\t' + record.laps
+        return line + '\n'
+
+    # FUNCTIONS TO BE IMPLEMENTED BY EACH FORMAT
+    def make_record(self, match):
+        raise NotImplementedError
+
+    def scan_fields(self, rows, invalid):
+        """
+        Converts byte_pattern groups to (day, seconds, label, category, laps) tuples
+        :param rows: iterable of (line number, groups)
+        :param invalid: called with the line number of rows that match the pattern but aren't valid
+        :return: iterator of tuples
+        """
+        raise NotImplementedError
+
+    def values(self, record):
+        raise NotImplementedError
+
+
+class StopWatchFormat(RecordFormat):
+    # dd/mm/yyyy | hh:mm:ss | label (1 to 10 chars), then the category after a tab,
+    # then the encoded laps after another tab if the record has laps
+    pattern = re.compile(r'(\d{2}/\d{2}/\d{4}) \| (\d{2}):(\d{2}):(\d{2}) \| ([^\t]{1,10})\t([^\t]+)'
+                         r'(?:\t([A-Za-z0-9+/]+={0,2}))?')
+    # a 10 character label takes up to 40 bytes, its length is checked once decoded;
+    # the category keeps any \r when there are no laps
+    byte_pattern = re.compile(rb'^(\d{2}/\d{2}/\d{4}) \| (\d{2}:\d{2}:\d{2}) \| ([^\t\n]{1,40})\t([^\t\n]+)'
+                              rb'(?:\t([A-Za-z0-9+/]+={0,2})\r*)?$', re.MULTILINE)
+    uses_categories = True
+    name = 'stopwatch'
+    unique = True
+
+    def make_record(self, match):
+        day, hours, minutes, seconds, label, category, laps = match.groups()
+        return Record(self.day_ordinal(day), int(hours) * 3600 + int(minutes) * 60 + int(seconds), label, category,
+                      laps)
+
+    def __init__(self):
+        super().__init__()
+        # hh:mm:ss -> seconds, and bytes -> text of the few distinct labels and categories scanned by LineScanner
+        self.seconds_cache = {}
+        self.label_cache = {}
+        self.category_cache = {}
+
+    def scan_fields(self, rows, invalid):
+        days, lengths, labels, categories = self.day_cache, self.seconds_cache, self.label_cache, self.category_cache
+        for lineno, (day, length, label, category, laps) in rows:
+            # laps are kept encoded, records only decode them when they're shown
+            laps = laps.decode('ascii') if laps else None
+            try:
+                yield days[day], lengths[length], labels[label], categories[category], laps
+            except KeyError:
+                try:
+                    yield self._cache_fields(day, length, label, category) + (laps,)
+                except ValueError:
+                    invalid(lineno)
+
+    def _cache_fields(self, day, length, label, category):
+        # first occurrence of one of the fields, which then stays cached if valid
+        seconds = self.seconds_cache.get(length)
+        if seconds is None:
+            seconds = self.seconds_cache[length] = int(length[0:2]) * 3600 + int(length[3:5]) * 60 + int(length[6:8])
+
+        text = self.label_cache.get(label)
+        if text is None:
+            text = sys.intern(label.decode('utf-8'))
+            if len(text) > 10:
+                raise ValueError(text)
+            self.label_cache[label] = text
+
+        name = self.category_cache.get(category)
+        if name is None:
+            # the line break is stripped from text lines, but the pattern leaves any \r in the last field
+            name = self.category_cache[category] = sys.intern(category.rstrip(b'\r').decode('utf-8'))
+
+        return self.day_ordinal(day), seconds, text, name
+
+    def values(self, record):
+        return format_date(record.day), format_seconds(record.seconds), record.label
+
+
+class PomodoroFormat(RecordFormat):
+    # dd/mm/yyyy | Break or Focus
+    pattern = re.compile(r'(\d{2}/\d{2}/\d{4}) \| (Break|Focus)')
+    byte_pattern = re.compile(rb'^(\d{2}/\d{2}/\d{4}) \| (Break|Focus)\r*$', re.MULTILINE)
+    name = 'pomodoro'
+
+    def make_record(self, match):
+        day, label = match.groups()
+        return Record(self.day_ordinal(day), 0, label)
+
+    def scan_fields(self, rows, invalid):
+        days = self.day_cache
+        # the pattern only lets Break and Focus through
+        labels = {b'Break': 'Break', b'Focus': 'Focus'}
+        for lineno, (day, label) in rows:
+            try:
+                yield days[day], 0, labels[label], None, None
+            except KeyError:
+                try:
+                    yield self.day_ordinal(day), 0, labels[label], None, None
+                except ValueError:
+                    invalid(lineno)
+
+    def values(self, record):
+        return format_date(record.day), record.label
+
+
+STOPWATCH_FORMAT = StopWatchFormat()
+POMODORO_FORMAT = PomodoroFormat()
+
+
+class ParseReport:
+    def __init__(self, max_samples=10):
+        """
+        Counts parsed and malformed lines, keeping only the first few malformed ones
+        :param max_samples: number of malformed lines to remember
+        """
+        self.lines = 0
+        self.malformed = 0
+        self.samples = []
+        self.max_samples = max_samples
+
+    def add_malformed(self, lineno, line):
+        self.malformed += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append((lineno, line))
+
+    def merge(self, other):
+        """
+        Adds the counts of another report (ex. of another file making up the same history)
+        """
+        self.lines += other.lines
+        self.malformed += other.malformed
+        self.samples.extend(other.samples[:self.max_samples - len(self.samples)])
+
+    def summary(self):
+        """
+        Describes the malformed lines, for error messages
+        :return: summary text
+        """
+        text = f'{self.malformed} malformed line(s) skipped:\n'
+        text += '\n'.join(f'line {lineno}: {line[:40]}' for lineno, line in self.samples)
+        if self.malformed > len(self.samples):
+            text += '\n...'
+        return text
+
+
+def parse_lines(lines, record_format, report=None):
+    """
+    Streams records out of history file lines, parsing each line exactly once
+    Blank lines are skipped, malformed lines are counted in the report with their line number
+    :param lines: iterable of lines (ex. an open file)
+    :param record_format: format of the lines
+    :param report: (optional) parse report to be filled
+    :return: iterator of records
+    """
+    parse = record_format.parse
+
+    for lineno, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+
+        if report is not None:
+            report.lines += 1
+
+        record = parse(line)
+        if record is None:
+            if report is not None:
+                report.add_malformed(lineno, line)
+            continue
+
+        yield record
+
+
+class LineScanner:
+    # bytes matched per regex call, the unit of progress
+    block_size = 1 << 20
+
+    def __init__(self, buf, record_format, report=None):
+        """
+        Scans history file lines straight out of a byte buffer (ex. a memory map), block by block
+        Each block is matched in one regex call and only the captured fields are decoded,
+        through the format's caches, so lines never become Python strings
+        Blank lines are skipped, malformed lines are counted in the report with their line number
+        :param buf: bytes-like object holding the file
+        :param record_format: format of the lines
+        :param report: (optional) parse report to be filled
+        """
+        self.buf = buf
+        self.record_format = record_format
+        self.report = report if report is not None else ParseReport()
+        # offset of the next block, for progress
+        self.pos = 0
+        self.lineno = 0
+
+    def fields(self):
+        """
+        Scans the buffer
+        :return: iterator of (day, seconds, label, category, laps) tuples
+        """
+        buf = self.buf
+        size = len(buf)
+        findall = self.record_format.byte_pattern.findall
+
+        while self.pos < size:
+            start = self.pos
+            # blocks end after a line break, so that no line is split
+            end = buf.find(b'\n', start + self.block_size - 1) + 1 or size
+            self.pos = end
+
+            block = buf[start:end]
+            lines = block.count(b'\n') + (block[-1] != 10)
+            rows = findall(block)
+            if len(rows) == lines:
+                # every line is a record, as in nearly every block
+                self.report.lines += lines
+                numbered = enumerate(rows, self.lineno + 1)
+            else:
+                numbered = self._scan_block(block)
+
+            first_lineno = self.lineno
+            yield from self.record_format.scan_fields(numbered,
+                                                      lambda lineno: self._invalid(block, lineno - first_lineno))
+            self.lineno = first_lineno + lines
+
+    def _scan_block(self, block):
+        """
+        Slow path for blocks holding blank or malformed lines: locates each match
+        :return: iterator of (line number, groups) of the matching lines
+        """
+        lineno = self.lineno
+        start = 0
+        for match in self.record_format.byte_pattern.finditer(block):
+            for line in block[start:match.start()].split(b'\n')[:-1]:
+                lineno += 1
+                self._skip(lineno, line)
+            lineno += 1
+            self.report.lines += 1
+            yield lineno, match.groups()
+            start = match.end() + 1
+
+        if start < len(block):
+            for line in block[start:].rstrip(b'\n').split(b'\n'):
+                lineno += 1
+                self._skip(lineno, line)
+
+    def _skip(self, lineno, line):
+        # same as rstrip('\r\n') on a text line
+        line = line.rstrip(b'\r')
+        if line:
+            self.report.lines += 1
+            self.report.add_malformed(lineno, line.decode('utf-8', 'replace'))
+
+    def _invalid(self, block, index):
+        # lines that match but don't hold a valid record (ex. 31/02) are rare, their text is only found for samples
+        line = b''
+        if len(self.report.samples) < self.report.max_samples:
+            line = block.split(b'\n')[index - 1].rstrip(b'\r')
+        self.report.add_malformed(self.lineno + index, line.decode('utf-8', 'replace'))
+
+    def records(self):
+        """
+        Scans the buffer
+        :return: iterator of records
+        """
+        for fields in self.fields():
+            yield Record(*fields)
+
+
+def map_file(f):
+    """
+    Maps a file read-only, so that every process scanning it shares the same cached pages
+    :param f: file open in binary mode
+    :return: memory map, or empty bytes for an empty file (which can't be mapped)
+    """
+    if not os.fstat(f.fileno()).st_size:
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def scan_file(filename, record_format, report=None):
+    """
+    Streams the records of a history file through a memory map (see LineScanner)
+    :param filename: history file
+    :param record_format: format of the file's lines
+    :param report: (optional) parse report to be filled
+    :return: iterator of records
+    """
+    with open(filename, 'rb') as f:
+        buf = map_file(f)
+        try:
+            yield from LineScanner(buf, record_format, report).records()
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
@@ -0,0 +1,108 @@
+import itertools
+
+
+class RecordStore:
+    def __init__(self, categories=(), prefix='r'):
+        """
+        In-memory store for history records
+        Every record gets an id; each category keeps its record ids in an insertion-ordered dict,
+        so adding, deleting and duplicate checks are all O(1)
+        :param categories: categories that exist even before they hold any record
+        :param prefix: (optional) start of the ids, so that several stores can share one id space
+        """
+        # id -> record
+        self.records = {}
+        # category -> {id: None}, used as an ordered set
+        self.categories = {cat: {} for cat in categories}
+        # record -> {id: None} of the records equal to it (histories may allow duplicates)
+        self.index = {}
+
+        self.prefix = prefix
+        self._ids = itertools.count()
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        """
+        Iterates through all records, category by category, in insertion order
+        :return: iterator of (id, record)
+        """
+        records = self.records
+        for ids in self.categories.values():
+            for rid in ids:
+                yield rid, records[rid]
+
+    def add(self, record, unique=False):
+        """
+        Adds a record to its category (created if it doesn't exist yet)
+        :param record: record to be added
+        :param unique: (optional) refuse the record if an equal one is stored, in the same index lookup
+        :return: the new record's id, or None if it was refused
+        """
+        ids = self.index.setdefault(record, {})
+        if unique and ids:
+            return None
+
+        rid = f'{self.prefix}{next(self._ids)}'
+        self.records[rid] = record
+        self.categories.setdefault(record.category, {})[rid] = None
+        ids[rid] = None
+
+        return rid
+
+    def remove(self, rid):
+        """
+        Removes a record given its id
+        :param rid: id returned by add
+        :return: the removed record
+        """
+        record = self.records.pop(rid)
+        del self.categories[record.category][rid]
+
+        ids = self.index[record]
+        del ids[rid]
+        if not ids:
+            del self.index[record]
+
+        return record
+
+    def clear(self):
+        """
+        Removes every record, keeping the categories
+        Ids are never reused, so ids still held for the old records can't point to new ones
+        """
+        self.records.clear()
+        self.categories = {cat: {} for cat in self.categories}
+        self.index.clear()
+
+    def get(self, rid):
+        return self.records[rid]
+
+    def contains(self, record):
+        return record in self.index
+
+    def find(self, record):
+        """
+        Looks up a record equal to the given one
+        :param record: record to look for
+        :return: the id of the first equal record, or None if there is none
+        """
+        ids = self.index.get(record)
+        return next(iter(ids)) if ids else None
+
+    def count(self, category):
+        return len(self.categories.get(category, ()))
+
+    def category_names(self):
+        return self.categories.keys()
+
+    def category_records(self, category):
+        """
+        Iterates through the records of one category, in insertion order
+        :param category: category to iterate
+        :return: iterator of (id, record)
+        """
+        records = self.records
+        for rid in self.categories.get(category, ()):
+            yield rid, records[rid]
@@ -0,0 +1,157 @@
+import base64
+import sys
+from array import array
+from datetime import date
+
+
+def format_date(day):
+    """
+    Formats a date ordinal the way history files store it
+    :param day: date ordinal
+    :return: date as dd/mm/yyyy
+    """
+    return date.fromordinal(day).strftime("%d/%m/%Y")
+
+
+def format_seconds(seconds):
+    """
+    Formats a duration the way history files store it
+    :param seconds: duration in seconds
+    :return: duration as hh:mm:ss
+    """
+    return f'{seconds // 3600:02}:{seconds // 60 % 60:02}:{seconds % 60:02}'
+
+
+def encode_laps(splits):
+    """
+    Packs lap split times for a history line: milliseconds as little-endian 32-bit integers, in base64
+    :param splits: split times in seconds (ex. an array('d'))
+    :return: ASCII text, or None if there are no laps
+    """
+    if not len(splits):
+        return None
+
+    packed = array('I', (round(split * 1000) for split in splits))
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode('ascii')
+
+
+def decode_laps(text):
+    """
+    Unpacks the split times written by encode_laps
+    :param text: encoded laps (None for none)
+    :return: array('d') of split times in seconds
+    """
+    packed = array('I')
+    if text:
+        packed.frombytes(base64.b64decode(text))
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return array('d', (ms / 1000 for ms in packed))
+
+
+class Record:
+    __slots__ = ('day', 'seconds', 'label', 'category', 'laps')
+
+    def __init__(self, day, seconds, label, category=None, laps=None):
+        """
+        A single history record, kept in typed fields; strings are only built to display or write it
+        :param day: date ordinal
+        :param seconds: duration in seconds (0 for records without a duration)
+        :param label: record label (interned, as few distinct labels repeat a lot)
+        :param category: (optional) record category
+        :param laps: (optional) lap split times as written by encode_laps, only decoded when they're shown
+            (they aren't part of the record's identity)
+        """
+        self.day = day
+        self.seconds = seconds
+        self.label = sys.intern(label)
+        self.category = sys.intern(category) if category else None
+        self.laps = laps
+
+    def key(self):
+        return self.day, self.seconds, self.label, self.category
+
+    def __eq__(self, other):
+        return isinstance(other, Record) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f'Record({format_date(self.day)}, {format_seconds(self.seconds)}, {self.label!r}, {self.category!r})'
+
+    def replace_label(self, label):
+        return Record(self.day, self.seconds, label, self.category, self.laps)
+
+
+class RecordColumns:
+    def __init__(self, records=()):
+        """
+        Column-oriented container for large record sets
+        Days and durations live in machine-int arrays, labels and categories as codes,
+        so a record costs a few bytes, and batch computations never compare strings
+        :param records: (optional) records to start with
+        """
+        self.days = array('l')
+        self.seconds = array('l')
+        self.label_codes = array('I')
+        self.category_codes = array('H')
+        # code -> label or category name, and back
+        self.label_names = []
+        self.category_names = []
+        self._label_codes = {}
+        self._codes = {}
+
+        for record in records:
+            self.append(record)
+
+    def __len__(self):
+        return len(self.days)
+
+    def __getitem__(self, i):
+        return Record(self.days[i], self.seconds[i], self.label_names[self.label_codes[i]],
+                      self.category_names[self.category_codes[i]])
+
+    def __iter__(self):
+        for i in range(len(self.days)):
+            yield self[i]
+
+    def category_code(self, category):
+        code = self._codes.get(category)
+        if code is None:
+            code = self._codes[category] = len(self.category_names)
+            self.category_names.append(category)
+        return code
+
+    def label_code(self, label):
+        code = self._label_codes.get(label)
+        if code is None:
+            code = self._label_codes[label] = len(self.label_names)
+            self.label_names.append(label)
+        return code
+
+    def append(self, record):
+        self.days.append(record.day)
+        self.seconds.append(record.seconds)
+        self.label_codes.append(self.label_code(record.label))
+        self.category_codes.append(self.category_code(record.category))
+
+    def collect(self, records):
+        """
+        Appends records as they go by, so that the columns fill up while a file is scanned
+        :param records: iterable of records
+        :return: iterator of the same records
+        """
+        days, seconds = self.days.append, self.seconds.append
+        label_codes, category_codes = self.label_codes.append, self.category_codes.append
+        labels, categories = self._label_codes, self._codes
+        for record in records:
+            days(record.day)
+            seconds(record.seconds)
+            code = labels.get(record.label)
+            label_codes(self.label_code(record.label) if code is None else code)
+            code = categories.get(record.category)
+            category_codes(self.category_code(record.category) if code is None else code)
+            yield record
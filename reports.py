@@ -0,0 +1,159 @@
+import csv
+import numpy as np
+from records import format_date
+
+
+class HistoryArrays:
+    def __init__(self, days, seconds, codes, category_names):
+        """
+        A whole history as NumPy arrays, for reports computed with vectorized operations
+        :param days: date ordinals
+        :param seconds: durations in seconds
+        :param codes: category codes, indexing category_names
+        :param category_names: code -> category name (None for records without a category)
+        """
+        self.days = np.asarray(days, dtype=np.int64)
+        self.seconds = np.asarray(seconds, dtype=np.int64)
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.category_names = list(category_names)
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Wraps column-stored records without copying them record by record
+        :param columns: RecordColumns
+        :return: HistoryArrays
+        """
+        return cls(np.frombuffer(columns.days, dtype=columns.days.typecode),
+                   np.frombuffer(columns.seconds, dtype=columns.seconds.typecode),
+                   np.frombuffer(columns.category_codes, dtype=columns.category_codes.typecode),
+                   columns.category_names)
+
+    @classmethod
+    def from_storage(cls, storage):
+        return cls.from_columns(storage.columns())
+
+    def __len__(self):
+        return len(self.days)
+
+    def day_range(self):
+        return int(self.days.min()), int(self.days.max())
+
+
+def daily_totals(arrays, first_day, last_day, count=False):
+    """
+    Sums the records of every day in a range (days without records included)
+    :param arrays: HistoryArrays
+    :param first_day: date ordinal of the first day (included)
+    :param last_day: date ordinal of the last day (included)
+    :param count: count records instead of summing their durations (ex. for Pomodoro histories)
+    :return: array with one total per day
+    """
+    in_range = (arrays.days >= first_day) & (arrays.days <= last_day)
+    weights = None if count else arrays.seconds[in_range]
+    return np.bincount(arrays.days[in_range] - first_day, weights=weights, minlength=last_day - first_day + 1)
+
+
+def weekly_heatmap(daily, first_day):
+    """
+    Lays daily totals out as one row per week and one column per weekday (monday first)
+    :param daily: daily totals, as returned by daily_totals
+    :param first_day: date ordinal of the first total
+    :return: (date ordinal of the first row's monday, array of shape (weeks, 7))
+    """
+    # ordinal 1 was a monday
+    lead = (first_day - 1) % 7
+    cells = np.concatenate((np.zeros(lead), daily))
+    cells = np.concatenate((cells, np.zeros(-len(cells) % 7)))
+    return first_day - lead, cells.reshape(-1, 7)
+
+
+def rolling_average(daily, window=7):
+    """
+    Averages every day with the days before it (fewer at the start of the range)
+    :param daily: daily totals
+    :param window: number of days averaged
+    :return: array of averages, one per day
+    """
+    sums = np.cumsum(np.concatenate(([0.0], daily)))
+    ends = np.arange(1, len(daily) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+def streaks(daily):
+    """
+    Finds runs of consecutive days with records
+    :param daily: daily totals
+    :return: (longest run, run ending on the last day), in days
+    """
+    active = np.concatenate(([False], daily > 0, [False]))
+    edges = np.flatnonzero(active[1:] != active[:-1])
+    runs = edges[1::2] - edges[::2]
+    if not len(runs):
+        return 0, 0
+    current = int(runs[-1]) if daily[-1] > 0 else 0
+    return int(runs.max()), current
+
+
+def category_percentiles(arrays, percentiles=(50, 90, 99)):
+    """
+    Computes percentiles of the record durations in each category
+    :param arrays: HistoryArrays
+    :param percentiles: percentiles to compute, between 0 and 100
+    :return: dict category -> array of percentile durations (in seconds)
+    """
+    result = {}
+    # np.percentile partitions instead of sorting, so a pass per (used) category beats a full sort
+    for code in np.flatnonzero(np.bincount(arrays.codes)).tolist():
+        result[arrays.category_names[code]] = np.percentile(arrays.seconds[arrays.codes == code], percentiles)
+    return result
+
+
+def build_report(arrays, window=7, count=False, percentiles=(50, 90, 99)):
+    """
+    Computes every report over a history, as tables ready to be exported
+    :param arrays: HistoryArrays (not empty)
+    :param window: days averaged by the rolling average
+    :param count: report record counts instead of durations (ex. for Pomodoro histories)
+    :param percentiles: percentiles of record durations per category
+    :return: dict report name -> (header, rows)
+    """
+    first_day, last_day = arrays.day_range()
+    daily = daily_totals(arrays, first_day, last_day, count)
+    rolling = rolling_average(daily, window)
+
+    days = [format_date(day) for day in range(first_day, last_day + 1)]
+    tables = {'daily': (['Date', 'Total', f'Average ({window} days)'],
+                        zip(days, daily.astype(np.int64).tolist(), rolling.round(2).tolist()))}
+
+    monday, heatmap = weekly_heatmap(daily, first_day)
+    weeks = [format_date(day) for day in range(monday, monday + 7 * len(heatmap), 7)]
+    tables['heatmap'] = (['Week', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
+                         ([week] + row for week, row in zip(weeks, heatmap.astype(np.int64).tolist())))
+
+    longest, current = streaks(daily)
+    tables['streaks'] = (['Longest', 'Current'], [(longest, current)])
+
+    tables['percentiles'] = (['Category'] + [f'p{p}' for p in percentiles],
+                             ([category or ''] + values.round(2).tolist()
+                              for category, values in category_percentiles(arrays, percentiles).items()))
+    return tables
+
+
+def export_csv(tables, prefix):
+    """
+    Writes every report table to its own CSV file
+    :param tables: tables returned by build_report
+    :param prefix: path prefix of the files, completed with '_<report>.csv'
+    :return: list of written files
+    """
+    filenames = []
+    for name, (header, rows) in tables.items():
+        filename = f'{prefix}_{name}.csv'
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+        filenames.append(filename)
+    return filenames
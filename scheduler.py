@@ -0,0 +1,107 @@
+import math
+import time
+from instrumentation import ENABLED, instruments, timed
+
+
+class TickScheduler:
+    def __init__(self, sched_root):
+        """
+        Drives every running timer from a single after() chain
+        Timers register when they start and unregister when they stop; with no timers registered
+        (or only hidden ones without a deadline) no callback is pending at all
+        :param sched_root: tk widget whose event loop runs the wakeups
+        """
+        self.root = sched_root
+        self.timers = []
+
+        # id of the single pending wakeup (None while sleeping), and when it's due (only kept when instrumented)
+        self.after_id = None
+        self.due = None
+
+    def register(self, timer):
+        """
+        Adds a timer to the wakeup list, waking the scheduler if it was sleeping
+        :param timer: timer exposing tick(), tick_delay() and visible
+        """
+        if timer not in self.timers:
+            self.timers.append(timer)
+
+        if self.after_id is None:
+            self._schedule()
+
+    def unregister(self, timer):
+        """
+        Removes a timer from the wakeup list, putting the scheduler to sleep if it was the last one
+        :param timer: timer to be removed
+        """
+        if timer in self.timers:
+            self.timers.remove(timer)
+
+        if not self.timers:
+            self._cancel()
+        elif self.after_id is not None:
+            # the wakeup follows the first timer's second boundaries, which may have changed
+            self.reschedule()
+
+    def reschedule(self):
+        """
+        Recomputes the next wakeup, ex. after a timer was shown or hidden
+        """
+        self._cancel()
+        if self.timers:
+            self._schedule()
+
+    def _cancel(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def _next_delay(self):
+        """
+        Returns the delay until the next wakeup: the next second boundary of the longest-running shown timer,
+        or the earliest deadline of a hidden one (ex. a countdown running out)
+        The other shown timers are coalesced into the same wakeup; they compute their time from the clock,
+        so sharing a wakeup only shifts when their label turns over, never how much time they count
+        :return: delay in seconds, or None if no timer needs waking
+        """
+        shown = deadline = None
+        for timer in self.timers:
+            delay = timer.tick_delay()
+            if delay is None:
+                continue
+            if timer.visible:
+                if shown is None:
+                    shown = delay
+            elif deadline is None or delay < deadline:
+                deadline = delay
+
+        delays = [delay for delay in (shown, deadline) if delay is not None]
+        return min(delays) if delays else None
+
+    def _schedule(self):
+        """
+        Schedules the next wakeup, if any timer needs one
+        """
+        delay = self._next_delay()
+        if delay is None:
+            return
+
+        delay_ms = max(1, math.ceil(delay * 1000))
+        self.after_id = self.root.after(delay_ms, self._wakeup)
+        if ENABLED:
+            self.due = time.perf_counter() + delay_ms / 1000
+
+    @timed
+    def _wakeup(self):
+        if ENABLED:
+            instruments.record_lateness('tick', time.perf_counter() - self.due)
+
+        # schedule the next wakeup before ticking, so a tick that opens a modal dialog
+        # does not stall the other timers
+        self.after_id = None
+        self._schedule()
+
+        # a tick may stop (or restart) timers, so iterate over a copy
+        for timer in list(self.timers):
+            if timer in self.timers:
+                timer.tick()
@@ -0,0 +1,158 @@
+from bisect import bisect_left, bisect_right, insort
+
+
+class SearchFilter:
+    def __init__(self, label='', category=None, first_day=None, last_day=None):
+        """
+        Conditions a record must meet to be listed, any of them can be left out
+        :param label: text the label must contain (case insensitive)
+        :param category: category the record must belong to
+        :param first_day: date ordinal of the first accepted day
+        :param last_day: date ordinal of the last accepted day
+        """
+        self.label = label.lower()
+        self.category = category
+        self.first_day = first_day
+        self.last_day = last_day
+
+    def is_empty(self):
+        return not self.label and self.category is None and self.first_day is None and self.last_day is None
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    # records listed at once: walking the date range finds them after about page * range / candidates records,
+    # so smaller candidate sets are collected and sorted instead
+    page = 100
+
+    def __init__(self, records=()):
+        """
+        In-memory indexes for filtering a history by label substring, category and date range
+        Labels repeat a lot, so the trigram index covers distinct labels only, each one mapped to its records
+        :param records: (optional) (id, record) pairs to start with
+        """
+        # id -> record
+        self.records = {}
+        # label -> {id: None}, and lowercase trigram -> {labels containing it}
+        self.label_ids = {}
+        self.trigrams = {}
+        # category -> {id: None}
+        self.category_ids = {}
+        # day -> {id: None}, plus the days holding records in ascending order
+        self.day_ids = {}
+        self.days = []
+
+        for rid, record in records:
+            self.add(rid, record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, rid, record):
+        self.records[rid] = record
+
+        ids = self.label_ids.get(record.label)
+        if ids is None:
+            ids = self.label_ids[record.label] = {}
+            for trigram in trigrams(record.label.lower()):
+                self.trigrams.setdefault(trigram, set()).add(record.label)
+        ids[rid] = None
+
+        self.category_ids.setdefault(record.category, {})[rid] = None
+
+        ids = self.day_ids.get(record.day)
+        if ids is None:
+            ids = self.day_ids[record.day] = {}
+            insort(self.days, record.day)
+        ids[rid] = None
+
+    def remove(self, rid, record):
+        del self.records[rid]
+
+        ids = self.label_ids[record.label]
+        del ids[rid]
+        if not ids:
+            del self.label_ids[record.label]
+            for trigram in trigrams(record.label.lower()):
+                labels = self.trigrams[trigram]
+                labels.discard(record.label)
+                if not labels:
+                    del self.trigrams[trigram]
+
+        del self.category_ids[record.category][rid]
+
+        ids = self.day_ids[record.day]
+        del ids[rid]
+        if not ids:
+            del self.day_ids[record.day]
+            del self.days[bisect_left(self.days, record.day)]
+
+    def matching_labels(self, text):
+        """
+        Finds the distinct labels containing a text
+        :param text: lowercase text to look for
+        :return: set of labels
+        """
+        grams = trigrams(text)
+        if not grams:
+            # too short for trigrams: check every distinct label
+            return {label for label in self.label_ids if text in label.lower()}
+
+        candidates = None
+        for trigram in sorted(grams, key=lambda gram: len(self.trigrams.get(gram, ()))):
+            labels = self.trigrams.get(trigram)
+            if not labels:
+                return set()
+            candidates = set(labels) if candidates is None else candidates & labels
+
+        # trigrams may appear in another order, check the whole text
+        return {label for label in candidates if text in label.lower()}
+
+    def matches(self, search_filter):
+        """
+        Iterates through the records meeting a filter, oldest day first
+        Records are produced lazily, so showing the first page of a broad filter stays cheap
+        :param search_filter: SearchFilter
+        :return: iterator of (id, record)
+        """
+        first = search_filter.first_day or 0
+        last = search_filter.last_day
+        if last is None:
+            last = self.days[-1] if self.days else 0
+        days = self.days[bisect_left(self.days, first):bisect_right(self.days, last)]
+        category = search_filter.category
+
+        labels = self.matching_labels(search_filter.label) if search_filter.label else None
+        if labels is not None and not labels:
+            return
+
+        # the smallest candidate set among label and category
+        drivers = []
+        if labels is not None:
+            drivers.append((sum(len(self.label_ids[label]) for label in labels),
+                            [self.label_ids[label] for label in labels]))
+        if category is not None:
+            drivers.append((len(self.category_ids.get(category, ())), [self.category_ids.get(category, {})]))
+
+        def accept(record):
+            return ((labels is None or record.label in labels)
+                    and (category is None or record.category == category)
+                    and first <= record.day <= last)
+
+        records = self.records
+        if drivers:
+            size, id_sets = min(drivers, key=lambda driver: driver[0])
+            if size * size < self.page * sum(len(self.day_ids[day]) for day in days):
+                found = [(rid, records[rid]) for ids in id_sets for rid in ids if accept(records[rid])]
+                found.sort(key=lambda item: item[1].day)
+                yield from found
+                return
+
+        for day in days:
+            for rid in self.day_ids[day]:
+                record = records[rid]
+                if accept(record):
+                    yield rid, record
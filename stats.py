@@ -0,0 +1,182 @@
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy only speeds up rebuilding the aggregates; without it they are rebuilt record by record
+    np = None
+
+
+class HistoryStats:
+    def __init__(self):
+        """
+        Running totals over a history, updated in O(1) whenever a record is added or deleted
+        Range queries cost O(days in range), independently of the number of records
+        """
+        # day -> Counter(category -> seconds)
+        self.day_seconds = {}
+        # day -> Counter(label -> number of records), ex. Pomodoro focus/break counts
+        self.day_counts = {}
+        # label -> seconds, and label -> number of records
+        self.label_seconds = Counter()
+        self.label_counts = Counter()
+
+    def add(self, record):
+        day_seconds = self.day_seconds.get(record.day)
+        if day_seconds is None:
+            day_seconds = self.day_seconds[record.day] = Counter()
+            self.day_counts[record.day] = Counter()
+
+        day_seconds[record.category] += record.seconds
+        self.day_counts[record.day][record.label] += 1
+        self.label_seconds[record.label] += record.seconds
+        self.label_counts[record.label] += 1
+
+    def remove(self, record):
+        self.day_seconds[record.day][record.category] -= record.seconds
+        self.day_counts[record.day][record.label] -= 1
+        self.label_seconds[record.label] -= record.seconds
+        self.label_counts[record.label] -= 1
+
+        if self.label_counts[record.label] <= 0:
+            del self.label_counts[record.label]
+            del self.label_seconds[record.label]
+
+    def merge(self, other):
+        """
+        Adds the totals of another set of records (ex. a part of the history summarized elsewhere)
+        :param other: HistoryStats
+        """
+        for day, counter in other.day_seconds.items():
+            self.day_seconds.setdefault(day, Counter()).update(counter)
+            self.day_counts.setdefault(day, Counter())
+        for day, counter in other.day_counts.items():
+            self.day_counts.setdefault(day, Counter()).update(counter)
+            self.day_seconds.setdefault(day, Counter())
+        self.label_seconds.update(other.label_seconds)
+        self.label_counts.update(other.label_counts)
+
+    def to_json(self):
+        """
+        Returns the totals as JSON-compatible lists of pairs (categories may be None, which can't be a JSON key)
+        """
+        return {'day_seconds': [[day, list(counter.items())] for day, counter in self.day_seconds.items()],
+                'day_counts': [[day, list(counter.items())] for day, counter in self.day_counts.items()],
+                'label_seconds': list(self.label_seconds.items()),
+                'label_counts': list(self.label_counts.items())}
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        Reads totals written by to_json
+        :return: HistoryStats
+        """
+        stats = cls()
+        stats.day_seconds = {day: Counter(dict(pairs)) for day, pairs in data['day_seconds']}
+        stats.day_counts = {day: Counter(dict(pairs)) for day, pairs in data['day_counts']}
+        stats.label_seconds = Counter(dict(data['label_seconds']))
+        stats.label_counts = Counter(dict(data['label_counts']))
+        return stats
+
+    def fill(self, totals):
+        """
+        Replaces every aggregate with totals computed elsewhere (ex. grouped by a database)
+        :param totals: iterable of (day, category, label, seconds, number of records),
+            one per distinct day, category and label
+        """
+        self.clear()
+        for day, category, label, seconds, count in totals:
+            day_seconds = self.day_seconds.get(day)
+            if day_seconds is None:
+                day_seconds = self.day_seconds[day] = Counter()
+                self.day_counts[day] = Counter()
+
+            day_seconds[category] += seconds
+            self.day_counts[day][label] += count
+            self.label_seconds[label] += seconds
+            self.label_counts[label] += count
+
+    def clear(self):
+        self.day_seconds.clear()
+        self.day_counts.clear()
+        self.label_seconds.clear()
+        self.label_counts.clear()
+
+    def _sum_days(self, per_day, first_day, last_day):
+        totals = Counter()
+        for day in range(first_day, last_day + 1):
+            counter = per_day.get(day)
+            if counter:
+                totals.update(counter)
+        return +totals
+
+    def category_seconds(self, first_day, last_day):
+        """
+        Returns the time recorded per category between two days
+        :param first_day: date ordinal of the first day (included)
+        :param last_day: date ordinal of the last day (included)
+        :return: Counter(category -> seconds)
+        """
+        return self._sum_days(self.day_seconds, first_day, last_day)
+
+    def label_counts_between(self, first_day, last_day):
+        """
+        Returns the number of records per label between two days (ex. Pomodoro focus/break counts)
+        :param first_day: date ordinal of the first day (included)
+        :param last_day: date ordinal of the last day (included)
+        :return: Counter(label -> number of records)
+        """
+        return self._sum_days(self.day_counts, first_day, last_day)
+
+    def top_labels(self, n=5):
+        return self.label_seconds.most_common(n)
+
+    def rebuild(self, columns):
+        """
+        Recomputes every aggregate from scratch in one batch pass over column-stored records
+        :param columns: RecordColumns holding the whole history
+        """
+        self.clear()
+        if not len(columns):
+            return
+
+        if np is None:
+            for record in columns:
+                self.add(record)
+            return
+
+        days = np.frombuffer(columns.days, dtype=columns.days.typecode).astype(np.int64)
+        seconds = np.frombuffer(columns.seconds, dtype=columns.seconds.typecode).astype(np.int64)
+        codes = np.frombuffer(columns.category_codes, dtype=columns.category_codes.typecode).astype(np.int64)
+        label_ids = np.frombuffer(columns.label_codes, dtype=columns.label_codes.typecode).astype(np.int64)
+        label_names = columns.label_names
+
+        first_day = int(days.min())
+        day_offsets = days - first_day
+
+        # seconds per (day, category)
+        n_categories = len(columns.category_names)
+        keys, inverse = np.unique(day_offsets * n_categories + codes, return_inverse=True)
+        sums = np.bincount(inverse, weights=seconds)
+        for key, total in zip(keys.tolist(), sums.tolist()):
+            day, code = divmod(key, n_categories)
+            self.day_seconds.setdefault(first_day + day, Counter())[columns.category_names[code]] = int(total)
+
+        # records per (day, label)
+        n_labels = len(label_names)
+        keys, counts = np.unique(day_offsets * n_labels + label_ids, return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            day, label = divmod(key, n_labels)
+            self.day_counts.setdefault(first_day + day, Counter())[label_names[label]] = count
+
+        # totals per label
+        label_sums = np.bincount(label_ids, weights=seconds, minlength=n_labels)
+        label_totals = np.bincount(label_ids, minlength=n_labels)
+        for label, total, count in zip(label_names, label_sums.tolist(), label_totals.tolist()):
+            self.label_seconds[label] = int(total)
+            self.label_counts[label] = count
+
+        for day in self.day_seconds:
+            self.day_counts.setdefault(day, Counter())
+        for day in self.day_counts:
+            self.day_seconds.setdefault(day, Counter())
@@ -0,0 +1,83 @@
+import tkinter as tk
+from datetime import date
+from tkinter import filedialog
+from tkinter import messagebox
+from records import format_seconds
+
+
+class StatsTab:
+    def __init__(self, stats_root, stopwatch_history, pomodoro_history):
+        """
+        Summary of both histories, read from their running aggregates (so refreshing never rescans records)
+        :param stats_root: the root in which to show the stats
+        :param stopwatch_history: stopwatch history, for time per category and label
+        :param pomodoro_history: pomodoro history, for focus/break counts
+        """
+        self.root = stats_root
+        self.stopwatch_history = stopwatch_history
+        self.pomodoro_history = pomodoro_history
+        self.stopwatch_stats = stopwatch_history.model.stats
+        self.pomodoro_stats = pomodoro_history.model.stats
+
+        self.week_label = self._section('This week')
+        self.today_label = self._section('Pomodoro')
+        self.labels_label = self._section('Top labels')
+
+        self.export_button = tk.Button(self.root, text='Export report', command=self.export_report)
+        self.export_button.pack(pady=10)
+
+    def _section(self, title):
+        tk.Label(self.root, text=title, font=('Arial', 12, 'bold')).pack(anchor='w', padx=10, pady=(10, 0))
+        body = tk.Label(self.root, text='', font=('Arial', 11), justify=tk.LEFT)
+        body.pack(anchor='w', padx=20)
+        return body
+
+    def refresh(self):
+        today = date.today().toordinal()
+        week_start = today - date.today().weekday()
+
+        # stopwatch time per category, from monday to today
+        week = self.stopwatch_stats.category_seconds(week_start, today)
+        lines = [f'{category or "-"}: {format_seconds(seconds)}' for category, seconds in week.most_common()]
+        lines.append(f'Total: {format_seconds(sum(week.values()))}')
+        self.week_label.configure(text='\n'.join(lines))
+
+        # completed pomodoro periods, today and this week
+        today_counts = self.pomodoro_stats.label_counts_between(today, today)
+        week_counts = self.pomodoro_stats.label_counts_between(week_start, today)
+        self.today_label.configure(text=f'Today: {today_counts["Focus"]} focus, {today_counts["Break"]} break\n'
+                                        f'This week: {week_counts["Focus"]} focus, {week_counts["Break"]} break')
+
+        top = self.stopwatch_stats.top_labels()
+        self.labels_label.configure(text='\n'.join(f'{label}: {format_seconds(seconds)}' for label, seconds in top)
+                                    or 'No records yet')
+
+    def export_report(self):
+        """
+        Writes the detailed reports of both histories (daily totals, heatmap, streaks, percentiles) as CSV files
+        """
+        try:
+            # numpy is only needed for the reports, so it is imported when they are asked for
+            from reports import HistoryArrays, build_report, export_csv
+        except ImportError:
+            messagebox.showerror(title="Error", message="Reports need NumPy to be installed.")
+            return
+
+        filename = filedialog.asksaveasfilename(title="Export report", initialfile='report',
+                                                filetypes=(('CSV files', '*.csv'), ('All files', '*.*')))
+        # cancel pressed
+        if not filename:
+            return
+        prefix = filename[:-4] if filename.endswith('.csv') else filename
+
+        written = []
+        for name, history, count in (('stopwatch', self.stopwatch_history, False),
+                                     ('pomodoro', self.pomodoro_history, True)):
+            arrays = HistoryArrays.from_storage(history.model.storage)
+            if len(arrays):
+                written += export_csv(build_report(arrays, count=count), f'{prefix}_{name}')
+
+        if not written:
+            messagebox.showerror(title="Error", message="Cannot report on empty histories.")
+            return
+        messagebox.showinfo(title="Export report", message=f"{len(written)} report file(s) written.")
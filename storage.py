@@ -0,0 +1,1066 @@
+import argparse
+import bisect
+import contextlib
+import gzip
+import itertools
+import json
+import mmap
+import os
+import sqlite3
+import tempfile
+from datetime import date
+from file_lock import FileLock
+from journal import Journal, file_stamp
+from record_formats import STOPWATCH_FORMAT, POMODORO_FORMAT, LineScanner, ParseReport, map_file
+from record_store import RecordStore
+from records import Record, RecordColumns
+from stats import HistoryStats
+
+# database used by the SQLite backend, one table per history
+SQLITE_FILE = 'history.sqlite3'
+
+# connections of this process, by database file: [connection, number of storages using it]
+_connections = {}
+
+
+def _connect(db_file):
+    """
+    Returns this process' connection to a database, opening it the first time
+    The histories share it, so that the batched transaction of one never locks the other out
+    :param db_file: database file
+    """
+    key = os.path.abspath(db_file)
+    shared = _connections.get(key)
+    if shared is None:
+        connection = sqlite3.connect(db_file)
+        # other instances of the app can still read while a batch is pending
+        connection.execute('PRAGMA journal_mode=WAL')
+        shared = _connections[key] = [connection, 0]
+    shared[1] += 1
+    return shared[0]
+
+
+def _disconnect(db_file):
+    key = os.path.abspath(db_file)
+    shared = _connections[key]
+    shared[1] -= 1
+    if shared[1] == 0:
+        shared[0].close()
+        del _connections[key]
+
+
+class Storage:
+    def __init__(self, record_format, categories=()):
+        """
+        Where a history keeps its records
+        Records are addressed by string ids, which the history also uses as treeview item ids
+        :param record_format: format of the history's records
+        :param categories: categories that exist even before they hold any record
+        """
+        self.record_format = record_format
+        self.default_categories = list(categories)
+
+    def export(self, filename):
+        """
+        Writes every record to a text file, in the history's format
+        :param filename: file to be written
+        """
+        format_line = self.record_format.format_line
+        write_atomically(filename, (format_line(record) for _, record in self.records()))
+
+    def columns(self):
+        """
+        Copies every record into column arrays, for batch computations over the whole history
+        :return: RecordColumns
+        """
+        return RecordColumns(record for _, record in self.records())
+
+    def fill_stats(self, stats):
+        """
+        Computes the running totals of the whole history
+        :param stats: HistoryStats to be filled
+        """
+        stats.rebuild(self.columns())
+
+    def sync(self):
+        """
+        Takes in the changes other instances of the app made since this one last read the storage
+        :return: list of (op, id, record) changes, with ops as in Journal, or None if the storage was read again whole
+        """
+        return []
+
+    def locked(self):
+        """
+        Returns a context manager keeping other instances from writing the storage meanwhile
+        """
+        return contextlib.nullcontext()
+
+    def start_load(self):
+        """
+        Starts a load in steps, returning the file to be parsed (ex. by an ImportWorker): the parsed records
+        are then handed to add_loaded, and finish_load ends the load
+        Backends that don't read a text file return None, finish_load then reads them at once
+        :return: file open in binary mode, or None
+        """
+        return None
+
+    def add_loaded(self, records):
+        """
+        Stores records parsed for a load started by start_load
+        """
+        raise NotImplementedError
+
+    def finish_load(self, report=None, columns=None):
+        """
+        Ends a load started by start_load
+        :param report: (optional) parse report of the file returned by start_load
+        :param columns: (optional) RecordColumns of the parsed records, for fill_stats
+        :return: parse report of the whole load
+        """
+        return self.load()
+
+    def batched(self):
+        """
+        Returns a context manager under which the records added are written together, once it ends
+        """
+        return contextlib.nullcontext()
+
+    # FUNCTIONS TO BE IMPLEMENTED BY EACH BACKEND
+    def load(self):
+        """
+        Prepares the storage for use, returning a parse report of whatever was read
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def add(self, record):
+        raise NotImplementedError
+
+    def delete(self, rid):
+        raise NotImplementedError
+
+    def get(self, rid):
+        raise NotImplementedError
+
+    def find(self, record):
+        raise NotImplementedError
+
+    def contains(self, record):
+        return self.find(record) is not None
+
+    def count(self, category):
+        raise NotImplementedError
+
+    def category_names(self):
+        raise NotImplementedError
+
+    def query(self, category, offset=0, limit=None):
+        raise NotImplementedError
+
+    def records(self):
+        raise NotImplementedError
+
+    def flush(self):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+
+class TextStorage(Storage):
+    def __init__(self, filename, record_format, categories=(), id_prefix='r'):
+        """
+        Keeps the records in memory, persisted as a text file plus an append-only journal of changes
+        :param filename: history text file
+        :param id_prefix: (optional) start of the record ids
+        """
+        super().__init__(record_format, categories)
+        self.filename = filename
+        self.store = RecordStore(categories, id_prefix)
+        self.journal = Journal(filename)
+        # columns of the records read by the last load and the records it dropped from them (duplicates and
+        # deletions), so that fill_stats only runs array reductions; dropped once used, or once a record changes
+        self.loaded = None
+        # journal entries and dropped records of a load in progress
+        self.loading = None
+
+    def _apply_entry(self, op, line):
+        """
+        Applies a journal entry to the records in memory
+        :return: (op, id, record) change, or None if it changed nothing
+        """
+        record = self.record_format.parse(line.rstrip('\r\n'))
+        if record is None:
+            return None
+
+        if op == Journal.ADD:
+            rid = self.store.add(record, self.record_format.unique)
+            return None if rid is None else (op, rid, record)
+
+        rid = self.store.find(record)
+        if rid is None:
+            return None
+        self.store.remove(rid)
+        return op, rid, record
+
+    def load(self):
+        """
+        Reads the text file, then applies the changes journaled since the last compaction
+        """
+        report = ParseReport()
+        columns = RecordColumns()
+        # other instances don't write while the files are read
+        with self.journal.lock:
+            f = self.start_load()
+            if f is not None:
+                with f:
+                    buf = map_file(f)
+                    try:
+                        self.add_loaded(columns.collect(LineScanner(buf, self.record_format, report).records()))
+                    finally:
+                        if isinstance(buf, mmap.mmap):
+                            buf.close()
+        return self.finish_load(report, columns)
+
+    def start_load(self):
+        """
+        Opens the text file and reads the journal, as they are now: the file may be parsed on another thread,
+        without holding the lock, as a file replaced meanwhile (by a compaction) stays readable once open
+        """
+        self.loaded = None
+        with self.journal.lock:
+            self.loading = list(self.journal.entries()), []
+            self.journal.mark_read()
+            try:
+                return open(self.filename, 'rb')
+            except FileNotFoundError:
+                return None
+
+    def add_loaded(self, records):
+        dropped = self.loading[1]
+        add = self.store.add
+        unique = self.record_format.unique
+        for record in records:
+            if add(record, unique) is None:
+                dropped.append(record)
+
+    def finish_load(self, report=None, columns=None):
+        """
+        Applies the journal entries read by start_load
+        """
+        entries, dropped = self.loading
+        self.loading = None
+        if columns is None:
+            columns = RecordColumns()
+
+        for op, line in entries:
+            change = self._apply_entry(op, line)
+            if change is not None:
+                if op == Journal.ADD:
+                    columns.append(change[2])
+                else:
+                    dropped.append(change[2])
+        self.loaded = columns, dropped
+
+        if self.journal.has_entries():
+            self.journal.compact()
+
+        return report if report is not None else ParseReport()
+
+    def sync(self):
+        """
+        Reads the journal entries other instances appended; if they rewrote the history file, reads it all again
+        Gives up (returning no changes) while another instance holds the lock, the next call catches up
+        """
+        if not self.journal.lock.acquire(blocking=False):
+            return []
+
+        try:
+            entries = self.journal.read_appended()
+            if entries is None:
+                # changes not written yet would be lost with the records in memory: write them first, to be read back
+                self.journal.flush()
+                self.store.clear()
+                self.load()
+                return None
+        finally:
+            self.journal.lock.release()
+
+        changes = (self._apply_entry(op, line) for op, line in entries)
+        changes = [change for change in changes if change is not None]
+        if changes:
+            self.loaded = None
+        return changes
+
+    def fill_stats(self, stats):
+        """
+        Reduces the columns gathered by the last load, unless records changed since; copies the records otherwise
+        """
+        loaded, self.loaded = self.loaded, None
+        if loaded is None:
+            super().fill_stats(stats)
+            return
+
+        columns, dropped = loaded
+        stats.rebuild(columns)
+        for record in dropped:
+            stats.remove(record)
+
+    def locked(self):
+        # a compaction takes the lock to swap its file in: wait for it here, as a rewrite holding the lock waits for it
+        self.journal.wait()
+        return self.journal.lock
+
+    def batched(self):
+        return self.journal.batch()
+
+    def __len__(self):
+        return len(self.store)
+
+    def add(self, record):
+        self.loaded = None
+        rid = self.store.add(record)
+        self.journal.add(self.record_format.format_line(record))
+        return rid
+
+    def delete(self, rid):
+        self.loaded = None
+        record = self.store.remove(rid)
+        self.journal.delete(self.record_format.format_line(record))
+        return record
+
+    def get(self, rid):
+        return self.store.records.get(rid)
+
+    def find(self, record):
+        return self.store.find(record)
+
+    def count(self, category):
+        return self.store.count(category)
+
+    def category_names(self):
+        return list(self.store.category_names())
+
+    def query(self, category, offset=0, limit=None):
+        records = self.store.category_records(category)
+        stop = None if limit is None else offset + limit
+        for i, item in enumerate(records):
+            if stop is not None and i >= stop:
+                break
+            if i >= offset:
+                yield item
+
+    def records(self):
+        return iter(self.store)
+
+    def flush(self):
+        self.journal.flush()
+
+    def export(self, filename):
+        # a full rewrite of the history file already contains the journaled changes
+        rewrites_file = os.path.abspath(filename) == os.path.abspath(self.filename)
+        if rewrites_file:
+            self.journal.wait()
+
+        with self.journal.lock:
+            super().export(filename)
+
+            # only once the new file replaced the old one: the journal is all a failed write would leave
+            if rewrites_file:
+                self.journal.reset()
+
+
+class SqliteStorage(Storage):
+    def __init__(self, db_file, record_format, categories=(), batch_size=500):
+        """
+        Keeps the records in a local SQLite database, indexed by date, category and label
+        Nothing is loaded up front: every lookup is a query, and changes are committed in batched transactions
+        over a connection shared with the other histories of the process
+        :param db_file: database file
+        :param batch_size: number of changes committed in one transaction
+        """
+        super().__init__(record_format, categories)
+        self.db_file = db_file
+        self.connection = _connect(db_file)
+        self.table = record_format.name
+        self.batch_size = batch_size
+        self.pending = 0
+
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS {self.table} '
+                                f'(id INTEGER PRIMARY KEY, day INTEGER, seconds INTEGER, label TEXT, category TEXT, '
+                                f'laps TEXT)')
+        # databases created before laps were recorded
+        columns = [row[1] for row in self.connection.execute(f'PRAGMA table_info({self.table})')]
+        if 'laps' not in columns:
+            self.connection.execute(f'ALTER TABLE {self.table} ADD COLUMN laps TEXT')
+        for column in ('day', 'category', 'label'):
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_{column} '
+                                    f'ON {self.table} ({column}, id)')
+        # covers the columns of the stats, so that they're aggregated without reading the table
+        self.connection.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_totals '
+                                f'ON {self.table} (day, category, label, seconds)')
+        if record_format.unique:
+            self.connection.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {self.table}_record '
+                                    f'ON {self.table} (day, seconds, label, category)')
+        self.connection.commit()
+
+    @staticmethod
+    def _rid(row_id):
+        return f'r{row_id}'
+
+    @staticmethod
+    def _row_id(rid):
+        try:
+            return int(rid[1:])
+        except ValueError:
+            return None
+
+    def _changed(self):
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def _data_version(self):
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def load(self):
+        self.data_version = self._data_version()
+        return ParseReport()
+
+    def fill_stats(self, stats):
+        """
+        Computes the running totals with one aggregate query, read in order from the totals index,
+        so that startup reads a row per day, category and label rather than every record
+        """
+        stats.fill(self.connection.execute(f'SELECT day, category, label, SUM(seconds), COUNT(*) FROM {self.table} '
+                                           f'GROUP BY day, category, label'))
+
+    def sync(self):
+        """
+        Queries always see the other instances' commits; they only have to be told apart from this instance's
+        to refresh what was computed from the records
+        data_version only moves on commits made through other connections: the histories of this process
+        share theirs, so the other history's batches aren't taken for changes made elsewhere
+        """
+        version = self._data_version()
+        if version == self.data_version:
+            return []
+        self.data_version = version
+        return None
+
+    def __len__(self):
+        return self.connection.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def add(self, record):
+        cursor = self.connection.execute(f'INSERT INTO {self.table} (day, seconds, label, category, laps) '
+                                         f'VALUES (?, ?, ?, ?, ?)', record.key() + (record.laps,))
+        self._changed()
+        return self._rid(cursor.lastrowid)
+
+    def delete(self, rid):
+        record = self.get(rid)
+        self.connection.execute(f'DELETE FROM {self.table} WHERE id = ?', (self._row_id(rid),))
+        self._changed()
+        return record
+
+    def get(self, rid):
+        row_id = self._row_id(rid)
+        if row_id is None:
+            return None
+
+        row = self.connection.execute(f'SELECT day, seconds, label, category, laps FROM {self.table} WHERE id = ?',
+                                      (row_id,)).fetchone()
+        return Record(*row) if row else None
+
+    def find(self, record):
+        row = self.connection.execute(f'SELECT id FROM {self.table} '
+                                      f'WHERE day = ? AND seconds = ? AND label = ? AND category IS ? LIMIT 1',
+                                      record.key()).fetchone()
+        return self._rid(row[0]) if row else None
+
+    def count(self, category):
+        return self.connection.execute(f'SELECT COUNT(*) FROM {self.table} WHERE category IS ?',
+                                       (category,)).fetchone()[0]
+
+    def category_names(self):
+        names = list(self.default_categories)
+        for (category,) in self.connection.execute(f'SELECT DISTINCT category FROM {self.table}'):
+            if category not in names:
+                names.append(category)
+        return names
+
+    def query(self, category, offset=0, limit=None):
+        cursor = self.connection.execute(f'SELECT id, day, seconds, label, category, laps FROM {self.table} '
+                                         f'WHERE category IS ? ORDER BY id LIMIT ? OFFSET ?',
+                                         (category, -1 if limit is None else limit, offset))
+        for row_id, *fields in cursor:
+            yield self._rid(row_id), Record(*fields)
+
+    def records(self):
+        cursor = self.connection.execute(f'SELECT id, day, seconds, label, category, laps FROM {self.table} '
+                                         f'ORDER BY id')
+        for row_id, *fields in cursor:
+            yield self._rid(row_id), Record(*fields)
+
+    def flush(self):
+        if self.pending:
+            self.connection.commit()
+            self.pending = 0
+
+    def close(self):
+        self.flush()
+        _disconnect(self.db_file)
+
+
+def write_atomically(filename, lines, compress=False, chunk_lines=10000):
+    """
+    Writes lines to a temporary file, then moves it over the target, so that readers never see half a file
+    If anything fails on the way the target is left as it was
+    :param filename: file to be written
+    :param lines: iterable of lines
+    :param compress: (optional) gzip the file
+    :param chunk_lines: (optional) lines joined per write, so that a whole history is never held as one string
+    """
+    # a name of its own, not to collide with a journal compaction folding the same file
+    fd, tmp_file = tempfile.mkstemp(prefix=os.path.basename(filename) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(os.path.abspath(filename)))
+    try:
+        with open(fd, 'wb') as raw:
+            out = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) if compress else raw
+            lines = iter(lines)
+            for chunk in iter(lambda: ''.join(itertools.islice(lines, chunk_lines)), ''):
+                out.write(chunk.encode('utf-8'))
+            if compress:
+                out.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+        # temporary files are private: give the result the permissions the target had
+        try:
+            mode = os.stat(filename).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_file, mode)
+        os.replace(tmp_file, filename)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+class Archive:
+    def __init__(self, key, filename, summary=None):
+        """
+        A closed segment of a segmented history: a gzipped text file, only read when its records are needed
+        :param key: segment key (yyyy-mm)
+        :param filename: compressed file
+        :param summary: (optional) manifest entry describing the file (counts and totals)
+        """
+        self.key = key
+        self.filename = filename
+        self.summary = summary
+        # records once read, and whether they changed since
+        self.store = None
+        self.dirty = False
+
+    def load(self, record_format):
+        """
+        Reads the archived records
+        :return: parse report
+        """
+        report = ParseReport()
+        self.store = RecordStore(prefix=self.key + ':')
+        try:
+            with open(self.filename, 'rb') as f:
+                data = gzip.decompress(f.read())
+        except FileNotFoundError:
+            return report
+
+        for record in LineScanner(data, record_format, report).records():
+            self.store.add(record, record_format.unique)
+        return report
+
+    def save(self, record_format):
+        """
+        Rewrites the archive from its records, updating its summary
+        """
+        format_line = record_format.format_line
+        write_atomically(self.filename, (format_line(record) for _, record in self.store), compress=True)
+        self.summary = self.summarize(self.store, os.path.getsize(self.filename))
+        self.dirty = False
+
+    @staticmethod
+    def summarize(store, file_size):
+        """
+        Describes a segment's records for the manifest
+        :param store: RecordStore holding the segment
+        :param file_size: size of the archive, which tells whether the manifest entry is still up to date
+        :return: manifest entry
+        """
+        stats = HistoryStats()
+        stats.rebuild(RecordColumns(record for _, record in store))
+        days = list(stats.day_seconds)
+        return {'file_size': file_size, 'records': len(store),
+                'first_day': min(days, default=None), 'last_day': max(days, default=None),
+                'categories': [[category, store.count(category)] for category in store.category_names()],
+                'stats': stats.to_json()}
+
+    def count(self, category):
+        if self.store is not None:
+            return self.store.count(category)
+        return dict(map(tuple, self.summary['categories'])).get(category, 0)
+
+
+class SegmentedStorage(Storage):
+    # months kept as plain text (with a journal) and read at startup, older ones are archived
+    recent_months = 2
+
+    def __init__(self, init_file, record_format, categories=()):
+        """
+        Keeps a history as one segment per month, in a directory named after the history file
+        Recent segments are text files with a journal, like TextStorage, and are read at startup.
+        Older segments are gzipped, and a manifest holds their dates, counts and totals,
+        so that they are only read when a page, lookup or full scan reaches them
+        Record ids start with their segment's key, which tells where to find them
+        :param init_file: history text file, split into segments the first time
+        """
+        super().__init__(record_format, categories)
+        self.init_file = init_file
+        self.directory = os.path.splitext(init_file)[0]
+        self.manifest_file = os.path.join(self.directory, 'manifest.json')
+        self.cutoff = self.month_key(date.today().toordinal(), self.recent_months - 1)
+        # held to read or write the manifest and archives, before any segment's own lock
+        self.lock = FileLock(os.path.join(self.directory, 'manifest.lock'))
+        # manifest as this instance last read or wrote it, and whether archives changed since the last sync
+        self.manifest_stamp = None
+        self.stale = False
+
+        # key -> TextStorage of recent segments, key -> Archive of older ones, and every key in order
+        self.recent = {}
+        self.archives = {}
+        self.keys = []
+        self.month_keys = {}
+
+    @staticmethod
+    def month_key(day, months_back=0):
+        """
+        Returns the key of the segment holding a day
+        :param day: date ordinal
+        :param months_back: (optional) key of that many months earlier
+        """
+        d = date.fromordinal(day)
+        year, month = divmod(d.year * 12 + d.month - 1 - months_back, 12)
+        return f'{year:04}-{month + 1:02}'
+
+    def _key(self, day):
+        key = self.month_keys.get(day)
+        if key is None:
+            key = self.month_keys[day] = self.month_key(day)
+        return key
+
+    def _segment_file(self, key):
+        return os.path.join(self.directory, key + '.txt')
+
+    def _open_recent(self, key, report=None):
+        segment = self.recent[key] = TextStorage(self._segment_file(key), self.record_format, id_prefix=key + ':')
+        segment_report = segment.load()
+        if report is not None:
+            report.merge(segment_report)
+        return segment
+
+    def _store(self, key):
+        """
+        Returns the records of a segment, reading an archive the first time
+        """
+        if key in self.recent:
+            return self.recent[key].store
+
+        archive = self.archives[key]
+        if archive.store is None:
+            archive.load(self.record_format)
+        return archive.store
+
+    def _add_key(self, key):
+        index = bisect.bisect_left(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            self.keys.insert(index, key)
+
+    def _split_history_file(self):
+        """
+        Splits the single history file (and its journal) into segments, leaving the file as it is
+        """
+        source = TextStorage(self.init_file, self.record_format)
+        report = source.load()
+        source.journal.wait()
+
+        months = {}
+        for _, record in source.records():
+            months.setdefault(self._key(record.day), []).append(record)
+
+        format_line = self.record_format.format_line
+        for key, records in months.items():
+            lines = (format_line(record) for record in records)
+            if key >= self.cutoff:
+                write_atomically(self._segment_file(key), lines)
+            else:
+                write_atomically(self._segment_file(key) + '.gz', lines, compress=True)
+        return report
+
+    def _read_manifest(self):
+        self.manifest_stamp = file_stamp(self.manifest_file)
+        try:
+            with open(self.manifest_file, 'r') as f:
+                return json.load(f)['segments']
+        except FileNotFoundError:
+            return {}
+
+    def _list_segments(self):
+        """
+        Lists the segment files in the directory
+        :return: (archive keys, recent keys) sets
+        """
+        archive_keys = set()
+        # a recent segment may only have a journal so far
+        recent_keys = set()
+        for name in os.listdir(self.directory):
+            if name.endswith('.txt.gz'):
+                archive_keys.add(name[:-len('.txt.gz')])
+            for suffix in ('.txt', '.txt.journal', '.txt.journal.old'):
+                if name.endswith(suffix):
+                    recent_keys.add(name[:-len(suffix)])
+        return archive_keys, recent_keys
+
+    def load(self):
+        """
+        Reads the manifest and the recent segments; archives older than the recent months on the way
+        """
+        created = not os.path.isdir(self.directory)
+        if created:
+            os.makedirs(self.directory)
+        with self.lock:
+            return self._load(created)
+
+    def _load(self, created):
+        report = ParseReport()
+        if created and os.path.exists(self.init_file):
+            report.merge(self._split_history_file())
+
+        manifest = self._read_manifest()
+        manifest_changed = False
+
+        archive_keys, recent_keys = self._list_segments()
+        for key in archive_keys:
+            self.archives[key] = Archive(key, self._segment_file(key) + '.gz', manifest.get(key))
+
+        for key in sorted(recent_keys):
+            segment = self._open_recent(key, report)
+            if key >= self.cutoff:
+                # a text file wins over an archive left by an interrupted archiving
+                stale = self.archives.pop(key, None)
+                if stale is not None:
+                    os.remove(stale.filename)
+                continue
+
+            # the month is over: compress it, then drop its text file and journal
+            segment.journal.wait()
+            archive = self.archives[key] = Archive(key, self._segment_file(key) + '.gz')
+            archive.store = segment.store
+            archive.save(self.record_format)
+            del self.recent[key]
+            segment.journal.reset()
+            if os.path.exists(segment.filename):
+                os.remove(segment.filename)
+            manifest_changed = True
+
+        for key, archive in self.archives.items():
+            # archives missing from the manifest, or changed since it was written, are summarized again
+            if archive.summary is None or archive.summary['file_size'] != os.path.getsize(archive.filename):
+                report.merge(archive.load(self.record_format))
+                archive.summary = Archive.summarize(archive.store, os.path.getsize(archive.filename))
+                manifest_changed = True
+
+        self.keys = sorted(set(self.recent) | set(self.archives))
+        if manifest_changed or set(manifest) != set(self.archives):
+            self._write_manifest()
+        return report
+
+    def _write_manifest(self):
+        segments = {key: self.archives[key].summary for key in sorted(self.archives)}
+        write_atomically(self.manifest_file, [json.dumps({'format': self.record_format.name, 'segments': segments})])
+        self.manifest_stamp = file_stamp(self.manifest_file)
+
+    def _follow_manifest(self):
+        """
+        Takes in the archives other instances wrote since this one last read the manifest (under the lock)
+        Changed archives are only read again when needed; archives of this instance with unsaved changes
+        are left alone, the last one saved wins
+        :return: True if any archive changed
+        """
+        if file_stamp(self.manifest_file) == self.manifest_stamp:
+            return False
+
+        changed = False
+        for key, summary in self._read_manifest().items():
+            archive = self.archives.get(key)
+            if archive is not None and (archive.dirty or archive.summary is not None
+                                        and archive.summary['file_size'] == summary['file_size']):
+                continue
+
+            if key in self.recent:
+                # a text file wins over an archive left by an interrupted archiving, as in load
+                if os.path.exists(self.recent[key].filename):
+                    continue
+                self._archive_recent(key, summary)
+            else:
+                self.archives[key] = Archive(key, self._segment_file(key) + '.gz', summary)
+                self._add_key(key)
+            changed = True
+        return changed
+
+    def _archive_recent(self, key, summary):
+        """
+        Drops a recent segment another instance archived, moving the entries this one didn't write yet to the archive
+        """
+        segment = self.recent.pop(key)
+        segment.journal.wait()
+        archive = self.archives[key] = Archive(key, self._segment_file(key) + '.gz', summary)
+        if not segment.journal.pending:
+            return
+
+        store = self._store(key)
+        for entry in segment.journal.pending:
+            record = self.record_format.parse(entry[1:].rstrip('\r\n'))
+            if record is None:
+                continue
+            if entry.startswith(Journal.ADD):
+                store.add(record, self.record_format.unique)
+            else:
+                rid = store.find(record)
+                if rid is not None:
+                    store.remove(rid)
+        segment.journal.pending.clear()
+        archive.dirty = True
+
+    def fill_stats(self, stats):
+        """
+        Computes totals from the segments in memory, and takes the totals of the others from the manifest
+        """
+        stats.clear()
+        for key in self.keys:
+            if key in self.recent:
+                part = HistoryStats()
+                self.recent[key].fill_stats(part)
+            elif self.archives[key].store is not None:
+                part = HistoryStats()
+                part.rebuild(RecordColumns(record for _, record in self.archives[key].store))
+            else:
+                part = HistoryStats.from_json(self.archives[key].summary['stats'])
+            stats.merge(part)
+
+    def sync(self):
+        """
+        Follows the recent segments, which are the ones written to, then looks for the segments other instances
+        created, and re-reads the manifest for the archives they wrote
+        Gives up (returning no changes) while another instance holds the manifest lock, the next call catches up
+        """
+        if not self.lock.acquire(blocking=False):
+            return []
+
+        try:
+            reloaded = self._follow_manifest() or self.stale
+            self.stale = False
+
+            changes = []
+            _, recent_keys = self._list_segments()
+            for key in sorted(recent_keys - set(self.recent) - set(self.archives)):
+                segment = self._open_recent(key)
+                self._add_key(key)
+                changes.extend((Journal.ADD, rid, record) for rid, record in segment.store)
+
+            for segment in self.recent.values():
+                segment_changes = segment.sync()
+                if segment_changes is None:
+                    reloaded = True
+                else:
+                    changes.extend(segment_changes)
+        finally:
+            self.lock.release()
+        return None if reloaded else changes
+
+    @contextlib.contextmanager
+    def locked(self):
+        # the manifest lock is always taken before the segments' ones
+        with self.lock, contextlib.ExitStack() as stack:
+            for segment in list(self.recent.values()):
+                stack.enter_context(segment.locked())
+            yield
+
+    @contextlib.contextmanager
+    def batched(self):
+        # segments opened meanwhile (a new month) keep writing in batch_size batches
+        with contextlib.ExitStack() as stack:
+            for segment in list(self.recent.values()):
+                stack.enter_context(segment.batched())
+            yield
+
+    def __len__(self):
+        return sum(len(self.recent[key]) if key in self.recent
+                   else len(self.archives[key].store) if self.archives[key].store is not None
+                   else self.archives[key].summary['records'] for key in self.keys)
+
+    def add(self, record):
+        key = self._key(record.day)
+        if key not in self.recent and key not in self.archives:
+            if key >= self.cutoff:
+                self._open_recent(key)
+            else:
+                self.archives[key] = Archive(key, self._segment_file(key) + '.gz')
+                self.archives[key].store = RecordStore(prefix=key + ':')
+            self._add_key(key)
+
+        if key in self.recent:
+            return self.recent[key].add(record)
+
+        rid = self._store(key).add(record)
+        self.archives[key].dirty = True
+        return rid
+
+    def delete(self, rid):
+        key = rid.partition(':')[0]
+        if key in self.recent:
+            return self.recent[key].delete(rid)
+
+        record = self._store(key).remove(rid)
+        self.archives[key].dirty = True
+        return record
+
+    def get(self, rid):
+        key = rid.partition(':')[0]
+        if key not in self.recent and key not in self.archives:
+            return None
+        return self._store(key).records.get(rid)
+
+    def find(self, record):
+        key = self._key(record.day)
+        if key not in self.recent and key not in self.archives:
+            return None
+        return self._store(key).find(record)
+
+    def count(self, category):
+        return sum(self.recent[key].count(category) if key in self.recent else self.archives[key].count(category)
+                   for key in self.keys)
+
+    def category_names(self):
+        names = dict.fromkeys(self.default_categories)
+        for key in self.keys:
+            archive = self.archives.get(key)
+            if archive is not None and archive.store is None:
+                names.update(dict.fromkeys(category for category, _ in archive.summary['categories']))
+            else:
+                names.update(dict.fromkeys(self._store(key).category_names()))
+        return list(names)
+
+    def query(self, category, offset=0, limit=None):
+        """
+        Walks the segments in order, skipping whole archives by their counts, so only the ones the page needs are read
+        """
+        for key in self.keys:
+            if limit is not None and limit <= 0:
+                return
+
+            count = self.recent[key].count(category) if key in self.recent else self.archives[key].count(category)
+            if offset >= count:
+                offset -= count
+                continue
+
+            records = self._store(key).category_records(category)
+            for item in itertools.islice(records, offset, None if limit is None else offset + limit):
+                yield item
+                if limit is not None:
+                    limit -= 1
+            offset = 0
+
+    def records(self):
+        for key in self.keys:
+            yield from self._store(key)
+
+    def flush(self):
+        """
+        Flushes the journals of recent segments, and rewrites the archives that changed (then the manifest)
+        """
+        for segment in self.recent.values():
+            segment.flush()
+
+        if not any(archive.dirty for archive in self.archives.values()):
+            return
+
+        with self.lock:
+            # the manifest is rewritten whole: take in the archives of other instances first
+            self.stale = self._follow_manifest() or self.stale
+            for archive in self.archives.values():
+                if archive.dirty:
+                    archive.save(self.record_format)
+            self._write_manifest()
+
+
+def open_storage(init_file, record_format, categories=()):
+    """
+    Opens the storage backend picked by the STOPWATCH_STORAGE environment variable ('text', 'segments' or 'sqlite')
+    :param init_file: history text file (used by the text backend)
+    :param record_format: format of the history's records
+    :param categories: categories that exist even before they hold any record
+    :return: storage
+    """
+    backend = os.environ.get('STOPWATCH_STORAGE', 'text')
+    if backend == 'sqlite':
+        return SqliteStorage(SQLITE_FILE, record_format, categories)
+    if backend == 'segments':
+        return SegmentedStorage(init_file, record_format, categories)
+
+    return TextStorage(init_file, record_format, categories)
+
+
+def migrate(text_file, db_file, record_format, batch_size=10000):
+    """
+    Imports a text history (with its journal) into a SQLite database, skipping duplicates for formats that reject them
+    :param text_file: history text file
+    :param db_file: database file
+    :param record_format: format of the history's records
+    :param batch_size: number of records inserted per statement batch
+    :return: number of records imported
+    """
+    source = TextStorage(text_file, record_format)
+    source.load()
+    source.journal.wait()
+
+    target = SqliteStorage(db_file, record_format)
+    before = len(target)
+    insert = 'INSERT OR IGNORE' if record_format.unique else 'INSERT'
+    statement = f'{insert} INTO {target.table} (day, seconds, label, category, laps) VALUES (?, ?, ?, ?, ?)'
+
+    batch = []
+    for _, record in source.records():
+        batch.append(record.key() + (record.laps,))
+        if len(batch) >= batch_size:
+            target.connection.executemany(statement, batch)
+            batch.clear()
+    target.connection.executemany(statement, batch)
+    target.connection.commit()
+
+    imported = len(target) - before
+    target.close()
+    return imported
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='History storage tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = commands.add_parser('migrate', help='import the text history files into the SQLite database')
+    migrate_parser.add_argument('--db', default=SQLITE_FILE)
+    migrate_parser.add_argument('--stopwatch', default='stopwatch_history.txt')
+    migrate_parser.add_argument('--pomodoro', default='pomodoro_history.txt')
+    args = parser.parse_args()
+
+    for history_file, history_format in ((args.stopwatch, STOPWATCH_FORMAT), (args.pomodoro, POMODORO_FORMAT)):
+        print(f'{history_file}: {migrate(history_file, args.db, history_format)} records imported')
@@ -0,0 +1,65 @@
+import random
+import unittest
+from benchmarks import HeadlessTimer, VirtualLoop
+from scheduler import TickScheduler
+from timer_core import PomodoroCore, StopWatchCore
+
+
+class TimerDriftTest(unittest.TestCase):
+    hours = 3
+    # how late, at most, each callback of the simulated loop runs (in seconds)
+    max_lateness = 0.25
+
+    def run_timers(self, visible=True):
+        """
+        Runs a stopwatch and a pomodoro for hours of simulated time through the scheduler,
+        with every callback running late
+        :param visible: whether the timers are shown (hidden timers only wake for deadlines)
+        :return: name -> core, ticked once more at the end as a redraw would
+        """
+        rng = random.Random(0)
+        loop = VirtualLoop(lambda: rng.uniform(0, self.max_lateness))
+        scheduler = TickScheduler(loop)
+        # the countdown is long enough not to run out
+        cores = {'stopwatch': StopWatchCore(loop.clock),
+                 'pomodoro': PomodoroCore(focus_seconds=2 * self.hours * 3600, clock=loop.clock)}
+        for core in cores.values():
+            core.start()
+            scheduler.register(HeadlessTimer(core, visible))
+
+        loop.run(self.hours * 3600)
+        for core in cores.values():
+            core.tick()
+        return cores
+
+    def assert_no_drift(self, cores):
+        for name, core in cores.items():
+            with self.subTest(timer=name):
+                self.assertEqual(core.elapsed(), self.hours * 3600)
+                self.assertEqual((core.seconds - core.init_seconds) * core.step, self.hours * 3600)
+
+    def test_late_callbacks_dont_drift(self):
+        self.assert_no_drift(self.run_timers())
+
+    def test_hidden_timers_dont_drift(self):
+        self.assert_no_drift(self.run_timers(visible=False))
+
+    def test_pause_keeps_elapsed_time(self):
+        loop = VirtualLoop(lambda: 0.1)
+        scheduler = TickScheduler(loop)
+        core = StopWatchCore(loop.clock)
+        scheduler.register(HeadlessTimer(core))
+
+        core.start()
+        loop.run(100)
+        core.pause()
+        loop.run(50)
+        core.start()
+        loop.run(100)
+        core.tick()
+        self.assertEqual(core.elapsed(), 200)
+        self.assertEqual(core.seconds, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
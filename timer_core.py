@@ -0,0 +1,310 @@
+import time
+from array import array
+from datetime import date
+from records import Record, decode_laps, encode_laps
+
+
+class LapBuffer:
+    def __init__(self):
+        """
+        Laps of a stopwatch run, as the split time (elapsed seconds) at which each one ended, in an array of doubles
+        A lap is an O(1) append of 8 bytes, and the shortest/longest/mean lap are kept up to date on the way
+        """
+        self.splits = array('d')
+        self.shortest = None
+        self.longest = None
+
+    def __len__(self):
+        return len(self.splits)
+
+    def add(self, split):
+        """
+        Ends a lap
+        :param split: elapsed time at the end of the lap
+        """
+        lap = split - (self.splits[-1] if self.splits else 0.0)
+        self.splits.append(split)
+        if self.shortest is None or lap < self.shortest:
+            self.shortest = lap
+        if self.longest is None or lap > self.longest:
+            self.longest = lap
+
+    def lap(self, index):
+        """
+        Returns the duration of a lap
+        :param index: lap index, from 0
+        """
+        return self.splits[index] - (self.splits[index - 1] if index else 0.0)
+
+    def mean(self):
+        return self.splits[-1] / len(self.splits) if self.splits else None
+
+    def clear(self):
+        del self.splits[:]
+        self.shortest = None
+        self.longest = None
+
+
+class TimerCore:
+    # direction in which the second counter moves while running (1 = up, -1 = down)
+    step = 1
+
+    def __init__(self, init_seconds, clock=time.monotonic):
+        """
+        Timer state machine, without any widget: the Tk views (and benchmarks) drive it and read its counter
+        :param init_seconds: value of the second counter after a reset
+        :param clock: monotonic clock returning seconds
+        """
+        # elapsed time is read from a monotonic clock instead of counting callbacks:
+        # 'anchor' is the clock value when the current run started (None while paused)
+        # and 'accumulated' holds the time of earlier runs since the last reset
+        self.clock = clock
+        self.anchor = None
+        self.accumulated = 0.0
+        self.init_seconds = init_seconds
+
+        self.running = False
+        self.seconds = init_seconds
+
+        # label of the last formatted second, as it only changes once per second
+        self.label_seconds = None
+        self.label = None
+
+    def get_label(self):
+        """
+        Returns a string representation of the current number of seconds (formatted once per second)
+        :return: timer label, as hh:mm:ss
+        """
+        if self.seconds == self.label_seconds:
+            return self.label
+
+        s = self.seconds
+        # get number of hours (1h = 3600 seconds), subtract from counter
+        h = s // 3600
+        s -= (h * 3600)
+        # get number of minutes (1m = 60 seconds), subtract from counter
+        m = s // 60
+        s -= (m * 60)
+
+        # format as hh:mm:ss
+        self.label_seconds = self.seconds
+        self.label = f'{round(h):02}:{round(m):02}:{round(s):02}'
+        return self.label
+
+    def elapsed(self):
+        """
+        Returns the running time since the last reset, read from the clock
+        :return: elapsed seconds (float)
+        """
+        if self.anchor is None:
+            return self.accumulated
+
+        return self.accumulated + (self.clock() - self.anchor)
+
+    def sync_seconds(self):
+        """
+        Recomputes the second counter from the clock, so late callbacks never lose or add time
+        """
+        self.seconds = self.init_seconds + self.step * int(self.elapsed())
+
+    def stop_clock(self):
+        """
+        Folds the current run into the accumulated time and drops the anchor
+        """
+        if self.anchor is not None:
+            self.accumulated = self.elapsed()
+            self.anchor = None
+            self.sync_seconds()
+
+    def tick_delay(self):
+        """
+        Returns the time left until the next whole-second boundary of the elapsed time
+        :return: delay in seconds
+        """
+        return 1 - self.elapsed() % 1
+
+    def idle_delay(self):
+        """
+        Returns how long the timer can go without ticking while nothing shows it
+        :return: delay in seconds, or None if it never needs to (its time is read from the clock when shown)
+        """
+        return None
+
+    def snapshot(self, wall_clock=time.time):
+        """
+        Returns the timer's state, for a checkpoint
+        A running timer is saved with the wall-clock time at which its count started, so that the checkpoint
+        stays valid while it runs: it only has to be written again when the timer changes state
+        :param wall_clock: (optional) clock surviving restarts, in seconds
+        :return: JSON-compatible dict
+        """
+        state = {'init_seconds': self.init_seconds, 'accumulated': self.accumulated, 'running': self.running}
+        if self.running:
+            state['wall_anchor'] = wall_clock() - (self.clock() - self.anchor)
+        return state
+
+    def restore(self, state, wall_clock=time.time):
+        """
+        Restores a state returned by snapshot; a running timer also counts the time that passed since
+        (ex. while the app was down), read from the wall clock as the monotonic one doesn't survive restarts
+        :param state: saved state
+        :param wall_clock: (optional) clock surviving restarts, in seconds
+        """
+        self.init_seconds = state['init_seconds']
+        self.accumulated = state['accumulated']
+        self.running = state['running']
+        self.anchor = None
+        if self.running:
+            self.anchor = self.clock() - max(0.0, wall_clock() - state['wall_anchor'])
+        self.sync_seconds()
+
+    def start(self):
+        """
+        Starts the timer
+        :return: True if it was started, False if it was already running
+        """
+        if self.running:
+            return False
+
+        self.running = True
+        self.anchor = self.clock()
+        return True
+
+    def pause(self):
+        """
+        Pauses the timer
+        :return: True if it was paused, False if it wasn't running
+        """
+        if not self.running:
+            return False
+
+        self.running = False
+        self.stop_clock()
+        return True
+
+    def reset(self, init_value=0):
+        """
+        Stops the timer and sets its second counter
+        :param init_value: (optional) the number of seconds to reset to
+        """
+        self.init_seconds = init_value
+        self.seconds = init_value
+        self.accumulated = 0.0
+        self.anchor = None
+        self.running = False
+
+    def tick(self):
+        """
+        Recomputes the second counter from the clock
+        :return: True if the timer ran out (only countdowns do)
+        """
+        if self.running:
+            self.sync_seconds()
+        return False
+
+
+class StopWatchCore(TimerCore):
+    def __init__(self, clock=time.monotonic):
+        super().__init__(0, clock)
+        self.laps = LapBuffer()
+
+    def lap(self):
+        """
+        Ends the current lap, timed from the same clock as the counter
+        :return: True if a lap was taken, False if the stopwatch isn't running
+        """
+        if not self.running:
+            return False
+
+        self.laps.add(self.elapsed())
+        return True
+
+    def reset(self, init_value=0):
+        super().reset(init_value)
+        self.laps.clear()
+
+    def snapshot(self, wall_clock=time.time):
+        state = super().snapshot(wall_clock)
+        state['laps'] = encode_laps(self.laps.splits)
+        return state
+
+    def restore(self, state, wall_clock=time.time):
+        super().restore(state, wall_clock)
+        self.laps.clear()
+        for split in decode_laps(state.get('laps')):
+            self.laps.add(split)
+
+    def take_record(self, label, category, day=None):
+        """
+        Turns the counted time (and laps) into a record, then resets the stopwatch
+        :param label: record label
+        :param category: record category
+        :param day: (optional) date ordinal of the record, today by default
+        :return: the new record
+        """
+        self.pause()
+        record = Record(day or date.today().toordinal(), self.seconds, label, category, encode_laps(self.laps.splits))
+        self.reset()
+        return record
+
+
+class PomodoroCore(TimerCore):
+    step = -1
+
+    def __init__(self, focus_seconds=60 * 25, break_seconds=60 * 5, clock=time.monotonic):
+        """
+        Countdown alternating between focus and break periods
+        :param focus_seconds: length of a focus period
+        :param break_seconds: length of a break period
+        """
+        self.focus_seconds = focus_seconds
+        self.break_seconds = break_seconds
+        super().__init__(focus_seconds, clock)
+        self.is_focused = True
+        self.focus_count = 0
+        self.break_count = 0
+
+    def reset(self, init_value=0):
+        # a pomodoro always restarts the current period
+        super().reset(self.focus_seconds if self.is_focused else self.break_seconds)
+
+    def snapshot(self, wall_clock=time.time):
+        state = super().snapshot(wall_clock)
+        state.update(is_focused=self.is_focused, focus_count=self.focus_count, break_count=self.break_count)
+        return state
+
+    def restore(self, state, wall_clock=time.time):
+        # a period that ran out meanwhile ends on the next tick
+        super().restore(state, wall_clock)
+        self.seconds = max(self.seconds, 0)
+        self.is_focused = state['is_focused']
+        self.focus_count = state['focus_count']
+        self.break_count = state['break_count']
+
+    def idle_delay(self):
+        # a hidden countdown still has to end its period on time
+        if not self.running:
+            return None
+        return max(0.0, self.init_seconds - self.elapsed())
+
+    def tick(self):
+        if self.running:
+            self.sync_seconds()
+            self.seconds = max(self.seconds, 0)
+        return self.running and self.seconds <= 0
+
+    def finish_period(self, day=None):
+        """
+        Switches from focus to break or vice-versa, once the countdown ran out (the next period isn't started)
+        :param day: (optional) date ordinal of the record, today by default
+        :return: record of the finished period
+        """
+        record_label = "Focus" if self.is_focused else "Break"
+        if self.is_focused:
+            self.focus_count += 1
+        else:
+            self.break_count += 1
+
+        self.is_focused = not self.is_focused
+        self.reset()
+        return Record(day or date.today().toordinal(), 0, record_label)